@@ -0,0 +1,122 @@
+"""
+Local ACRCloud stub server (tests, load runs).
+Answers POST /v1/identify with a canned result after an optional delay and
+records the size of every uploaded sample.
+
+    python acr_stub.py --port 8765 --delay 0.2
+then run the backend with ACR_HOST=127.0.0.1:8765 ACR_PROTOCOL=http.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+DEFAULT_MATCH = {
+    "status": {"code": 0, "msg": "Success"},
+    "metadata": {
+        "music": [
+            {
+                "title": "Stub Song",
+                "artists": [{"name": "Stub Artist"}],
+                "album": {"name": "Stub Album"},
+                "acrid": "stub-acrid-0001",
+                "score": 100,
+            }
+        ]
+    },
+}
+
+
+def _multipart_field(content_type: str, body: bytes, name: str) -> bytes:
+    message = BytesParser(policy=HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+    )
+    for part in message.iter_parts():
+        if part.get_param("name", header="content-disposition") == name:
+            return part.get_payload(decode=True) or b""
+    return b""
+
+
+class AcrStubServer:
+    """Threaded HTTP server on 127.0.0.1; use as a context manager."""
+
+    def __init__(self, port: int = 0, delay_sec: float = 0.0, response: Optional[dict] = None):
+        self.delay_sec = delay_sec
+        self.response = response or DEFAULT_MATCH
+        self.sample_sizes: List[int] = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != "/v1/identify":
+                    self.send_error(404)
+                    return
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                sample = _multipart_field(self.headers["Content-Type"], body, "sample")
+                with stub._lock:
+                    stub.sample_sizes.append(len(sample))
+                if stub.delay_sec:
+                    time.sleep(stub.delay_sec)
+                body = json.dumps(stub.response).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # client gave up (identify deadline)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        """Value for ACR_HOST."""
+        host, port = self._server.server_address[:2]
+        return f"{host}:{port}"
+
+    @property
+    def requests(self) -> int:
+        with self._lock:
+            return len(self.sample_sizes)
+
+    def start(self) -> "AcrStubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "AcrStubServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local ACRCloud stub")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds before answering")
+    args = parser.parse_args()
+    server = AcrStubServer(port=args.port, delay_sec=args.delay)
+    print(f"ACR stub listening on {server.host}")
+    server._server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,34 +3,83 @@ ShazaPiano Backend - FastAPI Application
 Main entry point with routes
 """
 import asyncio
+import os
 import shutil
+import socket
 import time
 import uuid
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import List, Optional, Dict
+from typing import AsyncIterator, Callable, List, Optional, Dict, Set
 from datetime import datetime, timedelta
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Header, Depends
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Header, Depends, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from loguru import logger
 
 from config import settings, init_directories, get_level_config, ERROR_MESSAGES
-from inference import process_audio_to_midi
-from arranger import arrange_level, export_expected_notes_json
-from render import render_level_video
-from identify import identify_audio
-from separation import separate_melody
+from job_store import JobStore
+from retention import ArtifactIndex, RetentionService, KIND_INPUT, KIND_OUTPUT
+from media_layout import (
+    job_dirs,
+    job_input_dir,
+    job_id_from_filename,
+    job_output_dir,
+    media_url,
+    resolve_output_file,
+)
+from lazy_render import LazyMediaFiles, LazyVideoRenderer, read_render_spec, write_render_spec
+from lazy_imports import LazyModule, LazyModules
+from warmup import WarmupReport, baked_cache_dir, run_warmup
+from render_profile import report_paths
+from identify import acr_identifier, identify_audio
+from ingest import MultipartStream, StoredUpload, StreamingIngest
+from audio_probe import PROBE_BYTES, ProbeResult, probe_duration, probe_header
+from persistence import PersistenceQueue, build_sink
+from song_library import SongLibrary, link_or_copy
+from loop_monitor import LoopBlockMiddleware, LoopMonitor
+from metrics import (
+    CONTENT_TYPE,
+    JOBS_ACTIVE,
+    JOBS_QUEUED,
+    PERSISTENCE_PENDING,
+    REGISTRY,
+    STAGE_SECONDS,
+    STARTUP_SECONDS,
+    WORKER_UTILIZATION,
+    record_cache,
+)
 from firebase_client import (
     init_firebase,
     verify_firebase_token,
-    save_job_for_user,
-    save_practice_session,
     firebase_app,
+    refresh_signing_keys_forever,
+    token_claims_cache,
 )
-import pretty_midi
+
+# Audio/ML pipeline (scipy, librosa, numba, PIL): imported off the event loop
+# after startup so /health answers right away; jobs await pipeline_modules.
+inference = LazyModule("inference")
+separation = LazyModule("separation")
+arranger = LazyModule("arranger")
+render = LazyModule("render")
+pretty_midi = LazyModule("pretty_midi")
+pipeline_modules = LazyModules(inference, separation, arranger, render, pretty_midi)
+# Set once the startup warmup ran (first-job JIT/lazy-import cost paid up front)
+warmup_report: Optional[WarmupReport] = None
+
+
+def _startup_warmup_wanted() -> bool:
+    """WARMUP_ON_STARTUP, unless the image ships numba's cache warmed at build time."""
+    return settings.WARMUP_ON_STARTUP and baked_cache_dir() is None
+
+
+def pipeline_ready() -> bool:
+    """Pipeline modules imported and, when a startup warmup is wanted, warmed up."""
+    return pipeline_modules.ready and (warmup_report is not None or not _startup_warmup_wanted())
+
 
 # ============================================
 # App Setup
@@ -51,9 +100,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Event-loop lag sampling; requests whose handler stalls the loop are tagged
+loop_monitor = LoopMonitor(settings.LOOP_MONITOR_INTERVAL_SEC, settings.LOOP_BLOCK_THRESHOLD_SEC)
+app.add_middleware(LoopBlockMiddleware, monitor=loop_monitor)
+
 # Static files
 init_directories()
-app.mount("/media", StaticFiles(directory=str(settings.MEDIA_DIR)), name="media")
+
+
+# Level videos missing on disk are rendered from their MIDI on first request
+lazy_videos = LazyVideoRenderer(
+    lambda job_id, level: _render_level_on_demand(job_id, level),
+    workers=settings.LAZY_RENDER_WORKERS,
+    max_pending=settings.LAZY_RENDER_MAX_PENDING,
+    cache_budget_mb=settings.LAZY_RENDER_CACHE_MB,
+    delete_files=lambda paths: artifact_index.delete_files(paths),
+    failure_ttl_sec=settings.LAZY_RENDER_FAILURE_TTL_SEC,
+)
+
+
+@app.get("/media/out/{filename}", include_in_schema=False)
+async def legacy_media_out(filename: str):
+    """Serve pre-sharding flat URLs (/media/out/{job_id}_...) from the per-job directory."""
+    job_id = job_id_from_filename(filename)
+    if job_id is not None:
+        await lazy_videos.materialize(job_output_dir(job_id, create=False) / filename)
+    path = resolve_output_file(filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return FileResponse(path)
+
+
+# Registered after the legacy route so flat URLs are resolved first
+app.mount(
+    "/media",
+    LazyMediaFiles(directory=str(settings.MEDIA_DIR), renderer=lazy_videos),
+    name="media",
+)
 
 
 # ============================================
@@ -72,6 +155,9 @@ class LevelResult(BaseModel):
     duration_sec: Optional[float] = None
     status: str = "success"
     error: Optional[str] = None
+    encoder_profiles: Optional[Dict[str, str]] = None  # output (video/preview) -> profile
+    stream_url: Optional[str] = None  # HLS playlist, set once the first segment exists
+    video_available: bool = True  # False for notes-only jobs: clients render from expected notes
 
 
 class ProcessResponse(BaseModel):
@@ -125,17 +211,62 @@ class PracticeSession(BaseModel):
 
 
 # ============================================
-# Job Store (in-memory)
+# Job Store (SQLite, shared by workers)
 # ============================================
 
-jobs_store: Dict[str, dict] = {}
-jobs_lock = asyncio.Lock()
+job_store = JobStore(settings.JOBS_DB_PATH, cache_ttl_sec=settings.JOB_STORE_CACHE_TTL_SEC)
+
+# Identifies this process as the owner of the jobs it runs (see job_store leases)
+RUNNER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+background_tasks: List[asyncio.Task] = []
+# Running job tasks; the event loop only keeps weak references to tasks
+job_tasks: Set[asyncio.Task] = set()
+
+# Media artifacts (path/size/job/created) for O(1) per-job lookup and retention
+artifact_index = ArtifactIndex(settings.JOBS_DB_PATH, job_dirs=job_dirs)
+retention_service = RetentionService(
+    artifact_index,
+    input_retention_hours=settings.INPUT_RETENTION_HOURS,
+    output_retention_days=settings.OUTPUT_RETENTION_DAYS,
+    disk_budget_mb=settings.MEDIA_DISK_BUDGET_MB,
+    protected_jobs=lambda: _protected_jobs(),
+    untracked_bytes=lambda: _untracked_media_bytes(),
+)
+
+# Base MIDI / arrangements / videos of known songs, keyed by ACRCloud acrid
+song_library = SongLibrary(
+    settings.SONG_LIBRARY_DIR, settings.ACR_LIBRARY_MIN_SCORE, settings.SONG_LIBRARY_MAX_MB
+)
+
+# Firestore documents are written behind the request (batched, retried, flushed on shutdown)
+persistence_queue = PersistenceQueue(
+    build_sink(settings.PERSISTENCE_SINK, settings.PERSISTENCE_SQLITE_PATH),
+    batch_size=settings.PERSISTENCE_BATCH_SIZE,
+    flush_interval_sec=settings.PERSISTENCE_FLUSH_INTERVAL_SEC,
+    max_retries=settings.PERSISTENCE_MAX_RETRIES,
+    backoff_base_sec=settings.PERSISTENCE_BACKOFF_SEC,
+)
+
+# Processing slots: at most MAX_CONCURRENT_JOBS jobs run their stages at once
+job_slots = asyncio.Semaphore(settings.MAX_CONCURRENT_JOBS)
+
+WORKER_UTILIZATION.set_function(lambda: JOBS_ACTIVE.value() / settings.MAX_CONCURRENT_JOBS)
+PERSISTENCE_PENDING.set_function(lambda: len(persistence_queue))
 
 
 # ============================================
 # Auth Helpers
 # ============================================
 
+def render_profile_requested(x_render_profile: Optional[str] = Header(None)) -> bool:
+    """RENDER_PROFILE, or the X-Render-Profile debug header (DEBUG only)."""
+    if settings.RENDER_PROFILE:
+        return True
+    if not x_render_profile or not settings.DEBUG:
+        return False
+    return x_render_profile.strip().lower() in ("1", "true", "on", "yes")
+
+
 def get_current_user(authorization: str = Header(None)):
     """Validate Firebase ID token from Authorization header and return claims."""
     # In dev without Firebase configured, allow a debug user to pass through.
@@ -165,6 +296,38 @@ def _now_iso() -> str:
     return datetime.utcnow().isoformat()
 
 
+def _protected_jobs() -> Set[str]:
+    """
+    Jobs retention must not touch: running ones, and uploaded ones waiting for
+    /start (their input is needed), until INPUT_RETENTION_HOURS expires them.
+    """
+    cutoff = (
+        datetime.utcnow() - timedelta(hours=settings.INPUT_RETENTION_HOURS)
+    ).isoformat()
+    protected = {job["job_id"] for job in job_store.list_by_status("running")}
+    protected.update(
+        job["job_id"]
+        for job in job_store.list_by_status("awaiting_ad")
+        if (job.get("created_at") or "") >= cutoff
+    )
+    return protected
+
+
+def _untracked_media_bytes() -> int:
+    """
+    SQLite databases (with WAL files) and the song library: on the media volume,
+    outside the artifact index.
+    """
+    total = song_library.size_bytes()
+    for db_path in {settings.JOBS_DB_PATH, settings.PERSISTENCE_SQLITE_PATH}:
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                total += db_path.with_name(db_path.name + suffix).stat().st_size
+            except OSError:
+                pass
+    return total
+
+
 def _new_job_id() -> str:
     return f"{int(time.time())}_{uuid.uuid4().hex}"
 
@@ -193,9 +356,17 @@ def _build_level_payload(level: int, status: str = "queued") -> dict:
         "duration_sec": None,
         "status": status,
         "error": None,
+        "encoder_profiles": None,
+        "stream_url": None,
+        "video_available": True,
     }
 
 
+def _stream_url(video_path: Path) -> Optional[str]:
+    playlist = render.hls_playlist_path(video_path)
+    return media_url(playlist) if playlist.exists() else None
+
+
 def _build_job_response(job: dict) -> JobProgressResponse:
     identified = job.get("identified") or {}
     levels = [LevelResult(**level) for level in job.get("levels", [])]
@@ -212,49 +383,66 @@ def _build_job_response(job: dict) -> JobProgressResponse:
     )
 
 
-def _parse_iso(ts: Optional[str]) -> Optional[datetime]:
-    if not ts:
-        return None
-    try:
-        return datetime.fromisoformat(ts)
-    except ValueError:
-        return None
-
-
-async def _cleanup_jobs(max_age_minutes: int = 30) -> None:
-    cutoff = datetime.utcnow() - timedelta(minutes=max_age_minutes)
-    async with jobs_lock:
-        to_remove = []
-        for job_id, job in jobs_store.items():
-            status = job.get("status")
-            if status not in {"complete", "error"}:
-                continue
-            updated = _parse_iso(job.get("updated_at")) or _parse_iso(
-                job.get("created_at")
-            )
-            if updated and updated < cutoff:
-                to_remove.append(job_id)
-        for job_id in to_remove:
-            jobs_store.pop(job_id, None)
+async def _cleanup_jobs(max_age_minutes: int = settings.JOB_RETENTION_MINUTES) -> None:
+    job_store.purge_finished(max_age_minutes * 60)
 
 
-async def _update_job_level(job_id: str, level: int, updates: dict) -> None:
-    async with jobs_lock:
-        job = jobs_store.get(job_id)
-        if not job:
-            return
+def _level_updater(level: int, updates: dict) -> Callable[[dict], None]:
+    def mutate(job: dict) -> None:
         for entry in job.get("levels", []):
             if entry.get("level") == level:
                 entry.update(updates)
                 job["updated_at"] = _now_iso()
                 return
 
+    return mutate
+
+
+async def _update_job_level(job_id: str, level: int, updates: dict) -> None:
+    job_store.update(job_id, _level_updater(level, updates))
+
+
+def _level_rendered_updater(level: int, checkpoint: dict, result: dict) -> Callable[[dict], None]:
+    """Save a level's L{n}_rendered checkpoint and its success result in one write."""
+    update_level = _level_updater(level, result)
+
+    def mutate(job: dict) -> None:
+        job.setdefault("checkpoints", {})[f"L{level}_rendered"] = checkpoint
+        update_level(job)
+
+    return mutate
+
+
+def _rendered_level(rendered: dict, midi_path: Path) -> dict:
+    """A checkpointed level's result; checkpoints without one get it rebuilt from their paths."""
+    if rendered.get("level"):
+        return rendered["level"]
+    full_video, preview_video = rendered.get("full_video"), rendered.get("preview_video")
+    return {
+        "status": "success",
+        "preview_url": media_url(Path(preview_video)) if preview_video else "",
+        "video_url": media_url(Path(full_video)) if full_video else "",
+        "midi_url": media_url(midi_path),
+        "error": None,
+        "video_available": full_video is not None,
+    }
+
+
+def _level_restorer(level: int, result: dict) -> Callable[[dict], None]:
+    """Re-apply a checkpointed level result unless the level already shows it."""
+    update_level = _level_updater(level, result)
+
+    def mutate(job: dict) -> None:
+        for entry in job.get("levels", []):
+            if entry.get("level") == level and entry.get("status") != "success":
+                update_level(job)
+                return
+
+    return mutate
+
 
 async def _mark_job_error(job_id: str, levels: List[int], message: str) -> None:
-    async with jobs_lock:
-        job = jobs_store.get(job_id)
-        if not job:
-            return
+    def mutate(job: dict) -> None:
         job["status"] = "error"
         job["updated_at"] = _now_iso()
         for entry in job.get("levels", []):
@@ -269,108 +457,393 @@ async def _mark_job_error(job_id: str, levels: List[int], message: str) -> None:
                     }
                 )
 
+    job_store.update(job_id, mutate)
+
+
+def _register_artifacts(job_id: str, kind: str, *paths: Optional[Path]) -> None:
+    try:
+        artifact_index.record(job_id, kind, paths)
+    except Exception as e:
+        logger.warning(f"Failed to index artifacts for job {job_id}: {e}")
+
+
+def _render_level_on_demand(job_id: str, level: int) -> List[Path]:
+    """Render a level's videos from its saved MIDI (lazy_videos pool thread)."""
+    output_dir = job_output_dir(job_id, create=False)
+    midi_path = output_dir / f"{job_id}_L{level}.mid"
+    midi = pretty_midi.PrettyMIDI(str(midi_path))
+    with_audio = bool(read_render_spec(midi_path).get("with_audio"))
+    encoder_profiles = {
+        "video": render.select_encoder_profile(int(JOBS_QUEUED.value())),
+        "preview": settings.PREVIEW_ENCODER_PROFILE,
+    }
+    full_video, preview_video, audio_file = render.render_level_video(
+        midi=midi,
+        level=level,
+        level_name=get_level_config(level)["name"],
+        output_dir=output_dir,
+        job_id=job_id,
+        with_audio=with_audio,
+        encoder_profile=encoder_profiles["video"],
+    )
+    # Recorded like eagerly rendered levels: on the job, and in the spec,
+    # which outlives the job record
+    write_render_spec(midi_path, with_audio, encoder_profiles)
+    job_store.update(job_id, _level_updater(level, {"encoder_profiles": encoder_profiles}))
+    files = [full_video, preview_video, audio_file, *render.hls_files(full_video)]
+    _register_artifacts(job_id, KIND_OUTPUT, *files)
+    return [path for path in files if path is not None]
+
+
+def _checkpoint(job: dict, stage: str) -> Optional[dict]:
+    """Return a stage checkpoint if it was recorded and its artifact is still on disk."""
+    checkpoint = (job.get("checkpoints") or {}).get(stage)
+    if not checkpoint:
+        return None
+    path = checkpoint.get("path")
+    if path and not Path(path).exists():
+        return None
+    return checkpoint
+
+
+async def _save_checkpoint(job_id: str, stage: str, data: dict) -> None:
+    def mutate(job: dict) -> None:
+        job.setdefault("checkpoints", {})[stage] = data
+        job["updated_at"] = _now_iso()
+
+    job_store.update(job_id, mutate)
+
+
+@asynccontextmanager
+async def _job_slot() -> AsyncIterator[None]:
+    """Hold one of the MAX_CONCURRENT_JOBS processing slots (queued/active gauges)."""
+    JOBS_QUEUED.inc()
+    try:
+        await job_slots.acquire()
+    finally:
+        JOBS_QUEUED.dec()
+    JOBS_ACTIVE.inc()
+    try:
+        yield
+    finally:
+        JOBS_ACTIVE.dec()
+        job_slots.release()
+
 
 async def _run_job_generation(
     job_id: str,
     requested_levels: List[int],
     with_audio: bool,
 ) -> None:
-    async with jobs_lock:
-        job = jobs_store.get(job_id)
-        if not job:
-            return
-        job["status"] = "running"
-        job["updated_at"] = _now_iso()
-        input_path = Path(job["input_path"])
-
-    if not input_path.exists():
-        await _mark_job_error(job_id, requested_levels, "Input audio missing")
+    """Run (or resume) a job while holding its runner lease."""
+    if not job_store.acquire_lease(job_id, RUNNER_ID, settings.JOB_LEASE_SEC):
+        logger.info(f"Job {job_id} is owned by another runner; not starting it here")
         return
-
     try:
+        async with _job_slot():
+            await _run_job_stages(job_id, requested_levels, with_audio)
+    finally:
+        job_store.release_lease(job_id, RUNNER_ID)
+
+
+async def _prepare_midi_source(job: dict, job_id: str, input_path: Path) -> Path:
+    """Stages 1-2 (decode, separation); returns the audio to transcribe."""
+    # Stage 1: decode to mono WAV
+    checkpoint = _checkpoint(job, "decoded")
+    if checkpoint:
+        decoded_path = Path(checkpoint["path"])
+        logger.info(f"Job {job_id}: resuming with decoded audio {decoded_path.name}")
+    else:
+        try:
+            decoded_path = await asyncio.to_thread(
+                inference.convert_to_wav,
+                input_path,
+                job_input_dir(job_id) / f"{job_id}_decoded.wav",
+            )
+        except Exception as decode_error:
+            logger.warning(f"Decode failed (non-fatal): {decode_error}")
+            decoded_path = input_path
+        _register_artifacts(job_id, KIND_INPUT, decoded_path)
+        await _save_checkpoint(job_id, "decoded", {"path": str(decoded_path)})
+
+    # Stage 2: melody separation
+    checkpoint = _checkpoint(job, "separated")
+    if checkpoint:
+        midi_source = Path(checkpoint["path"])
+        logger.info(f"Job {job_id}: resuming with separated stem {midi_source.name}")
+    else:
         logger.info("Attempting melody separation...")
         try:
-            separated_path = await asyncio.to_thread(separate_melody, input_path)
+            separated_path = await asyncio.to_thread(separation.separate_melody, decoded_path)
             if separated_path:
                 logger.success(f"V Separated melody: {separated_path.name}")
                 midi_source = separated_path
             else:
                 logger.info("No separation applied, using original audio")
-                midi_source = input_path
+                midi_source = decoded_path
         except Exception as sep_error:
             logger.warning(f"Separation failed (non-fatal): {sep_error}")
-            midi_source = input_path
+            midi_source = decoded_path
+        _register_artifacts(job_id, KIND_INPUT, midi_source)
+        await _save_checkpoint(job_id, "separated", {"path": str(midi_source)})
 
-        logger.info("=" * 60)
-        logger.info("STARTING MIDI EXTRACTION (JOB)")
-        logger.info("=" * 60)
-        midi_path = settings.OUTPUT_DIR / f"{job_id}_raw.mid"
-        try:
-            base_midi, metadata = await asyncio.to_thread(
-                process_audio_to_midi,
-                audio_path=midi_source,
-                output_path=midi_path,
-                clean=False,
+    return midi_source
+
+
+async def _run_job_stages(
+    job_id: str,
+    requested_levels: List[int],
+    with_audio: bool,
+) -> None:
+    """
+    Pipeline stages: decode -> separation -> raw MIDI -> per level (arrange, render).
+    Each completed stage is checkpointed in the job record so a restarted
+    process resumes from the last completed stage instead of recomputing.
+    Confidently identified known songs take their base MIDI and level renders
+    from the song library instead.
+    """
+    def mark_running(job: dict) -> None:
+        job["status"] = "running"
+        job["updated_at"] = _now_iso()
+
+    job = job_store.update(job_id, mark_running)
+    if not job:
+        return
+    input_path = Path(job["input_path"])
+    await pipeline_modules.ensure_loaded()
+
+    if not input_path.exists():
+        await _mark_job_error(job_id, requested_levels, "Input audio missing")
+        return
+
+    try:
+        # Stage 3: raw MIDI (resumed, looked up in the song library, or extracted)
+        checkpoint = _checkpoint(job, "raw_midi")
+        library_acrid = song_library.match(job.get("identified"))
+        library_base = (
+            song_library.stored_base(library_acrid) if library_acrid and not checkpoint else None
+        )
+        if library_acrid and not checkpoint:
+            record_cache("song_library", library_base is not None)
+        if checkpoint:
+            logger.info(f"Job {job_id}: resuming from raw MIDI checkpoint")
+            base_midi = await asyncio.to_thread(pretty_midi.PrettyMIDI, checkpoint["path"])
+            metadata = checkpoint.get("metadata") or {}
+            library_revision = checkpoint.get("library_revision")
+        elif library_base:
+            entry, library_midi = library_base
+            logger.info(f"Job {job_id}: known song {library_acrid}, using library base MIDI")
+            midi_path = job_output_dir(job_id) / f"{job_id}_raw.mid"
+            await asyncio.to_thread(link_or_copy, library_midi, midi_path)
+            base_midi = await asyncio.to_thread(pretty_midi.PrettyMIDI, str(midi_path))
+            metadata = entry.get("metadata") or {}
+            library_revision = entry.get("revision")
+            _register_artifacts(job_id, KIND_OUTPUT, midi_path)
+            await _save_checkpoint(
+                job_id,
+                "raw_midi",
+                {
+                    "path": str(midi_path),
+                    "metadata": metadata,
+                    "library_revision": library_revision,
+                },
+            )
+        else:
+            midi_source = await _prepare_midi_source(job, job_id, input_path)
+            logger.info("=" * 60)
+            logger.info("STARTING MIDI EXTRACTION (JOB)")
+            logger.info("=" * 60)
+            midi_path = job_output_dir(job_id) / f"{job_id}_raw.mid"
+            try:
+                base_midi, metadata = await asyncio.to_thread(
+                    inference.process_audio_to_midi,
+                    audio_path=midi_source,
+                    output_path=midi_path,
+                    clean=False,
+                )
+            except Exception as midi_error:
+                logger.error(f"MIDI extraction failed for job {job_id}: {midi_error}")
+                await _mark_job_error(job_id, requested_levels, str(midi_error))
+                return
+            _register_artifacts(job_id, KIND_OUTPUT, midi_path)
+            library_revision = None
+            if library_acrid:
+                library_revision = await asyncio.to_thread(
+                    song_library.offer_base,
+                    library_acrid,
+                    job["identified"],
+                    midi_path,
+                    metadata,
+                    job_id,
+                )
+            await _save_checkpoint(
+                job_id,
+                "raw_midi",
+                {
+                    "path": str(midi_path),
+                    "metadata": metadata,
+                    "library_revision": library_revision,
+                },
             )
-        except Exception as midi_error:
-            logger.error(f"MIDI extraction failed for job {job_id}: {midi_error}")
-            await _mark_job_error(job_id, requested_levels, str(midi_error))
-            return
 
         key_guess = metadata.get("key", "C")
         tempo_guess = metadata.get("tempo", 120)
         melody_quality = metadata.get("melody_quality")
         expected_notes_urls: Dict[str, str] = {}
+        output_dir = job_output_dir(job_id)
+        notes_only = bool(job.get("notes_only"))
+        lazy_video = settings.LAZY_VIDEO_RENDER and not notes_only
 
         for level in requested_levels:
+            rendered = _checkpoint(job, f"L{level}_rendered")
+            if rendered and (notes_only or lazy_video or Path(rendered["full_video"]).exists()):
+                logger.info(f"Job {job_id}: level {level} already rendered, skipping")
+                expected_notes_urls[f"L{level}"] = rendered["expected_notes_url"]
+                result = _rendered_level(rendered, output_dir / f"{job_id}_L{level}.mid")
+                job_store.update(job_id, _level_restorer(level, result))
+                continue
+
             await _update_job_level(job_id, level, {"status": "processing"})
             try:
                 level_config = get_level_config(level)
-                arranged_midi = await asyncio.to_thread(
-                    arrange_level,
-                    midi=base_midi,
-                    level=level,
-                    key=key_guess,
-                    tempo=tempo_guess,
-                )
-                full_video, preview_video, _ = await asyncio.to_thread(
-                    render_level_video,
-                    midi=arranged_midi,
-                    level=level,
-                    level_name=level_config["name"],
-                    output_dir=settings.OUTPUT_DIR,
-                    job_id=job_id,
-                    with_audio=with_audio,
+                stored = (
+                    song_library.level_files(library_acrid, library_revision, level, with_audio)
+                    if library_acrid and library_revision
+                    else None
                 )
+                # Notes-only jobs, lazy videos and library levels encode nothing here
+                full_video = preview_video = audio_file = encoder_profiles = None
+                if stored:
+                    # Known song: link the library's arrangement and videos into the job
+                    arranged_path = output_dir / f"{job_id}_L{level}.mid"
+                    links = [(stored["midi"], arranged_path)]
+                    if not notes_only:
+                        full_video = output_dir / f"{job_id}_L{level}_full.mp4"
+                        preview_video = output_dir / f"{job_id}_L{level}_full_preview.mp4"
+                        links += [
+                            (stored["full_video"], full_video),
+                            (stored["preview_video"], preview_video),
+                        ]
+                    for src, dst in links:
+                        await asyncio.to_thread(link_or_copy, src, dst)
+                    arranged_midi = await asyncio.to_thread(
+                        pretty_midi.PrettyMIDI, str(arranged_path)
+                    )
+                    _register_artifacts(job_id, KIND_OUTPUT, arranged_path)
+                    logger.info(f"Job {job_id}: level {level} served from song library")
+                else:
+                    arranged = _checkpoint(job, f"L{level}_arranged")
+                    if arranged:
+                        arranged_midi = await asyncio.to_thread(
+                            pretty_midi.PrettyMIDI, arranged["path"]
+                        )
+                    else:
+                        arranged_midi = await asyncio.to_thread(
+                            arranger.arrange_level,
+                            midi=base_midi,
+                            level=level,
+                            key=key_guess,
+                            tempo=tempo_guess,
+                        )
+                        arranged_path = output_dir / f"{job_id}_L{level}.mid"
+                        await asyncio.to_thread(arranged_midi.write, str(arranged_path))
+                        _register_artifacts(job_id, KIND_OUTPUT, arranged_path)
+                        await _save_checkpoint(
+                            job_id, f"L{level}_arranged", {"path": str(arranged_path)}
+                        )
+                if not stored and lazy_video:
+                    # Rendered from the saved MIDI on first request (lazy_videos)
+                    full_video = output_dir / f"{job_id}_L{level}_full.mp4"
+                    preview_video = output_dir / f"{job_id}_L{level}_full_preview.mp4"
+                    spec_path = write_render_spec(output_dir / f"{job_id}_L{level}.mid", with_audio)
+                    _register_artifacts(job_id, KIND_OUTPUT, spec_path)
+                elif not stored and not notes_only:
+                    encoder_profiles = {
+                        "video": render.select_encoder_profile(int(JOBS_QUEUED.value())),
+                        "preview": settings.PREVIEW_ENCODER_PROFILE,
+                    }
+                    loop = asyncio.get_running_loop()
+
+                    def publish_stream(playlist: Path) -> None:
+                        asyncio.run_coroutine_threadsafe(
+                            _update_job_level(job_id, level, {"stream_url": media_url(playlist)}),
+                            loop,
+                        )
+
+                    full_video, preview_video, audio_file = await asyncio.to_thread(
+                        render.render_level_video,
+                        midi=arranged_midi,
+                        level=level,
+                        level_name=level_config["name"],
+                        output_dir=output_dir,
+                        job_id=job_id,
+                        with_audio=with_audio,
+                        profile=bool(job.get("render_profile")),
+                        encoder_profile=encoder_profiles["video"],
+                        on_stream_ready=publish_stream,
+                    )
+                    _register_artifacts(
+                        job_id,
+                        KIND_OUTPUT,
+                        *report_paths(full_video),
+                        *render.hls_files(full_video),
+                    )
+                    # Encodes degraded under load would be linked into every later job
+                    if library_revision and encoder_profiles["video"] == settings.ENCODER_PROFILE:
+                        await asyncio.to_thread(
+                            song_library.offer_level,
+                            library_acrid,
+                            library_revision,
+                            level,
+                            with_audio,
+                            output_dir / f"{job_id}_L{level}.mid",
+                            full_video,
+                            preview_video,
+                        )
                 duration_sec = arranged_midi.get_end_time()
                 max_duration = settings.FULL_VIDEO_MAX_DURATION_SEC
                 if max_duration:
                     duration_sec = min(duration_sec, max_duration)
-                expected_notes_path = export_expected_notes_json(
+                expected_notes_path = arranger.export_expected_notes_json(
                     midi=arranged_midi,
-                    output_dir=settings.OUTPUT_DIR,
+                    output_dir=output_dir,
                     job_id=job_id,
                     level=level,
                     duration_sec=duration_sec,
                     melody_quality=melody_quality,
                 )
-                base = settings.BASE_URL.rstrip("/")
-                expected_notes_urls[f"L{level}"] = (
-                    f"{base}/media/out/{expected_notes_path.name}"
-                )
-                await _update_job_level(
+                _register_artifacts(
                     job_id,
-                    level,
-                    {
-                        "status": "success",
-                        "preview_url": f"{base}/media/out/{preview_video.name}",
-                        "video_url": f"{base}/media/out/{full_video.name}",
-                        "midi_url": f"{base}/media/out/{job_id}_L{level}.mid",
-                        "key_guess": key_guess,
-                        "tempo_guess": tempo_guess,
-                        "duration_sec": arranged_midi.get_end_time(),
-                        "error": None,
-                    },
+                    KIND_OUTPUT,
+                    full_video,
+                    preview_video,
+                    audio_file,
+                    expected_notes_path,
+                )
+                expected_notes_urls[f"L{level}"] = media_url(expected_notes_path)
+                level_result = {
+                    "status": "success",
+                    "preview_url": media_url(preview_video) if preview_video else "",
+                    "video_url": media_url(full_video) if full_video else "",
+                    "midi_url": media_url(output_dir / f"{job_id}_L{level}.mid"),
+                    "key_guess": key_guess,
+                    "tempo_guess": tempo_guess,
+                    "duration_sec": arranged_midi.get_end_time(),
+                    "error": None,
+                    "encoder_profiles": encoder_profiles,
+                    "stream_url": _stream_url(full_video) if full_video else None,
+                    "video_available": full_video is not None,
+                }
+                # Checkpoint and level result in one write: a resumed job restores the level
+                checkpoint = {
+                    "path": str(full_video or expected_notes_path),
+                    "full_video": str(full_video) if full_video else None,
+                    "preview_video": str(preview_video) if preview_video else None,
+                    "expected_notes_url": expected_notes_urls[f"L{level}"],
+                    "level": level_result,
+                }
+                job_store.update(
+                    job_id, _level_rendered_updater(level, checkpoint, level_result)
                 )
                 logger.success(f"V Job {job_id} level {level} completed")
             except Exception as level_error:
@@ -385,21 +858,65 @@ async def _run_job_generation(
                         "preview_url": "",
                         "video_url": "",
                         "midi_url": "",
+                        "stream_url": None,
                         "error": f"{type(level_error).__name__}: {level_error}",
                     },
                 )
 
-        async with jobs_lock:
-            job = jobs_store.get(job_id)
-            if job:
-                job["status"] = "complete"
-                job["updated_at"] = _now_iso()
-                job["expected_notes_urls"] = expected_notes_urls or None
-                job["melody_quality"] = melody_quality
+        def mark_complete(job: dict) -> None:
+            job["status"] = "complete"
+            job["updated_at"] = _now_iso()
+            job["expected_notes_urls"] = expected_notes_urls or None
+            job["melody_quality"] = melody_quality
+
+        job_store.update(job_id, mark_complete)
         logger.success(f"Job {job_id} completed")
     except Exception as fatal_error:
         logger.error(f"Job {job_id} fatal error: {fatal_error}")
         await _mark_job_error(job_id, requested_levels, str(fatal_error))
+
+
+def _spawn_job(job_id: str, requested_levels: List[int], with_audio: bool) -> None:
+    task = asyncio.create_task(_run_job_generation(job_id, requested_levels, with_audio))
+    job_tasks.add(task)
+    task.add_done_callback(job_tasks.discard)
+
+
+async def _resume_orphaned_jobs() -> None:
+    """
+    Resume running jobs whose runner died (crash, machine auto-stop). A job
+    that already used JOB_MAX_ATTEMPTS runs is failed instead: a runner that
+    keeps dying on it (e.g. OOM-killed) would otherwise retry it forever.
+    """
+    for job in job_store.claim_orphaned(RUNNER_ID, settings.JOB_LEASE_SEC):
+        job_id = job["job_id"]
+        levels = job.get("requested_levels") or [
+            entry["level"] for entry in job.get("levels", [])
+        ]
+        attempts = job_store.attempts(job_id)
+        if attempts > settings.JOB_MAX_ATTEMPTS:
+            logger.error(f"Job {job_id} interrupted {attempts - 1} times, giving up")
+            await _mark_job_error(
+                job_id, levels, f"Job interrupted {attempts - 1} times, not resumed"
+            )
+            job_store.release_lease(job_id, RUNNER_ID)
+            continue
+        logger.warning(f"Resuming interrupted job {job_id} (levels {levels}, attempt {attempts})")
+        _spawn_job(job_id, levels, bool(job.get("with_audio")))
+
+
+async def _lease_keeper() -> None:
+    """Renew this runner's leases and pick up orphaned jobs periodically."""
+    interval = max(1.0, settings.JOB_LEASE_SEC / 3)
+    while True:
+        try:
+            job_store.renew_leases(RUNNER_ID, settings.JOB_LEASE_SEC)
+            await _resume_orphaned_jobs()
+        except Exception as e:
+            logger.warning(f"Lease keeper iteration failed: {e}")
+        await asyncio.sleep(interval)
+
+
 # ============================================
 # Routes
 # ============================================
@@ -424,12 +941,150 @@ async def health():
     )
 
 
+@app.get("/ready")
+async def ready():
+    """Readiness: 503 until the audio/ML pipeline is loaded and warmed up (/health is liveness)"""
+    is_ready = pipeline_ready()
+    body = {
+        "status": "ready" if is_ready else "starting",
+        "timestamp": datetime.utcnow().isoformat(),
+        "imports_sec": pipeline_modules.report(),
+        "warmup_sec": warmup_report.steps_sec if warmup_report else None,
+    }
+    return JSONResponse(body, status_code=200 if is_ready else 503)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus metrics (stage timings, job slots, cache hit rates)"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+async def _upload_chunks(audio: UploadFile, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    while chunk := await audio.read(chunk_size):
+        yield chunk
+
+
+async def _receive_upload(
+    chunks: AsyncIterator[bytes],
+    input_path: Path,
+    decoded_path: Optional[Path] = None,
+) -> StoredUpload:
+    """
+    Store upload chunks in input_path, enforcing MAX_UPLOAD_SIZE_MB and
+    REJECT_AUDIO_DURATION_SEC. The duration is probed from the first bytes
+    (container header) so over-long audio is refused before it is stored;
+    ffprobe on the stored file covers containers whose header doesn't say.
+    Audio between MAX_AUDIO_DURATION_SEC and the reject limit is accepted and
+    cut to MAX_AUDIO_DURATION_SEC during decode.
+
+    With STREAMING_INGEST and a decoded_path, chunks are also decoded to WAV
+    as they arrive (see ingest.StreamingIngest).
+    """
+    max_size = settings.MAX_UPLOAD_SIZE_MB * 1024 * 1024
+    head = b""
+    probe: Optional[ProbeResult] = None
+    ingest = StreamingIngest(
+        input_path,
+        decoded_path if settings.STREAMING_INGEST else None,
+        max_duration_sec=settings.MAX_AUDIO_DURATION_SEC,
+    )
+
+    def too_long(duration: Optional[float]) -> bool:
+        return duration is not None and duration > settings.REJECT_AUDIO_DURATION_SEC
+
+    started = time.perf_counter()
+    await ingest.start()
+    try:
+        async for chunk in chunks:
+            if ingest.size + len(chunk) > max_size:
+                raise HTTPException(status_code=413, detail=ERROR_MESSAGES["too_large"])
+            if probe is None:
+                head += chunk[: PROBE_BYTES - len(head)]
+                if len(head) >= PROBE_BYTES:
+                    probe = probe_header(head)
+                    if too_long(probe.duration_sec):
+                        raise HTTPException(status_code=413, detail=ERROR_MESSAGES["too_long"])
+            await ingest.feed(chunk)
+        upload = await ingest.finish()
+
+        if probe is None:
+            probe = probe_header(head)
+        duration = probe.duration_sec
+        if duration is None:
+            duration = await probe_duration(input_path, timeout=settings.FFMPEG_TIMEOUT)
+        if too_long(duration):
+            raise HTTPException(status_code=413, detail=ERROR_MESSAGES["too_long"])
+    except BaseException:
+        await ingest.abort()
+        raise
+    STAGE_SECONDS.observe(time.perf_counter() - started, stage="upload", level="")
+
+    if duration is not None and duration > settings.MAX_AUDIO_DURATION_SEC:
+        logger.info(
+            f"{input_path.name}: {duration:.1f}s of audio, "
+            f"only the first {settings.MAX_AUDIO_DURATION_SEC}s will be processed"
+        )
+    return upload
+
+
+async def _create_job_from_upload(
+    job_id: str,
+    user_id: str,
+    input_path: Path,
+    upload: StoredUpload,
+    with_audio: bool,
+    requested_levels: List[int],
+) -> JobProgressResponse:
+    """Identify a stored upload and record the job (awaiting start)."""
+    logger.info(
+        f"Job {job_id} received file {input_path.name} "
+        f"({upload.size / 1024 / 1024:.2f} MB)"
+    )
+    _register_artifacts(job_id, KIND_INPUT, input_path, upload.decoded_path)
+
+    identified = None
+    try:
+        logger.info(f"Attempting to identify audio track for job {job_id}...")
+        identified = await identify_audio(input_path, content_hash=upload.sha256)
+    except Exception as id_error:
+        logger.warning(
+            f"Identification failed for job {job_id}: {id_error}"
+        )
+        identified = None
+
+    job = {
+        "job_id": job_id,
+        "user_id": user_id,
+        "owner_user_id": user_id,
+        "status": "awaiting_ad",
+        "created_at": _now_iso(),
+        "updated_at": _now_iso(),
+        "input_path": str(input_path),
+        "input_sha256": upload.sha256,
+        "with_audio": with_audio,
+        "identified": identified,
+        "levels": [_build_level_payload(level) for level in requested_levels],
+    }
+    if upload.decoded_path:
+        # Decoded during the upload: the runner starts at separation
+        job["checkpoints"] = {"decoded": {"path": str(upload.decoded_path)}}
+
+    job_store.put(job)
+
+    return _build_job_response(job)
+
+
 @app.post("/process", response_model=ProcessResponse)
 async def process_audio(
     audio: UploadFile = File(...),
     with_audio: bool = Form(False, description="Include synthesized audio in video"),
     levels: Optional[str] = Form("1,2,3,4"),
+    notes_only: bool = Form(
+        False, description="Skip video rendering: MIDI and expected notes only"
+    ),
     user=Depends(get_current_user),
+    render_profile: bool = Depends(render_profile_requested),
 ):
     """
     Process audio and generate piano videos for specified levels.
@@ -437,6 +1092,7 @@ async def process_audio(
     - **audio**: Audio file (m4a, wav, mp3) - max 10MB, ~8s recommended
     - **with_audio**: Include synthesized piano audio in output videos
     - **levels**: Which levels to generate (default: all 4)
+    - **notes_only**: Skip the videos (levels report video_available=false)
     
     Returns URLs for preview (16s) and full videos for each level.
     """
@@ -445,11 +1101,6 @@ async def process_audio(
     if not user_id:
         raise HTTPException(status_code=401, detail="Unauthenticated user")
 
-    # Validate file size
-    file_size = 0
-    chunk_size = 1024 * 1024  # 1MB
-    max_size = settings.MAX_UPLOAD_SIZE_MB * chunk_size
-    
     # Parse requested levels
     try:
         requested_levels = [int(l.strip()) for l in levels.split(",")]
@@ -462,21 +1113,18 @@ async def process_audio(
     job_id = _new_job_id()
     
     # Save uploaded file
-    input_path = settings.INPUT_DIR / f"{job_id}_input{Path(audio.filename).suffix}"
+    input_path = job_input_dir(job_id) / f"{job_id}_input{Path(audio.filename).suffix}"
+    output_dir = job_output_dir(job_id)
     
     try:
-        with input_path.open("wb") as f:
-            while chunk := await audio.read(chunk_size):
-                file_size += len(chunk)
-                if file_size > max_size:
-                    input_path.unlink(missing_ok=True)
-                    raise HTTPException(
-                        status_code=413,
-                        detail=ERROR_MESSAGES["too_large"]
-                    )
-                f.write(chunk)
+        upload = await _receive_upload(
+            _upload_chunks(audio), input_path, job_input_dir(job_id) / f"{job_id}_decoded.wav"
+        )
         
-        logger.info(f"Received file: {input_path.name} ({file_size / 1024 / 1024:.2f} MB)")
+        logger.info(f"Received file: {input_path.name} ({upload.size / 1024 / 1024:.2f} MB)")
+        _register_artifacts(job_id, KIND_INPUT, input_path, upload.decoded_path)
+        audio_source = upload.decoded_path or input_path
+        await pipeline_modules.ensure_loaded()
         
         # Process audio and generate videos
         results = []
@@ -484,148 +1132,186 @@ async def process_audio(
         expected_notes_urls: Dict[str, str] = {}
         melody_quality: Optional[float] = None
         
-        try:
-            # Optional: identify track via ACRCloud
-            logger.info("Attempting to identify audio track...")
-            try:
-                identified = identify_audio(input_path)
-                if identified:
-                    logger.success(f"✓ Identified track: title='{identified.get('title')}', artist='{identified.get('artist')}'")
-                else:
-                    logger.warning("Could not identify track")
-            except Exception as id_error:
-                logger.warning(f"Identification failed (non-fatal): {id_error}")
-                identified = None
-
-            # Optional: separate melody to help detection
-            logger.info("Attempting melody separation...")
-            try:
-                separated_path = separate_melody(input_path)
-                if separated_path:
-                    logger.success(f"✓ Separated melody: {separated_path.name}")
-                    midi_source = separated_path
-                else:
-                    logger.info("No separation applied, using original audio")
-                    midi_source = input_path
-            except Exception as sep_error:
-                logger.warning(f"Separation failed (non-fatal): {sep_error}")
-                midi_source = input_path
+        # Optional: identify track via ACRCloud, concurrently with separation and
+        # extraction (bounded by ACR_DEADLINE_SEC, never raises)
+        logger.info("Attempting to identify audio track...")
+        identify_task = asyncio.create_task(
+            identify_audio(input_path, content_hash=upload.sha256)
+        )
 
-            # Step 1: Extract MIDI from audio
-            logger.info("=" * 60)
-            logger.info("STARTING MIDI EXTRACTION")
-            logger.info("=" * 60)
-            logger.info(f"Input audio: {midi_source.name}")
+        try:
+            # One of the MAX_CONCURRENT_JOBS slots, like the /jobs runner
+            async with _job_slot():
+                # Optional: separate melody to help detection
+                logger.info("Attempting melody separation...")
+                try:
+                    separated_path = await asyncio.to_thread(
+                        separation.separate_melody, audio_source
+                    )
+                    if separated_path:
+                        logger.success(f"✓ Separated melody: {separated_path.name}")
+                        _register_artifacts(job_id, KIND_INPUT, separated_path)
+                        midi_source = separated_path
+                    else:
+                        logger.info("No separation applied, using original audio")
+                        midi_source = audio_source
+                except Exception as sep_error:
+                    logger.warning(f"Separation failed (non-fatal): {sep_error}")
+                    midi_source = audio_source
+
+                # Step 1: Extract MIDI from audio
+                logger.info("=" * 60)
+                logger.info("STARTING MIDI EXTRACTION")
+                logger.info("=" * 60)
+                logger.info(f"Input audio: {midi_source.name}")
             
-            try:
-                midi_path = settings.OUTPUT_DIR / f"{job_id}_raw.mid"
-                logger.info(f"Calling process_audio_to_midi()...")
-                logger.info(f"  audio_path: {midi_source}")
-                logger.info(f"  output_path: {midi_path}")
+                try:
+                    midi_path = output_dir / f"{job_id}_raw.mid"
+                    logger.info(f"Calling process_audio_to_midi()...")
+                    logger.info(f"  audio_path: {midi_source}")
+                    logger.info(f"  output_path: {midi_path}")
                 
-                base_midi, metadata = process_audio_to_midi(
-                    audio_path=midi_source,
-                    output_path=midi_path,
-                    clean=False
-                )
+                    base_midi, metadata = await asyncio.to_thread(
+                        inference.process_audio_to_midi,
+                        audio_path=midi_source,
+                        output_path=midi_path,
+                        clean=False,
+                    )
                 
-                key_guess = metadata.get("key", "C")
-                tempo_guess = metadata.get("tempo", 120)
-                melody_quality = metadata.get("melody_quality")
-                num_notes = metadata.get("num_notes", 0)
+                    key_guess = metadata.get("key", "C")
+                    tempo_guess = metadata.get("tempo", 120)
+                    melody_quality = metadata.get("melody_quality")
+                    num_notes = metadata.get("num_notes", 0)
                 
-                logger.success(f"=" * 60)
-                logger.success(f"✅ MIDI EXTRACTION COMPLETE")
-                logger.success(f"=" * 60)
-                logger.success(f"Extracted: {num_notes} notes")
-                logger.success(f"Key: {key_guess}, Tempo: {tempo_guess} BPM")
-                logger.success(f"Duration: {metadata.get('duration', 0):.2f}s")
-                logger.success(f"Saved to: {midi_path.name}")
+                    logger.success(f"=" * 60)
+                    logger.success(f"✅ MIDI EXTRACTION COMPLETE")
+                    logger.success(f"=" * 60)
+                    logger.success(f"Extracted: {num_notes} notes")
+                    logger.success(f"Key: {key_guess}, Tempo: {tempo_guess} BPM")
+                    logger.success(f"Duration: {metadata.get('duration', 0):.2f}s")
+                    logger.success(f"Saved to: {midi_path.name}")
+                    _register_artifacts(job_id, KIND_OUTPUT, midi_path)
                 
-            except Exception as midi_error:
-                logger.error("=" * 60)
-                logger.error(f"❌ MIDI EXTRACTION FAILED")
-                logger.error("=" * 60)
-                logger.error(f"Error: {type(midi_error).__name__}: {midi_error}")
-                import traceback
-                logger.error(f"Traceback:\n{traceback.format_exc()}")
-                raise
+                except Exception as midi_error:
+                    logger.error("=" * 60)
+                    logger.error(f"❌ MIDI EXTRACTION FAILED")
+                    logger.error("=" * 60)
+                    logger.error(f"Error: {type(midi_error).__name__}: {midi_error}")
+                    import traceback
+                    logger.error(f"Traceback:\n{traceback.format_exc()}")
+                    raise
             
-            # Step 2: Generate videos for each requested level (parallel processing possible)
-            for level in requested_levels:
-                try:
-                    level_config = get_level_config(level)
-                    logger.info(f"Step 2.{level}: Processing Level {level} - {level_config['name']}")
-                    
-                    # Arrange MIDI for this level
-                    arranged_midi = arrange_level(
-                        midi=base_midi,
-                        level=level,
-                        key=key_guess,
-                        tempo=tempo_guess
-                    )
+                # Step 2: Generate videos for each requested level (parallel processing possible)
+                for level in requested_levels:
+                    try:
+                        level_config = get_level_config(level)
+                        logger.info(
+                            f"Step 2.{level}: Processing Level {level} - {level_config['name']}"
+                        )
                     
-                    # Render video
-                    full_video, preview_video, audio_file = render_level_video(
-                        midi=arranged_midi,
-                        level=level,
-                        level_name=level_config["name"],
-                        output_dir=settings.OUTPUT_DIR,
-                        job_id=job_id,
-                        with_audio=with_audio
-                    )
-                    duration_sec = arranged_midi.get_end_time()
-                    max_duration = settings.FULL_VIDEO_MAX_DURATION_SEC
-                    if max_duration:
-                        duration_sec = min(duration_sec, max_duration)
-                    expected_notes_path = export_expected_notes_json(
-                        midi=arranged_midi,
-                        output_dir=settings.OUTPUT_DIR,
-                        job_id=job_id,
-                        level=level,
-                        duration_sec=duration_sec,
-                        melody_quality=melody_quality,
-                    )
+                        # Arrange MIDI for this level
+                        arranged_midi = await asyncio.to_thread(
+                            arranger.arrange_level,
+                            midi=base_midi,
+                            level=level,
+                            key=key_guess,
+                            tempo=tempo_guess,
+                        )
                     
-                    # Build result
-                    base = settings.BASE_URL.rstrip("/")
-                    expected_notes_urls[f"L{level}"] = (
-                        f"{base}/media/out/{expected_notes_path.name}"
-                    )
-                    results.append(
-                        LevelResult(
+                        # Render video
+                        full_video = preview_video = audio_file = encoder_profiles = None
+                        if notes_only or settings.LAZY_VIDEO_RENDER:
+                            arranged_path = output_dir / f"{job_id}_L{level}.mid"
+                            await asyncio.to_thread(arranged_midi.write, str(arranged_path))
+                            if not notes_only:
+                                # Rendered from the saved MIDI on first request (lazy_videos)
+                                full_video = output_dir / f"{job_id}_L{level}_full.mp4"
+                                preview_video = output_dir / f"{job_id}_L{level}_full_preview.mp4"
+                                spec_path = write_render_spec(arranged_path, with_audio)
+                                _register_artifacts(job_id, KIND_OUTPUT, spec_path)
+                        else:
+                            encoder_profiles = {
+                                "video": render.select_encoder_profile(int(JOBS_QUEUED.value())),
+                                "preview": settings.PREVIEW_ENCODER_PROFILE,
+                            }
+                            full_video, preview_video, audio_file = await asyncio.to_thread(
+                                render.render_level_video,
+                                midi=arranged_midi,
+                                level=level,
+                                level_name=level_config["name"],
+                                output_dir=output_dir,
+                                job_id=job_id,
+                                with_audio=with_audio,
+                                profile=render_profile,
+                                encoder_profile=encoder_profiles["video"],
+                            )
+                        duration_sec = arranged_midi.get_end_time()
+                        max_duration = settings.FULL_VIDEO_MAX_DURATION_SEC
+                        if max_duration:
+                            duration_sec = min(duration_sec, max_duration)
+                        expected_notes_path = arranger.export_expected_notes_json(
+                            midi=arranged_midi,
+                            output_dir=output_dir,
+                            job_id=job_id,
                             level=level,
-                            name=level_config["name"],
-                            preview_url=f"{base}/media/out/{preview_video.name}",
-                            video_url=f"{base}/media/out/{full_video.name}",
-                            midi_url=f"{base}/media/out/{job_id}_L{level}.mid",
-                            key_guess=key_guess,
-                            tempo_guess=tempo_guess,
-                            duration_sec=arranged_midi.get_end_time(),
-                            status="success"
+                            duration_sec=duration_sec,
+                            melody_quality=melody_quality,
+                        )
+                        _register_artifacts(
+                            job_id,
+                            KIND_OUTPUT,
+                            full_video,
+                            preview_video,
+                            audio_file,
+                            expected_notes_path,
+                            output_dir / f"{job_id}_L{level}.mid",
+                            *(report_paths(full_video) if full_video else ()),
+                            *(render.hls_files(full_video) if full_video else ()),
                         )
-                    )
                     
-                    logger.success(f"✅ Level {level} completed!")
+                        # Build result
+                        expected_notes_urls[f"L{level}"] = media_url(expected_notes_path)
+                        results.append(
+                            LevelResult(
+                                level=level,
+                                name=level_config["name"],
+                                preview_url=media_url(preview_video) if preview_video else "",
+                                video_url=media_url(full_video) if full_video else "",
+                                midi_url=media_url(output_dir / f"{job_id}_L{level}.mid"),
+                                key_guess=key_guess,
+                                tempo_guess=tempo_guess,
+                                duration_sec=arranged_midi.get_end_time(),
+                                status="success",
+                                encoder_profiles=encoder_profiles,
+                                stream_url=_stream_url(full_video) if full_video else None,
+                                video_available=full_video is not None,
+                            )
+                        )
                     
-                except Exception as level_error:
-                    import traceback
-                    logger.error(f"Level {level} failed: {level_error}")
-                    logger.error(f"Traceback:\n{traceback.format_exc()}")
-                    error_message = f"{type(level_error).__name__}: {level_error}"
-                    results.append(
-                        LevelResult(
-                            level=level,
-                            name=level_config["name"],
-                            preview_url="",
-                            video_url="",
-                            midi_url="",
-                            status="error",
-                            error=error_message
+                        logger.success(f"✅ Level {level} completed!")
+                    
+                    except Exception as level_error:
+                        import traceback
+                        logger.error(f"Level {level} failed: {level_error}")
+                        logger.error(f"Traceback:\n{traceback.format_exc()}")
+                        error_message = f"{type(level_error).__name__}: {level_error}"
+                        results.append(
+                            LevelResult(
+                                level=level,
+                                name=level_config["name"],
+                                preview_url="",
+                                video_url="",
+                                midi_url="",
+                                status="error",
+                                error=error_message
+                            )
                         )
-                    )
             
-            logger.success(f"🎉 Job {job_id} completed! {len([r for r in results if r.status == 'success'])}/{len(requested_levels)} levels successful")
+                succeeded = len([r for r in results if r.status == "success"])
+                logger.success(
+                    f"🎉 Job {job_id} completed! "
+                    f"{succeeded}/{len(requested_levels)} levels successful"
+                )
             
         except Exception as e:
             logger.error(f"Processing failed: {e}")
@@ -643,6 +1329,15 @@ async def process_audio(
                         error=str(e)
                     )
                 )
+
+        identified = await identify_task
+        if identified:
+            logger.success(
+                f"✓ Identified track: title='{identified.get('title')}', "
+                f"artist='{identified.get('artist')}'"
+            )
+        else:
+            logger.warning("Could not identify track")
         
         response = ProcessResponse(
             job_id=job_id,
@@ -655,7 +1350,7 @@ async def process_audio(
             melody_quality=melody_quality,
         )
 
-        # Persist job metadata to Firestore
+        # Persist job metadata to Firestore (write-behind)
         try:
             levels_payload = [r.model_dump() for r in results]
             payload = {
@@ -668,9 +1363,9 @@ async def process_audio(
                 "levels": levels_payload,
                 "inputFilename": input_path.name,
             }
-            save_job_for_user(user_id, job_id, payload)
+            persistence_queue.enqueue("jobs", user_id, job_id, payload)
         except Exception as save_error:
-            logger.warning(f"Failed to persist job to Firestore: {save_error}")
+            logger.warning(f"Failed to queue job for Firestore: {save_error}")
 
         return response
         
@@ -703,57 +1398,16 @@ async def create_job(
     requested_levels = _parse_levels(levels)
     await _cleanup_jobs()
 
-    file_size = 0
-    chunk_size = 1024 * 1024
-    max_size = settings.MAX_UPLOAD_SIZE_MB * chunk_size
-
     job_id = _new_job_id()
-    input_path = settings.INPUT_DIR / f"{job_id}_input{Path(audio.filename).suffix}"
+    input_path = job_input_dir(job_id) / f"{job_id}_input{Path(audio.filename).suffix}"
 
     try:
-        with input_path.open("wb") as f:
-            while chunk := await audio.read(chunk_size):
-                file_size += len(chunk)
-                if file_size > max_size:
-                    input_path.unlink(missing_ok=True)
-                    raise HTTPException(
-                        status_code=413,
-                        detail=ERROR_MESSAGES["too_large"],
-                    )
-                f.write(chunk)
-
-        logger.info(
-            f"Job {job_id} received file {input_path.name} "
-            f"({file_size / 1024 / 1024:.2f} MB)"
+        upload = await _receive_upload(
+            _upload_chunks(audio), input_path, job_input_dir(job_id) / f"{job_id}_decoded.wav"
+        )
+        return await _create_job_from_upload(
+            job_id, user_id, input_path, upload, with_audio, requested_levels
         )
-
-        identified = None
-        try:
-            logger.info(f"Attempting to identify audio track for job {job_id}...")
-            identified = await asyncio.to_thread(identify_audio, input_path)
-        except Exception as id_error:
-            logger.warning(
-                f"Identification failed for job {job_id}: {id_error}"
-            )
-            identified = None
-
-        job = {
-            "job_id": job_id,
-            "user_id": user_id,
-            "owner_user_id": user_id,
-            "status": "awaiting_ad",
-            "created_at": _now_iso(),
-            "updated_at": _now_iso(),
-            "input_path": str(input_path),
-            "with_audio": with_audio,
-            "identified": identified,
-            "levels": [_build_level_payload(level) for level in requested_levels],
-        }
-
-        async with jobs_lock:
-            jobs_store[job_id] = job
-
-        return _build_job_response(job)
     except HTTPException:
         raise
     except Exception as e:
@@ -763,12 +1417,61 @@ async def create_job(
         raise HTTPException(status_code=500, detail=ERROR_MESSAGES["processing_failed"])
 
 
+@app.post("/jobs/stream", response_model=JobProgressResponse)
+async def create_job_streaming(request: Request, user=Depends(get_current_user)):
+    """
+    Same multipart form as POST /jobs (audio, with_audio, levels), parsed while
+    it arrives: the audio is stored, hashed and decoded during the upload.
+    """
+    user_id = user.get("uid") if isinstance(user, dict) else None
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Unauthenticated user")
+
+    try:
+        form = MultipartStream(request.headers.get("content-type", ""), request.stream())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="multipart/form-data body required")
+    part = await form.next_file()
+    if part is None or part[0] != "audio":
+        raise HTTPException(status_code=422, detail="Missing audio file")
+    await _cleanup_jobs()
+
+    job_id = _new_job_id()
+    input_path = job_input_dir(job_id) / f"{job_id}_input{Path(part[1]).suffix}"
+    decoded_path = job_input_dir(job_id) / f"{job_id}_decoded.wav"
+
+    try:
+        upload = await _receive_upload(form.file_chunks(), input_path, decoded_path)
+        try:
+            fields = await form.finish()
+            requested_levels = _parse_levels(fields.get("levels") or "1,2,3,4")
+        except BaseException:
+            input_path.unlink(missing_ok=True)
+            decoded_path.unlink(missing_ok=True)
+            raise
+        with_audio = (fields.get("with_audio") or "").lower() in ("1", "true", "on", "yes")
+        return await _create_job_from_upload(
+            job_id, user_id, input_path, upload, with_audio, requested_levels
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Streaming job creation failed: {e}")
+        input_path.unlink(missing_ok=True)
+        decoded_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=500, detail=ERROR_MESSAGES["processing_failed"])
+
+
 @app.post("/jobs/{job_id}/start", response_model=JobProgressResponse)
 async def start_job(
     job_id: str,
     with_audio: bool = Form(False, description="Include synthesized audio in video"),
     levels: Optional[str] = Form("1,2,3,4"),
+    notes_only: bool = Form(
+        False, description="Skip video rendering: MIDI and expected notes only"
+    ),
     user=Depends(get_current_user),
+    render_profile: bool = Depends(render_profile_requested),
 ):
     """Start generation for an existing job."""
     user_id = user.get("uid") if isinstance(user, dict) else None
@@ -777,28 +1480,42 @@ async def start_job(
 
     requested_levels = _parse_levels(levels)
 
-    async with jobs_lock:
-        job = jobs_store.get(job_id)
-        if not job:
-            raise HTTPException(status_code=404, detail="Job not found")
-        owner_id = job.get("owner_user_id") or job.get("user_id")
-        if owner_id != user_id:
-            raise HTTPException(status_code=403, detail="Forbidden")
-        if job.get("status") in {"running", "complete", "error"}:
-            return _build_job_response(job)
+    job = job_store.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    owner_id = job.get("owner_user_id") or job.get("user_id")
+    if owner_id != user_id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if job.get("status") in {"running", "complete", "error"}:
+        return _build_job_response(job)
+
+    started = False
 
+    def mark_started(job: dict) -> None:
+        nonlocal started
+        # Re-check inside the transaction: another worker may have started it.
+        if job.get("status") in {"running", "complete", "error"}:
+            return
         job["status"] = "running"
         job["updated_at"] = _now_iso()
         job["with_audio"] = with_audio
         job["requested_levels"] = requested_levels
-
-    asyncio.create_task(_run_job_generation(job_id, requested_levels, with_audio))
-
-    async with jobs_lock:
-        job = jobs_store.get(job_id)
-        if not job:
-            raise HTTPException(status_code=404, detail="Job not found")
-        return _build_job_response(job)
+        if notes_only:
+            job["notes_only"] = True
+            for entry in job.get("levels", []):
+                entry["video_available"] = False
+        if render_profile:
+            job["render_profile"] = True
+        started = True
+
+    job = job_store.update(job_id, mark_started)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if started:
+        # Take the lease right away so the lease keeper never sees it orphaned.
+        job_store.acquire_lease(job_id, RUNNER_ID, settings.JOB_LEASE_SEC, attempt=True)
+        _spawn_job(job_id, requested_levels, with_audio)
+    return _build_job_response(job)
 
 
 @app.get("/jobs/{job_id}/progress", response_model=JobProgressResponse)
@@ -808,32 +1525,20 @@ async def job_progress(job_id: str, user=Depends(get_current_user)):
     if not user_id:
         raise HTTPException(status_code=401, detail="Unauthenticated user")
 
-    async with jobs_lock:
-        job = jobs_store.get(job_id)
-        if not job:
-            raise HTTPException(status_code=404, detail="Job not found")
-        owner_id = job.get("owner_user_id") or job.get("user_id")
-        if owner_id != user_id:
-            raise HTTPException(status_code=403, detail="Forbidden")
-        return _build_job_response(job)
+    job = job_store.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    owner_id = job.get("owner_user_id") or job.get("user_id")
+    if owner_id != user_id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return _build_job_response(job)
 
 
 @app.delete("/cleanup/{job_id}")
 async def cleanup_job(job_id: str):
     """Delete all files associated with a job ID"""
     try:
-        deleted = []
-        
-        # Delete input files
-        for file in settings.INPUT_DIR.glob(f"{job_id}*"):
-            file.unlink()
-            deleted.append(str(file.name))
-        
-        # Delete output files
-        for file in settings.OUTPUT_DIR.glob(f"{job_id}*"):
-            file.unlink()
-            deleted.append(str(file.name))
-        
+        deleted = await asyncio.to_thread(artifact_index.delete_job, job_id)
         return {"status": "ok", "deleted": deleted}
     
     except Exception as e:
@@ -845,12 +1550,50 @@ async def cleanup_job(job_id: str):
 # Startup & Shutdown
 # ============================================
 
+async def _load_pipeline() -> None:
+    """Background startup step: import and warm up the pipeline, report the timings."""
+    global warmup_report
+    try:
+        await pipeline_modules.ensure_loaded()
+    except Exception as e:
+        logger.error(f"Pipeline modules failed to load (retried by the first job): {e}")
+        return
+    STARTUP_SECONDS.set(pipeline_modules.load_sec or 0.0, phase="pipeline_import")
+    logger.info(
+        f"Pipeline modules loaded in {pipeline_modules.load_sec or 0.0:.2f}s: "
+        f"{pipeline_modules.report()}"
+    )
+    if not _startup_warmup_wanted():
+        if settings.WARMUP_ON_STARTUP:
+            # One shared CPU: a warmup now would slow the request that woke the machine
+            logger.info(f"Numba cache baked into the image ({baked_cache_dir()}), no warmup")
+        return
+    report = await asyncio.to_thread(run_warmup)
+    STARTUP_SECONDS.set(report.total_sec, phase="warmup")
+    if report.error:
+        # Not fatal: jobs still run, the first one just pays the cold-start cost
+        logger.warning(f"Pipeline warmup failed after {report.total_sec:.2f}s: {report.error}")
+    else:
+        logger.info(f"Pipeline warmed up in {report.total_sec:.2f}s: {report.steps_sec}")
+    warmup_report = report
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize on startup"""
     logger.info("🚀 ShazaPiano Backend starting...")
     init_directories()
     init_firebase(settings.FIREBASE_CREDENTIALS)
+    persistence_queue.start()
+    background_tasks.append(asyncio.create_task(refresh_signing_keys_forever()))
+    background_tasks.append(asyncio.create_task(_lease_keeper()))
+    background_tasks.append(asyncio.create_task(loop_monitor.run()))
+    background_tasks.append(asyncio.create_task(_load_pipeline()))
+    background_tasks.append(
+        asyncio.create_task(
+            retention_service.run_forever(settings.RETENTION_SWEEP_INTERVAL_SEC)
+        )
+    )
     logger.info(
         "Preview config: duration=%ss size=%sx%s",
         settings.PREVIEW_DURATION_SEC,
@@ -865,6 +1608,17 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("👋 ShazaPiano Backend shutting down...")
+    for task in background_tasks:
+        task.cancel()
+    await persistence_queue.stop()
+    await acr_identifier.aclose()
+    # Unfinished jobs keep their checkpoints; releasing the leases lets the
+    # next process resume them immediately instead of waiting for expiry.
+    job_store.release_leases(RUNNER_ID)
+    lazy_videos.shutdown()
+    job_store.close()
+    artifact_index.close()
+    logger.info(f"Token cache stats: {token_claims_cache.stats()}")
 
 
 # ============================================
@@ -884,11 +1638,8 @@ async def save_practice(
 
     session_id = payload.started_at or datetime.utcnow().isoformat()
     data = payload.model_dump()
-    data["userId"] = user_id
-    try:
-        save_practice_session(user_id, session_id, data)
-    except Exception as e:
-        logger.warning(f"Failed to persist practice session: {e}")
+    # Queued for a batched Firestore commit; only a full queue fails the request
+    if not persistence_queue.enqueue("practice_sessions", user_id, session_id, data):
         raise HTTPException(status_code=500, detail="Failed to save practice session")
 
     return {"status": "ok", "session_id": session_id}
@@ -905,12 +1656,15 @@ async def get_practice_notes(
     if not user_id:
         raise HTTPException(status_code=401, detail="Unauthenticated user")
 
-    midi_path = settings.OUTPUT_DIR / f"{job_id}_L{level}.mid"
+    midi_path = job_output_dir(job_id, create=False) / f"{job_id}_L{level}.mid"
+    if not midi_path.exists():
+        midi_path = settings.OUTPUT_DIR / f"{job_id}_L{level}.mid"  # pre-sharding layout
     if not midi_path.exists():
         raise HTTPException(status_code=404, detail="MIDI not found for this level")
 
     try:
-        pm = pretty_midi.PrettyMIDI(str(midi_path))
+        await pipeline_modules.ensure_loaded()
+        pm = await asyncio.to_thread(pretty_midi.PrettyMIDI, str(midi_path))
         notes = []
         for inst in pm.instruments:
             for n in inst.notes:
@@ -13,6 +13,7 @@ import numpy as np
 from loguru import logger
 
 from config import get_level_config, MAJOR_SCALE, MINOR_SCALE
+from metrics import stage_timer
 
 EXPECTED_NOTES_MIN_DURATION_MS = 50
 EXPECTED_NOTES_MERGE_GAP_MS = 80
@@ -330,6 +331,16 @@ def arrange_level(
     Returns:
         Arranged MIDI for the level
     """
+    with stage_timer("arrangement", level):
+        return _arrange_level(midi, level, key, tempo)
+
+
+def _arrange_level(
+    midi: pretty_midi.PrettyMIDI,
+    level: int,
+    key: str,
+    tempo: int,
+) -> pretty_midi.PrettyMIDI:
     config = get_level_config(level)
     logger.info(f"Arranging Level {level}: {config['name']}")
     
@@ -0,0 +1,156 @@
+"""
+Early container / duration probing for uploads.
+`probe_header` reads the duration from the first bytes of an upload without
+decoding (WAV fmt/data chunks, MP4/M4A mvhd when moov comes first, MP3
+Xing/Info frame count). `probe_duration` falls back to ffprobe on a file.
+"""
+from __future__ import annotations
+
+import asyncio
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+# Enough for RIFF/fmt, an ID3 tag + first MP3 frame, or a leading moov box
+PROBE_BYTES = 64 * 1024
+
+_MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+@dataclass
+class ProbeResult:
+    container: Optional[str] = None  # wav | mp4 | mp3
+    duration_sec: Optional[float] = None
+
+
+def _probe_wav(head: bytes) -> Optional[float]:
+    offset = 12
+    byte_rate = None
+    while offset + 8 <= len(head):
+        chunk_id = head[offset:offset + 4]
+        (size,) = struct.unpack_from("<I", head, offset + 4)
+        if chunk_id == b"fmt " and offset + 20 <= len(head):
+            (byte_rate,) = struct.unpack_from("<I", head, offset + 16)
+        elif chunk_id == b"data":
+            # 0 / 0xFFFFFFFF: length unknown (streamed WAV)
+            if not byte_rate or size in (0, 0xFFFFFFFF):
+                return None
+            return size / byte_rate
+        offset += 8 + size + (size & 1)
+    return None
+
+
+def _find_box(data: bytes, start: int, end: int, box_type: bytes) -> Optional[tuple]:
+    """(payload_start, payload_end) of the first `box_type` box in data[start:end]."""
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                return None
+            (size,) = struct.unpack_from(">Q", data, offset + 8)
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return None
+        if kind == box_type:
+            return offset + header, min(offset + size, end)
+        if kind == b"mdat" and offset + size > end:
+            return None  # moov is after the media data, beyond the probed bytes
+        offset += size
+    return None
+
+
+def _probe_mp4(head: bytes) -> Optional[float]:
+    moov = _find_box(head, 0, len(head), b"moov")
+    if moov is None:
+        return None
+    mvhd = _find_box(head, moov[0], moov[1], b"mvhd")
+    if mvhd is None:
+        return None
+    start = mvhd[0]
+    version = head[start]
+    try:
+        if version == 1:
+            timescale, duration = struct.unpack_from(">IQ", head, start + 20)
+        else:
+            timescale, duration = struct.unpack_from(">II", head, start + 12)
+    except struct.error:
+        return None
+    return duration / timescale if timescale else None
+
+
+def _probe_mp3(head: bytes) -> Optional[float]:
+    offset = 0
+    if head[:3] == b"ID3" and len(head) >= 10:
+        size = head[6:10]
+        offset = 10 + ((size[0] << 21) | (size[1] << 14) | (size[2] << 7) | size[3])
+    if offset + 4 > len(head) or head[offset] != 0xFF or (head[offset + 1] & 0xE0) != 0xE0:
+        return None
+
+    version_bits = (head[offset + 1] >> 3) & 0x03  # 3 = MPEG1, 2 = MPEG2, 0 = MPEG2.5
+    layer_bits = (head[offset + 1] >> 1) & 0x03  # 1 = Layer III
+    rate_index = (head[offset + 2] >> 2) & 0x03
+    channel_mode = (head[offset + 3] >> 6) & 0x03
+    if version_bits not in _MP3_SAMPLE_RATES or layer_bits != 1 or rate_index == 3:
+        return None
+    sample_rate = _MP3_SAMPLE_RATES[version_bits][rate_index]
+    mono = channel_mode == 3
+    if version_bits == 3:
+        side_info, samples_per_frame = (17 if mono else 32), 1152
+    else:
+        side_info, samples_per_frame = (9 if mono else 17), 576
+
+    # Xing (VBR) / Info (CBR) header carries the frame count
+    xing = offset + 4 + side_info
+    if head[xing:xing + 4] in (b"Xing", b"Info") and xing + 12 <= len(head):
+        (flags,) = struct.unpack_from(">I", head, xing + 4)
+        if flags & 0x1:
+            (frames,) = struct.unpack_from(">I", head, xing + 8)
+            return frames * samples_per_frame / sample_rate
+    return None
+
+
+def probe_header(head: bytes) -> ProbeResult:
+    """Container and duration (if the header states it) from the first bytes of a file."""
+    try:
+        if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+            return ProbeResult("wav", _probe_wav(head))
+        if head[4:8] == b"ftyp":
+            return ProbeResult("mp4", _probe_mp4(head))
+        if head[:3] == b"ID3" or (len(head) > 1 and head[0] == 0xFF and (head[1] & 0xE0) == 0xE0):
+            return ProbeResult("mp3", _probe_mp3(head))
+    except struct.error:
+        pass
+    return ProbeResult()
+
+
+async def probe_duration(path: Path, timeout: float = 10.0) -> Optional[float]:
+    """Duration via ffprobe (container metadata, no full decode); None if unknown."""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "error",
+            "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1",
+            str(path),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        logger.warning("ffprobe not found; upload duration unknown until decode")
+        return None
+    try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        logger.warning(f"ffprobe timed out on {path.name}")
+        return None
+    try:
+        return float(stdout.decode().strip())
+    except ValueError:
+        return None
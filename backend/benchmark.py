@@ -0,0 +1,481 @@
+"""
+Offline benchmark: audio -> MIDI -> arrangements -> videos on a synthetic corpus.
+
+The corpus is generated deterministically (no network, no fixtures): sine and
+piano-like melodies, chords, noise and silence at several lengths. Every clip
+goes through each stage in isolation (decode, separation, transcription,
+arrangement, render) and through the full pipeline
+(process_audio_to_midi -> arrange_level -> render_level_video). Each run
+reports wall time, CPU time (own + ffmpeg children), peak RSS and, for
+rendering, frames/sec.
+
+    python benchmark.py                              # 5s/15s/60s, all kinds
+    python benchmark.py --lengths 5 --kinds piano    # quick run
+    python benchmark.py --save-baseline benchmarks/baseline.json
+    python benchmark.py --compare benchmarks/baseline.json --tolerance 0.25
+    python benchmark.py --frame-copies               # bytes allocated per frame
+    python benchmark.py --compare-backends           # PIL vs ffmpeg filter graph
+
+--compare exits with status 1 when a (clip, stage) got slower than the
+baseline by more than the tolerance.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import soundfile as sf
+from loguru import logger
+
+from config import settings, get_level_config
+from synth import MELODY, NOTE_SEC, SAMPLE_RATE, synth_clip
+
+LENGTHS_SEC = (5, 15, 60)
+KINDS = ("sine", "piano", "chords", "noise", "silence")
+STAGES = ("decode", "separation", "transcription", "arrangement", "render", "pipeline")
+LEVELS = (1, 2, 3, 4)
+
+
+# ============================================
+# Synthetic corpus
+# ============================================
+
+def build_corpus(
+    directory: Path, kinds: Sequence[str] = KINDS, lengths: Sequence[float] = LENGTHS_SEC
+) -> List[Tuple[str, Path]]:
+    """Write the corpus as 16-bit WAV files; returns [(clip name, path)]."""
+    directory.mkdir(parents=True, exist_ok=True)
+    corpus = []
+    for length in lengths:
+        for kind in kinds:
+            name = f"{kind}_{length:g}s"
+            path = directory / f"{name}.wav"
+            sf.write(str(path), synth_clip(kind, length), SAMPLE_RATE, subtype="PCM_16")
+            corpus.append((name, path))
+    return corpus
+
+
+# ============================================
+# Measurement
+# ============================================
+
+@dataclass
+class Measurement:
+    clip: str
+    stage: str
+    wall_sec: float
+    cpu_sec: float
+    child_cpu_sec: float
+    peak_rss_mb: float
+    frames: Optional[int] = None
+    fps: Optional[float] = None
+    error: Optional[str] = None
+
+
+def _current_rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _PeakRss:
+    """Samples this process' RSS in a thread (ru_maxrss only gives the lifetime peak)."""
+
+    def __init__(self, interval_sec: float = 0.01):
+        self.interval_sec = interval_sec
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while True:
+            rss = _current_rss_bytes()
+            if rss is None:
+                return
+            self.peak = max(self.peak, rss)
+            if self._stop.wait(self.interval_sec):
+                return
+
+    def __enter__(self) -> "_PeakRss":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        if not self.peak:
+            # No /proc: lifetime peak in KiB on Linux, bytes on macOS
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.peak = maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def measure(clip: str, stage: str, fn: Callable[[], object]) -> Tuple[Measurement, object]:
+    """Run fn once; errors are recorded (e.g. no melody in noise), not raised."""
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    result, error = None, None
+    with _PeakRss() as rss:
+        try:
+            result = fn()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    child_cpu = (children_after.ru_utime - children.ru_utime) + (
+        children_after.ru_stime - children.ru_stime
+    )
+    return (
+        Measurement(
+            clip=clip,
+            stage=stage,
+            wall_sec=round(wall, 4),
+            cpu_sec=round(cpu, 4),
+            child_cpu_sec=round(child_cpu, 4),
+            peak_rss_mb=round(rss.peak / (1024 * 1024), 1),
+            error=error,
+        ),
+        result,
+    )
+
+
+def _with_frames(measurement: Measurement, frames: int) -> Measurement:
+    measurement.frames = frames
+    if measurement.error is None and measurement.wall_sec > 0:
+        measurement.fps = round(frames / measurement.wall_sec, 2)
+    return measurement
+
+
+def _video_frames(midi) -> int:
+    """Frames render_level_video encodes for a MIDI (same rule as generate_video_frames)."""
+    duration = midi.get_end_time()
+    if settings.FULL_VIDEO_MAX_DURATION_SEC:
+        duration = min(settings.FULL_VIDEO_MAX_DURATION_SEC, duration)
+    return int((duration + settings.VIDEO_PREROLL_SEC) * settings.VIDEO_FPS)
+
+
+# ============================================
+# Benchmark
+# ============================================
+
+def bench_clip(
+    name: str,
+    path: Path,
+    work_dir: Path,
+    stages: Sequence[str] = STAGES,
+    levels: Sequence[int] = LEVELS,
+) -> List[Measurement]:
+    """Each stage in isolation (fed by the previous stage's output), then the full pipeline."""
+    from arranger import arrange_level
+    from inference import convert_to_wav, process_audio_to_midi
+    from render import render_level_video
+    from separation import separate_melody
+
+    out_dir = work_dir / name
+    out_dir.mkdir(parents=True, exist_ok=True)
+    results: List[Measurement] = []
+
+    def run(stage: str, fn: Callable[[], object], label: Optional[str] = None) -> object:
+        """Measure a stage; stages not requested still run when later ones need their output."""
+        measurement, result = measure(name, label or stage, fn)
+        if stage in stages:
+            results.append(measurement)
+        return result
+
+    decoded = path
+    if "decode" in stages:
+        decoded = run("decode", lambda: convert_to_wav(path, out_dir / "decoded.wav")) or path
+    if "separation" in stages:
+        run("separation", lambda: separate_melody(decoded))
+
+    isolated = {"transcription", "arrangement", "render"}
+    if isolated & set(stages):
+        transcribed = run("transcription", lambda: process_audio_to_midi(path))
+        if transcribed is not None:
+            midi, metadata = transcribed
+            key, tempo = metadata.get("key", "C"), metadata.get("tempo", 120)
+            arranged = {}
+            for level in levels:
+                arranged[level] = run(
+                    "arrangement",
+                    lambda: arrange_level(midi, level, key, tempo),
+                    f"arrangement_L{level}",
+                )
+            if "render" in stages:
+                for level in levels:
+                    if arranged.get(level) is None:
+                        continue
+                    measurement, _ = measure(
+                        name,
+                        f"render_L{level}",
+                        lambda: render_level_video(
+                            arranged[level],
+                            level,
+                            get_level_config(level)["name"],
+                            out_dir,
+                            f"{name}_iso",
+                        ),
+                    )
+                    results.append(_with_frames(measurement, _video_frames(arranged[level])))
+
+    if "pipeline" in stages:
+        frames = 0
+
+        def pipeline() -> None:
+            nonlocal frames
+            midi, metadata = process_audio_to_midi(path)
+            for level in levels:
+                arranged_midi = arrange_level(
+                    midi, level, metadata.get("key", "C"), metadata.get("tempo", 120)
+                )
+                render_level_video(
+                    arranged_midi, level, get_level_config(level)["name"], out_dir, name
+                )
+                frames += _video_frames(arranged_midi)
+
+        measurement, _ = measure(name, "pipeline", pipeline)
+        results.append(_with_frames(measurement, frames))
+    return results
+
+
+def _melody_midi(notes: int = 32):
+    """Melody over a held bass line, as arranged MIDI."""
+    import pretty_midi
+
+    midi = pretty_midi.PrettyMIDI()
+    piano = pretty_midi.Instrument(program=0)
+    for index in range(notes):
+        pitch = MELODY[index % len(MELODY)]
+        start = index * NOTE_SEC
+        piano.notes.append(pretty_midi.Note(90, pitch, start, start + NOTE_SEC))
+        piano.notes.append(pretty_midi.Note(70, pitch - 12, start, start + 2 * NOTE_SEC))
+    midi.instruments.append(piano)
+    return midi
+
+
+def frame_copies(frames: int = 48, level: int = 4) -> dict:
+    """
+    Python/numpy bytes allocated per frame between the renderer and ffmpeg's
+    stdin (tracemalloc peak per frame; Pillow's own image buffers are not
+    traced). Frames are encoded to a scratch MP4 by create_video_from_frames.
+    """
+    from render import create_video_from_frames, generate_video_frames
+
+    midi = _melody_midi()
+
+    per_frame: List[int] = []
+    frame_bytes = 0
+
+    def traced(iterator):
+        # One window per frame: drawing it, then the encoder loop converting
+        # and writing it (the window closes when the encoder asks for the next)
+        nonlocal frame_bytes
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        for frame in iterator:
+            frame_bytes = frame.nbytes
+            yield frame
+            current, peak = tracemalloc.get_traced_memory()
+            per_frame.append(peak - base)
+            tracemalloc.reset_peak()
+            base = current
+
+    iterator, _, _ = generate_video_frames(midi, level, get_level_config(level)["name"])
+    with tempfile.TemporaryDirectory(prefix="shazapiano-frames-") as tmp:
+        tracemalloc.start()
+        try:
+            create_video_from_frames(
+                traced(iterator),
+                Path(tmp) / "frames.mp4",
+                fps=settings.VIDEO_FPS,
+                max_duration=frames / settings.VIDEO_FPS,
+                width=settings.VIDEO_WIDTH,
+                height=settings.VIDEO_HEIGHT,
+            )
+        finally:
+            tracemalloc.stop()
+    steady = sorted(per_frame[1:] or per_frame)  # first frame allocates the buffers
+    return {
+        "frames": len(per_frame),
+        "pixel_format": settings.RENDER_PIXEL_FORMAT,
+        "frame_bytes": frame_bytes,
+        "allocated_bytes_per_frame_p50": steady[len(steady) // 2],
+        "allocated_bytes_per_frame_max": steady[-1],
+        "first_frame_bytes": per_frame[0],
+    }
+
+
+def compare_backends(notes: int = 32, max_duration: Optional[float] = None) -> dict:
+    """
+    PIL renderer vs ffmpeg filter graph (render_ffmpeg) on the same MIDI:
+    pixel mismatch between their RGB frames (PIL drawing rgb0), then each
+    backend's encode to MP4 (wall, CPU incl. ffmpeg, frames/sec).
+    """
+    from render import create_video_from_frames, generate_video_frames
+    from render_ffmpeg import render_rgb_frames, render_video
+
+    midi = _melody_midi(notes)
+    queue_frames = settings.RENDER_QUEUE_FRAMES
+    settings.RENDER_QUEUE_FRAMES = 0  # frames are compared one at a time
+    try:
+        pil_frames, num_frames, _ = generate_video_frames(
+            midi, 4, "", max_duration=max_duration, pixel_format="rgb0"
+        )
+        frames = mismatched_frames = mismatched_pixels = 0
+        for pil, graph in zip(pil_frames, render_rgb_frames(midi, max_duration)):
+            differs = int(np.count_nonzero(np.any(pil[:, :, :3] != graph, axis=2)))
+            frames += 1
+            mismatched_frames += differs > 0
+            mismatched_pixels += differs
+    finally:
+        settings.RENDER_QUEUE_FRAMES = queue_frames
+
+    encodes = {}
+    with tempfile.TemporaryDirectory(prefix="shazapiano-backends-") as tmp:
+
+        def pil() -> None:
+            iterator, count, duration = generate_video_frames(
+                midi, 4, "", max_duration=max_duration
+            )
+            create_video_from_frames(
+                iterator,
+                Path(tmp) / "pil.mp4",
+                fps=settings.VIDEO_FPS,
+                max_duration=max_duration,
+                width=settings.VIDEO_WIDTH,
+                height=settings.VIDEO_HEIGHT,
+                expected_frames=count,
+                duration_sec=duration,
+            )
+
+        def ffmpeg() -> None:
+            render_video(midi, Path(tmp) / "ffmpeg.mp4", max_duration=max_duration)
+
+        for name, fn in (("pil", pil), ("ffmpeg", ffmpeg)):
+            measurement, _ = measure("melody", f"render_{name}", fn)
+            encodes[name] = asdict(_with_frames(measurement, frames))
+    return {
+        "frames": frames,
+        "expected_frames": num_frames,
+        "mismatched_frames": mismatched_frames,
+        "mismatched_pixel_fraction": mismatched_pixels
+        / max(1, frames * settings.VIDEO_WIDTH * settings.VIDEO_HEIGHT),
+        "encode": encodes,
+    }
+
+
+def run_benchmark(
+    kinds: Sequence[str] = KINDS,
+    lengths: Sequence[float] = LENGTHS_SEC,
+    stages: Sequence[str] = STAGES,
+    levels: Sequence[int] = LEVELS,
+    work_dir: Optional[Path] = None,
+) -> dict:
+    with tempfile.TemporaryDirectory(prefix="shazapiano-bench-") as tmp:
+        root = Path(work_dir or tmp)
+        corpus = build_corpus(root / "corpus", kinds, lengths)
+        results: List[Measurement] = []
+        for name, path in corpus:
+            logger.info(f"Benchmark: {name}")
+            clip_results = bench_clip(name, path, root / "out", stages, levels)
+            for m in clip_results:
+                status = m.error or (f"{m.fps} fps" if m.fps else "ok")
+                logger.info(f"  {m.stage:<16} {m.wall_sec:8.3f}s  cpu {m.cpu_sec:8.3f}s  "
+                            f"rss {m.peak_rss_mb:7.1f}MB  {status}")
+            results.extend(clip_results)
+    return {
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "video": {
+            "width": settings.VIDEO_WIDTH,
+            "height": settings.VIDEO_HEIGHT,
+            "fps": settings.VIDEO_FPS,
+            "max_duration_sec": settings.FULL_VIDEO_MAX_DURATION_SEC,
+        },
+        "results": [asdict(m) for m in results],
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Regressions: (clip, stage) wall time above baseline * (1 + tolerance)."""
+    previous = {(r["clip"], r["stage"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in report["results"]:
+        base = previous.get((result["clip"], result["stage"]))
+        if not base or base.get("error") or result.get("error") or not base["wall_sec"]:
+            continue
+        ratio = result["wall_sec"] / base["wall_sec"]
+        if ratio > 1 + tolerance:
+            regressions.append(
+                f"{result['clip']}/{result['stage']}: {base['wall_sec']:.3f}s -> "
+                f"{result['wall_sec']:.3f}s (+{(ratio - 1) * 100:.0f}%)"
+            )
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="ShazaPiano offline pipeline benchmark")
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=list(KINDS))
+    parser.add_argument("--lengths", nargs="+", type=float, default=list(LENGTHS_SEC))
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--levels", nargs="+", type=int, choices=LEVELS, default=list(LEVELS))
+    parser.add_argument("--work-dir", type=Path, help="Keep corpus and outputs here")
+    parser.add_argument("--out", type=Path, help="Write the report JSON here")
+    parser.add_argument("--save-baseline", type=Path, help="Write the report as a baseline")
+    parser.add_argument("--compare", type=Path, help="Baseline JSON to compare against")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="Allowed slowdown (0.2 = 20%%)"
+    )
+    parser.add_argument(
+        "--frame-copies", action="store_true", help="Only report bytes allocated per rendered frame"
+    )
+    parser.add_argument(
+        "--compare-backends",
+        action="store_true",
+        help="Only compare the PIL and ffmpeg filter-graph renderers (pixels, speed)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.frame_copies:
+        print(json.dumps(frame_copies(), indent=2))
+        return 0
+    if args.compare_backends:
+        print(json.dumps(compare_backends(), indent=2))
+        return 0
+
+    report = run_benchmark(args.kinds, args.lengths, args.stages, args.levels, args.work_dir)
+    for path in filter(None, (args.out, args.save_baseline)):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, indent=2))
+        logger.info(f"Benchmark report written to {path}")
+
+    if args.compare:
+        regressions = compare(report, json.loads(args.compare.read_text()), args.tolerance)
+        for line in regressions:
+            logger.warning(f"Regression: {line}")
+        if regressions:
+            return 1
+        logger.success(f"No regression beyond {args.tolerance:.0%} vs {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,7 @@
 Configuration for ShazaPiano Backend
 Levels presets, paths, limits
 """
+import os
 from pathlib import Path
 from typing import Dict, Any
 from pydantic_settings import BaseSettings
@@ -20,11 +21,25 @@ class Settings(BaseSettings):
     FIREBASE_CREDENTIALS: str | None = None  # absolute path to service account JSON
     FIREBASE_PROJECT_ID: str | None = None
     DEBUG_AUTH_BYPASS: bool = False  # set True to bypass Firebase auth in dev
+    AUTH_CACHE_MAX_ENTRIES: int = 10000  # verified ID-token claims kept until token exp
+
+    # Write-behind persistence (job / practice-session documents)
+    PERSISTENCE_SINK: str = "firestore"  # firestore | memory | sqlite (local runs)
+    PERSISTENCE_BATCH_SIZE: int = 100
+    PERSISTENCE_FLUSH_INTERVAL_SEC: float = 0.5
+    PERSISTENCE_MAX_RETRIES: int = 5
+    PERSISTENCE_BACKOFF_SEC: float = 0.5  # doubled after each failed batch commit
 
     # ACRCloud (optional)
     ACR_HOST: str | None = None
     ACR_ACCESS_KEY: str | None = None
     ACR_ACCESS_SECRET: str | None = None
+    ACR_PROTOCOL: str = "https"        # http only for the local stub server
+    ACR_EXCERPT_SEC: float = 10.0      # fingerprint-sized excerpt uploaded instead of the file
+    ACR_DEADLINE_SEC: float = 6.0      # hard deadline per identification
+    ACR_CACHE_MAX_ENTRIES: int = 1024  # results cached by sha256 of the upload
+    ACR_MAX_CONNECTIONS: int = 10      # pooled httpx.AsyncClient connections
+    ACR_LIBRARY_MIN_SCORE: float = 80.0  # identification score needed to use the song library
     
     # Separation (optional)
     USE_SPLEETER: bool = True  # keeps HPSS separation via librosa if True
@@ -40,10 +55,14 @@ class Settings(BaseSettings):
     MEDIA_DIR: Path = BASE_DIR / "media"
     INPUT_DIR: Path = MEDIA_DIR / "in"
     OUTPUT_DIR: Path = MEDIA_DIR / "out"
+    SONG_LIBRARY_DIR: Path = MEDIA_DIR / "library"  # known-song arrangements keyed by acrid
+    SONG_LIBRARY_MAX_MB: int = 1500  # least recently used songs evicted beyond (curated kept)
     
     # Upload limits
     MAX_UPLOAD_SIZE_MB: int = 10
-    MAX_AUDIO_DURATION_SEC: int = 15
+    MAX_AUDIO_DURATION_SEC: int = 15       # longer audio is cut to this during decode
+    REJECT_AUDIO_DURATION_SEC: int = 60    # uploads probed longer than this are refused
+    STREAMING_INGEST: bool = True          # decode uploads with ffmpeg while they arrive
     
     # Processing timeouts
     FFMPEG_TIMEOUT: int = 15
@@ -62,13 +81,52 @@ class Settings(BaseSettings):
     VIDEO_FALLING_SPEED_PX_PER_SEC: int = 300
     VIDEO_FALLING_AREA_HEIGHT: int = 500
     VIDEO_BAR_START_Y_OFFSET: int = 0  # Barres commencent en haut
+    RENDER_PROFILE: bool = False  # per-frame timing report next to each full video (all jobs)
+    RENDER_PIXEL_FORMAT: str = "yuv420p"  # renderer output: yuv420p (libx264's input) or rgb0
+    # Frames buffered between the renderer and an ffmpeg writer thread; 0 writes
+    # inline (default on one CPU, where renderer and ffmpeg can't overlap anyway)
+    RENDER_QUEUE_FRAMES: int = 4 if (os.cpu_count() or 1) > 1 else 0
+    # pil: Python draws frames piped to ffmpeg; ffmpeg: one compiled filter graph
+    # draws and encodes them (render_ffmpeg, no Python per-frame work)
+    RENDER_BACKEND: str = "pil"
+    # Encoder profiles (ENCODER_PROFILES below). Adaptive: with queued jobs
+    # waiting for a slot, each ENCODER_LOAD_STEP_JOBS of them steps one
+    # profile down ENCODER_LOAD_PROFILES; back to ENCODER_PROFILE once drained
+    ENCODER_PROFILE: str = "balanced"
+    PREVIEW_ENCODER_PROFILE: str = "preview"
+    ENCODER_ADAPTIVE: bool = True
+    ENCODER_LOAD_PROFILES: list[str] = ["fast", "degraded"]
+    ENCODER_LOAD_STEP_JOBS: int = 2
+    # Also write each full video as an HLS event playlist of fMP4 segments while
+    # it encodes; jobs publish stream_url once the first segment exists
+    VIDEO_HLS: bool = False
+    HLS_SEGMENT_SEC: float = 1.0
+    # Render level videos on their first request instead of in the job (lazy_render.py)
+    LAZY_VIDEO_RENDER: bool = False
+    LAZY_RENDER_WORKERS: int = 2  # on-demand renders running at once
+    LAZY_RENDER_MAX_PENDING: int = 16  # levels rendering or queued; further requests get 503
+    LAZY_RENDER_CACHE_MB: int = 2000  # on-demand videos kept; least recently served evicted beyond
+    LAZY_RENDER_FAILURE_TTL_SEC: int = 60  # a failed render is not retried for this long
     
     # Concurrency
     MAX_CONCURRENT_JOBS: int = 4
+    LOOP_MONITOR_INTERVAL_SEC: float = 0.1  # event-loop lag sampling period
+    LOOP_BLOCK_THRESHOLD_SEC: float = 0.25  # loop stalls beyond this are logged with a stack
+    WARMUP_ON_STARTUP: bool = True  # warm up before /ready; skipped if the image's cache is warm
     
     # Retention
     INPUT_RETENTION_HOURS: int = 24
     OUTPUT_RETENTION_DAYS: int = 7
+    MEDIA_DISK_BUDGET_MB: int = 9000  # 10 GB volume minus headroom; oldest jobs evicted beyond
+    RETENTION_SWEEP_INTERVAL_SEC: int = 600
+
+    # Job store (SQLite on the media volume, survives machine suspend/restart)
+    JOBS_DB_PATH: Path = MEDIA_DIR / "jobs.sqlite3"
+    PERSISTENCE_SQLITE_PATH: Path = MEDIA_DIR / "documents.sqlite3"  # PERSISTENCE_SINK=sqlite
+    JOB_STORE_CACHE_TTL_SEC: float = 0.5  # progress polls served from cache within this window
+    JOB_RETENTION_MINUTES: int = 30  # finished jobs are purged from the store after this
+    JOB_LEASE_SEC: int = 30  # runner lease; running jobs without a live lease are resumed
+    JOB_MAX_ATTEMPTS: int = 3  # runs per job (start + resumes); beyond, the job is failed
     
     class Config:
         env_file = ".env"
@@ -138,6 +196,61 @@ LEVELS: Dict[int, Dict[str, Any]] = {
 }
 
 
+# ============================================
+# ENCODER PROFILES - libx264 settings per output
+# ============================================
+# crf/keyint/tune/threads None: x264's default (crf 23, keyint 250, auto
+# threads); fps None: VIDEO_FPS (full videos only, previews keep the source's)
+
+ENCODER_PROFILES: Dict[str, Dict[str, Any]] = {
+    "quality": {
+        "preset": "medium",
+        "crf": 20,
+        "tune": "animation",  # flat colors, sharp edges
+        "keyint": 48,
+        "threads": None,
+        "x264_params": "",
+        "fps": None,
+    },
+    "balanced": {  # full videos before profiles existed
+        "preset": "veryfast",
+        "crf": None,
+        "tune": None,
+        "keyint": None,
+        "threads": None,
+        "x264_params": "",
+        "fps": None,
+    },
+    "fast": {
+        "preset": "superfast",
+        "crf": 25,
+        "tune": None,
+        "keyint": None,
+        "threads": 2,  # jobs queue up: leave cores to the other encodes
+        "x264_params": "",
+        "fps": None,
+    },
+    "degraded": {
+        "preset": "ultrafast",
+        "crf": 28,
+        "tune": None,
+        "keyint": None,
+        "threads": 1,
+        "x264_params": "rc-lookahead=0",
+        "fps": 15,
+    },
+    "preview": {  # previews before profiles existed
+        "preset": "ultrafast",
+        "crf": None,
+        "tune": None,
+        "keyint": None,
+        "threads": None,
+        "x264_params": "",
+        "fps": None,
+    },
+}
+
+
 # ============================================
 # CHORD PROGRESSIONS & SCALES
 # ============================================
@@ -159,7 +272,7 @@ COMMON_PROGRESSIONS = {
 ERROR_MESSAGES = {
     "no_audio": "Aucun audio détecté. Veuillez réessayer.",
     "no_melody": "Aucune mélodie détectable. Essayez un environnement plus silencieux.",
-    "too_long": f"L'audio ne doit pas dépasser {settings.MAX_AUDIO_DURATION_SEC}s.",
+    "too_long": f"L'audio ne doit pas dépasser {settings.REJECT_AUDIO_DURATION_SEC}s.",
     "too_large": f"Le fichier ne doit pas dépasser {settings.MAX_UPLOAD_SIZE_MB} MB.",
     "processing_failed": "Erreur lors de la génération. Veuillez réessayer.",
     "invalid_level": "Niveau invalide. Utilisez 1, 2, 3 ou 4.",
@@ -173,7 +286,15 @@ def get_level_config(level: int) -> Dict[str, Any]:
     return LEVELS[level]
 
 
+def get_encoder_profile(name: str) -> Dict[str, Any]:
+    """Get an encoder profile by name"""
+    if name not in ENCODER_PROFILES:
+        raise ValueError(f"Unknown encoder profile: {name}")
+    return ENCODER_PROFILES[name]
+
+
 def init_directories():
     """Create necessary directories"""
     settings.INPUT_DIR.mkdir(parents=True, exist_ok=True)
     settings.OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    settings.SONG_LIBRARY_DIR.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,18 @@
+"""
+Test session setup: the app's media volume and databases (MEDIA_DIR, its
+subdirectories, jobs/documents SQLite files) point at a temporary directory,
+set before any test imports config or app, so test runs never write to
+backend/media.
+"""
+import shutil
+import tempfile
+from pathlib import Path
+
+from loadtest import isolate_media
+
+MEDIA_DIR = Path(tempfile.mkdtemp(prefix="shazapiano-test-media-"))
+isolate_media(MEDIA_DIR)
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(MEDIA_DIR, ignore_errors=True)
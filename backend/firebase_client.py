@@ -1,10 +1,16 @@
-"""Firebase Admin helpers: init, token verification, Firestore writes."""
+"""Firebase Admin helpers: init, token verification, Firestore batch writes."""
 from __future__ import annotations
 
-from typing import Any, Dict, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
 from loguru import logger
 
+from auth_cache import FirebaseTokenVerifier, PublicKeySet, TokenClaimsCache
+from config import settings
+
+if TYPE_CHECKING:
+    from persistence import PendingWrite
+
 try:
     import firebase_admin
     from firebase_admin import auth as firebase_auth
@@ -18,10 +24,15 @@ except ImportError:  # pragma: no cover - handled at runtime
 firebase_app = None
 firestore_client = None
 
+# Verified-claims cache + signing keys (prefetched/refreshed in the background)
+firebase_key_set = PublicKeySet()
+token_claims_cache = TokenClaimsCache(max_entries=settings.AUTH_CACHE_MAX_ENTRIES)
+token_verifier: Optional[FirebaseTokenVerifier] = None
+
 
 def init_firebase(cred_path: Optional[str]) -> None:
     """Initialize Firebase Admin SDK with the given credentials path."""
-    global firebase_app, firestore_client
+    global firebase_app, firestore_client, token_verifier
 
     if firebase_admin is None:
         logger.warning("Firebase Admin SDK not installed; skipping Firebase init.")
@@ -36,6 +47,12 @@ def init_firebase(cred_path: Optional[str]) -> None:
         cred = credentials.Certificate(cred_path)
         firebase_app = firebase_admin.initialize_app(cred)
         firestore_client = firestore.client(app=firebase_app)
+        token_verifier = FirebaseTokenVerifier(
+            key_set=firebase_key_set,
+            project_id=settings.FIREBASE_PROJECT_ID or firebase_app.project_id,
+            cache=token_claims_cache,
+            fallback=lambda token: firebase_auth.verify_id_token(token, app=firebase_app),
+        )
         logger.success("Firebase Admin initialized.")
     except Exception as e:  # pragma: no cover
         logger.error(f"Firebase initialization failed: {e}")
@@ -44,44 +61,42 @@ def init_firebase(cred_path: Optional[str]) -> None:
 
 
 def verify_firebase_token(id_token: str) -> Dict[str, Any]:
-    """Verify Firebase ID token and return decoded claims."""
-    if firebase_auth is None or firebase_app is None:
+    """Verify Firebase ID token and return decoded claims (cached until the token's exp)."""
+    if firebase_auth is None or firebase_app is None or token_verifier is None:
         raise RuntimeError("Firebase not initialized")
 
-    return firebase_auth.verify_id_token(id_token, app=firebase_app)
+    return token_verifier.verify(id_token)
 
 
-def save_job_for_user(user_id: str, job_id: str, payload: Dict[str, Any]) -> None:
-    """Persist job metadata to Firestore under users/{uid}/jobs/{jobId}."""
-    if firestore_client is None:
-        logger.warning("Firestore client not initialized; skipping job persistence.")
+async def refresh_signing_keys_forever() -> None:
+    """Background task: prefetch and refresh the token signing keys."""
+    if token_verifier is None:
         return
-
-    doc_ref = (
-        firestore_client.collection("users")
-        .document(user_id)
-        .collection("jobs")
-        .document(job_id)
-    )
-    payload = dict(payload)
-    payload["userId"] = user_id
-    doc_ref.set(payload, merge=True)
-    logger.success(f"Job {job_id} saved to Firestore for user {user_id}.")
-
-
-def save_practice_session(user_id: str, session_id: str, payload: Dict[str, Any]) -> None:
-    """Persist practice session metadata to Firestore under users/{uid}/practice_sessions/{session_id}."""
-    if firestore_client is None:
-        logger.warning("Firestore client not initialized; skipping practice session persistence.")
-        return
-
-    doc_ref = (
-        firestore_client.collection("users")
-        .document(user_id)
-        .collection("practice_sessions")
-        .document(session_id)
-    )
-    payload = dict(payload)
-    payload["userId"] = user_id
-    doc_ref.set(payload, merge=True)
-    logger.success(f"Practice session {session_id} saved to Firestore for user {user_id}.")
+    await firebase_key_set.run_refresher()
+
+
+class FirestoreSink:
+    """
+    Persistence sink committing queued merge-writes as one Firestore batch
+    (users/{uid}/{collection}/{docId}); Firestore caps a batch at 500 writes.
+    """
+
+    max_batch_writes = 500
+
+    def commit(self, writes: List["PendingWrite"]) -> None:
+        if firestore_client is None:
+            logger.warning(f"Firestore client not initialized; skipping {len(writes)} writes.")
+            return
+
+        for start in range(0, len(writes), self.max_batch_writes):
+            batch = firestore_client.batch()
+            for write in writes[start:start + self.max_batch_writes]:
+                doc_ref = (
+                    firestore_client.collection("users")
+                    .document(write.user_id)
+                    .collection(write.collection)
+                    .document(write.doc_id)
+                )
+                batch.set(doc_ref, write.payload, merge=True)
+            batch.commit()
+        logger.debug(f"Committed {len(writes)} Firestore writes.")
@@ -1,79 +1,229 @@
 """
 ACRCloud identification helper.
-Reads creds from settings and posts audio to ACRCloud identify API.
+Reads creds from settings and posts a short audio excerpt to the ACRCloud
+identify API through one pooled async client. Calls are bounded by a hard
+deadline and results are cached by content hash of the upload.
 """
+from __future__ import annotations
+
+import asyncio
 import base64
 import hashlib
 import hmac
 import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Tuple
 
 import httpx
 from loguru import logger
 
 from config import settings
+from metrics import record_cache
+
+# Marks a cached "no match" answer (None is also a valid cache miss)
+_NO_MATCH = object()
+
+
+def _sign(access_key: str, access_secret: str, timestamp: int) -> str:
+    string_to_sign = "\n".join(
+        ["POST", "/v1/identify", access_key, "audio", "1", str(timestamp)]
+    )
+    return base64.b64encode(
+        hmac.new(
+            access_secret.encode("utf-8"),
+            string_to_sign.encode("utf-8"),
+            digestmod=hashlib.sha1,
+        ).digest()
+    ).decode("utf-8")
+
+
+def _content_hash(audio_path: Path) -> str:
+    digest = hashlib.sha256()
+    with audio_path.open("rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _parse_result(result: dict) -> Tuple[bool, Optional[dict]]:
+    """(cacheable, track) from an ACRCloud response; errors other than no-match aren't cached."""
+    status = result.get("status", {})
+    status_code = status.get("code")
+    if status_code == 1001:  # no result
+        return True, None
+    if status_code != 0:
+        logger.warning(f"ACR identify failed code={status_code} msg={status.get('msg')}")
+        return False, None
 
+    music_list = result.get("metadata", {}).get("music", [])
+    if not music_list:
+        return True, None
 
-def identify_audio(audio_path: Path) -> Optional[dict]:
+    first = music_list[0]
+    return True, {
+        "title": first.get("title"),
+        "artist": ", ".join([a.get("name") for a in first.get("artists", []) if a.get("name")]),
+        "album": (first.get("album") or {}).get("name"),
+        "acrid": first.get("acrid"),
+        "score": first.get("score"),
+    }
+
+
+class AcrIdentifier:
     """
-    Identify audio using ACRCloud.
-    Returns dict with title/artist/album if success, else None.
+    ACRCloud client shared by all requests: one pooled httpx.AsyncClient,
+    fingerprint-sized excerpts (ffmpeg, mono 8 kHz WAV), an LRU cache keyed by
+    sha256 of the upload, and a hard deadline per identification.
     """
-    if not (settings.ACR_HOST and settings.ACR_ACCESS_KEY and settings.ACR_ACCESS_SECRET):
-        return None
 
-    try:
-        data_type = "audio"
-        signature_version = "1"
-        timestamp = int(time.time())
+    def __init__(
+        self,
+        host: Optional[str],
+        access_key: Optional[str],
+        access_secret: Optional[str],
+        protocol: str = "https",
+        excerpt_sec: float = 10.0,
+        deadline_sec: float = 6.0,
+        cache_max_entries: int = 1024,
+        max_connections: int = 10,
+    ):
+        self.host = host
+        self.access_key = access_key
+        self.access_secret = access_secret
+        self.protocol = protocol
+        self.excerpt_sec = excerpt_sec
+        self.deadline_sec = deadline_sec
+        self.cache_max_entries = cache_max_entries
+        self.max_connections = max_connections
+        self._cache: "OrderedDict[str, object]" = OrderedDict()
+        self._client: Optional[httpx.AsyncClient] = None
 
-        string_to_sign = "\n".join(
-            ["POST", "/v1/identify", settings.ACR_ACCESS_KEY, data_type, signature_version, str(timestamp)]
-        )
+    @property
+    def enabled(self) -> bool:
+        return bool(self.host and self.access_key and self.access_secret)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.deadline_sec),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
-        sign = base64.b64encode(
-            hmac.new(
-                settings.ACR_ACCESS_SECRET.encode("utf-8"),
-                string_to_sign.encode("utf-8"),
-                digestmod=hashlib.sha1,
-            ).digest()
-        ).decode("utf-8")
+    def _cache_get(self, key: str) -> object:
+        value = self._cache.get(key)
+        if value is not None:
+            self._cache.move_to_end(key)
+        return value
 
+    def _cache_put(self, key: str, value: object) -> None:
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_max_entries:
+            self._cache.popitem(last=False)
+
+    async def _excerpt(self, audio_path: Path) -> Tuple[str, bytes, str]:
+        """First `excerpt_sec` seconds as mono 8 kHz WAV; the whole file if ffmpeg fails."""
+        proc = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-v", "error", "-i", str(audio_path),
+            "-t", str(self.excerpt_sec), "-ac", "1", "-ar", "8000",
+            "-f", "wav", "-",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await proc.communicate()
+        except asyncio.CancelledError:
+            proc.kill()
+            raise
+        if proc.returncode == 0 and stdout:
+            return f"{audio_path.stem}.wav", stdout, "audio/wav"
+        logger.warning(
+            f"ACR excerpt failed, uploading whole file: {stderr.decode(errors='ignore')[:200]}"
+        )
+        data = await asyncio.to_thread(audio_path.read_bytes)
+        return audio_path.name, data, "audio/mpeg"
+
+    async def _identify_uncached(self, audio_path: Path) -> Tuple[bool, Optional[dict]]:
+        name, sample, content_type = await self._excerpt(audio_path)
+        timestamp = int(time.time())
         files = {
-            "sample": (audio_path.name, audio_path.read_bytes(), "audio/mpeg"),
-            "access_key": (None, settings.ACR_ACCESS_KEY),
-            "data_type": (None, data_type),
-            "signature_version": (None, signature_version),
-            "signature": (None, sign),
+            "sample": (name, sample, content_type),
+            "access_key": (None, self.access_key),
+            "data_type": (None, "audio"),
+            "signature_version": (None, "1"),
+            "signature": (None, _sign(self.access_key, self.access_secret, timestamp)),
             "timestamp": (None, str(timestamp)),
+            "sample_bytes": (None, str(len(sample))),
         }
+        url = f"{self.protocol}://{self.host}/v1/identify"
+        resp = await self._get_client().post(url, files=files)
+        resp.raise_for_status()
+        return _parse_result(resp.json())
 
-        url = f"https://{settings.ACR_HOST}/v1/identify"
-        with httpx.Client(timeout=30.0) as client:
-            resp = client.post(url, files=files)
-            resp.raise_for_status()
-            result = resp.json()
-
-        status_code = result.get("status", {}).get("code")
-        if status_code != 0:
-            logger.warning(f"ACR identify failed code={status_code} msg={result.get('status', {}).get('msg')}")
+    async def identify(
+        self, audio_path: Path, content_hash: Optional[str] = None
+    ) -> Optional[dict]:
+        """
+        Identify audio; returns dict with title/artist/album/acrid/score, or None
+        (not configured, no match, error, or deadline exceeded). `content_hash`
+        (sha256 of the file, e.g. computed during upload) avoids re-reading it.
+        """
+        if not self.enabled:
             return None
 
-        metadata = result.get("metadata", {})
-        music_list = metadata.get("music", [])
-        if not music_list:
+        key = content_hash
+        if key is None:
+            try:
+                key = await asyncio.to_thread(_content_hash, audio_path)
+            except OSError as e:
+                logger.error(f"ACR identify error: {e}")
+                return None
+        cached = self._cache_get(key)
+        record_cache("acr", cached is not None)
+        if cached is not None:
+            return None if cached is _NO_MATCH else cached
+
+        try:
+            cacheable, track = await asyncio.wait_for(
+                self._identify_uncached(audio_path), timeout=self.deadline_sec
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"ACR identify exceeded {self.deadline_sec}s deadline")
+            return None
+        except Exception as e:
+            logger.error(f"ACR identify error: {e}")
             return None
 
-        first = music_list[0]
-        return {
-            "title": first.get("title"),
-            "artist": ", ".join([a.get("name") for a in first.get("artists", []) if a.get("name")]),
-            "album": (first.get("album") or {}).get("name"),
-            "acrid": first.get("acrid"),
-            "score": first.get("score"),
-        }
-    except Exception as e:
-        logger.error(f"ACR identify error: {e}")
-        return None
+        if cacheable:
+            self._cache_put(key, track if track is not None else _NO_MATCH)
+        return track
+
+
+acr_identifier = AcrIdentifier(
+    host=settings.ACR_HOST,
+    access_key=settings.ACR_ACCESS_KEY,
+    access_secret=settings.ACR_ACCESS_SECRET,
+    protocol=settings.ACR_PROTOCOL,
+    excerpt_sec=settings.ACR_EXCERPT_SEC,
+    deadline_sec=settings.ACR_DEADLINE_SEC,
+    cache_max_entries=settings.ACR_CACHE_MAX_ENTRIES,
+    max_connections=settings.ACR_MAX_CONNECTIONS,
+)
+
 
+async def identify_audio(audio_path: Path, content_hash: Optional[str] = None) -> Optional[dict]:
+    """
+    Identify audio using ACRCloud.
+    Returns dict with title/artist/album if success, else None.
+    """
+    return await acr_identifier.identify(audio_path, content_hash)
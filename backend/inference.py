@@ -13,6 +13,7 @@ import pretty_midi
 import scipy.signal as signal
 
 from config import settings, ERROR_MESSAGES
+from metrics import stage_timer
 
 # BasicPitch older SciPy versions may miss signal.gaussian; patch using signal.windows if needed.
 try:
@@ -27,23 +28,25 @@ except AttributeError:  # pragma: no cover - defensive for deployed envs
         logger.error("Unable to patch scipy.signal.gaussian; BasicPitch may fail")
 
 
-def convert_to_wav(audio_path: Path) -> Path:
+def convert_to_wav(audio_path: Path, output_path: Optional[Path] = None) -> Path:
     """
     Convert audio file to WAV format using FFmpeg
     BasicPitch requires WAV, 22050Hz, mono
     
     Args:
         audio_path: Input audio file (m4a, mp3, wav, etc.)
+        output_path: Optional WAV path (default: input path with .wav suffix)
         
     Returns:
         Path to converted WAV file
     """
-    wav_path = audio_path.with_suffix('.wav')
+    wav_path = output_path or audio_path.with_suffix('.wav')
     
     # FFmpeg command: convert to 22050Hz mono WAV
     cmd = [
         'ffmpeg',
         '-i', str(audio_path),
+        '-t', str(settings.MAX_AUDIO_DURATION_SEC),  # Cut over-long input
         '-ar', '22050',           # Sample rate 22050Hz
         '-ac', '1',               # Mono
         '-y',                     # Overwrite
@@ -52,12 +55,13 @@ def convert_to_wav(audio_path: Path) -> Path:
     
     try:
         logger.info(f"Converting {audio_path.name} to WAV...")
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            timeout=settings.FFMPEG_TIMEOUT,
-            check=True
-        )
+        with stage_timer("decode"):
+            result = subprocess.run(
+                cmd,
+                capture_output=True,
+                timeout=settings.FFMPEG_TIMEOUT,
+                check=True
+            )
         logger.success(f"Converted to WAV: {wav_path.name}")
         return wav_path
         
@@ -92,18 +96,21 @@ def extract_midi_from_audio(audio_path: Path) -> Tuple[pretty_midi.PrettyMIDI, d
     
     try:
         # Load audio
-        y, sr = librosa.load(str(audio_path), sr=22050, mono=True)
+        y, sr = librosa.load(
+            str(audio_path), sr=22050, mono=True, duration=settings.MAX_AUDIO_DURATION_SEC
+        )
         duration = librosa.get_duration(y=y, sr=sr)
         logger.info(f"✓ Audio loaded: {duration:.2f}s at {sr}Hz")
         
         # Step 2: Extract pitch using PYIN (Probabilistic YIN)
         logger.info("Step 2: Extracting pitch...")
-        f0, voiced_flag, voiced_probs = librosa.pyin(
-            y, 
-            fmin=50, 
-            fmax=2000,
-            frame_length=2048
-        )
+        with stage_timer("pitch_tracking"):
+            f0, voiced_flag, voiced_probs = librosa.pyin(
+                y, 
+                fmin=50, 
+                fmax=2000,
+                frame_length=2048
+            )
         
         # Filter out low-confidence pitches
         f0_clean = f0.copy()
@@ -0,0 +1,258 @@
+"""
+Streaming upload ingest.
+Each upload chunk is written to the input file (in a worker thread), hashed,
+and piped into an ffmpeg decoder as it arrives, so decoding to the pipeline's
+22.05 kHz mono WAV overlaps the network transfer instead of following it.
+MultipartStream parses a multipart/form-data request body incrementally, so
+file chunks reach the decoder while the client is still uploading.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Deque, Dict, Optional, Tuple
+
+import multipart
+from multipart.multipart import parse_options_header
+from loguru import logger
+
+# ffmpeg stderr kept for the failure log; the rest is read and discarded so a
+# corrupt upload's error flood can't fill the pipe and stall the decoder
+STDERR_KEEP_BYTES = 4096
+
+
+@dataclass
+class StoredUpload:
+    size: int
+    sha256: str
+    decoded_path: Optional[Path] = None  # None: decode later from the stored file
+
+
+class StreamingIngest:
+    """
+    Stores an upload and, if `decoded_path` is given, decodes it on the fly
+    (first `max_duration_sec` seconds). If ffmpeg can't decode the stream from
+    a pipe, or stops reading it for `drain_timeout_sec`, decoded_path is left
+    unset and the pipeline decodes the stored file.
+    """
+
+    def __init__(
+        self,
+        input_path: Path,
+        decoded_path: Optional[Path] = None,
+        max_duration_sec: Optional[float] = None,
+        drain_timeout_sec: float = 10.0,
+    ):
+        self.input_path = input_path
+        self.decoded_path = decoded_path
+        self.max_duration_sec = max_duration_sec
+        self.drain_timeout_sec = drain_timeout_sec
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._file: Optional[BinaryIO] = None
+        self._proc: Optional[asyncio.subprocess.Process] = None
+        self._stderr_task: Optional[asyncio.Task] = None
+        self._decoder_open = False
+
+    async def start(self) -> None:
+        self._file = await asyncio.to_thread(self.input_path.open, "wb")
+        if self.decoded_path is None:
+            return
+        cmd = ["ffmpeg", "-v", "error", "-i", "pipe:0"]
+        if self.max_duration_sec:
+            cmd += ["-t", str(self.max_duration_sec)]
+        cmd += ["-ar", "22050", "-ac", "1", "-y", str(self.decoded_path)]
+        try:
+            self._proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            self._stderr_task = asyncio.create_task(self._read_stderr())
+            self._decoder_open = True
+        except FileNotFoundError:
+            logger.warning("ffmpeg not found; decoding after upload instead")
+
+    async def _read_stderr(self) -> bytes:
+        kept = bytearray()
+        while True:
+            data = await self._proc.stderr.read(65536)
+            if not data:
+                return bytes(kept)
+            kept += data[: STDERR_KEEP_BYTES - len(kept)]
+
+    async def _feed_decoder(self, chunk: bytes) -> None:
+        if not self._decoder_open:
+            return
+        try:
+            self._proc.stdin.write(chunk)
+            await asyncio.wait_for(self._proc.stdin.drain(), timeout=self.drain_timeout_sec)
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg stopped reading: reached max_duration_sec, or failed
+            self._decoder_open = False
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"ffmpeg stopped reading {self.input_path.name} for "
+                f"{self.drain_timeout_sec}s; decoding from file instead"
+            )
+            self._decoder_open = False
+            self._proc.kill()
+
+    async def feed(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        self._hash.update(chunk)
+        await asyncio.gather(
+            asyncio.to_thread(self._file.write, chunk),
+            self._feed_decoder(chunk),
+        )
+
+    async def finish(self) -> StoredUpload:
+        await asyncio.to_thread(self._file.close)
+        decoded = None
+        if self._proc is not None:
+            if self._decoder_open:
+                self._decoder_open = False
+                try:
+                    self._proc.stdin.close()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+            stderr = await self._stderr_task
+            await self._proc.wait()
+            if self._proc.returncode == 0 and self.decoded_path.exists():
+                decoded = self.decoded_path
+            else:
+                logger.info(
+                    f"Streaming decode of {self.input_path.name} failed "
+                    f"({stderr.decode(errors='ignore').strip()[:200]}); decoding from file instead"
+                )
+                self.decoded_path.unlink(missing_ok=True)
+        return StoredUpload(size=self.size, sha256=self._hash.hexdigest(), decoded_path=decoded)
+
+    async def abort(self) -> None:
+        """Stop decoding and remove everything written so far."""
+        if self._file is not None and not self._file.closed:
+            await asyncio.to_thread(self._file.close)
+        if self._proc is not None and self._proc.returncode is None:
+            self._proc.kill()
+            await self._proc.wait()
+        if self._stderr_task is not None:
+            self._stderr_task.cancel()
+        self.input_path.unlink(missing_ok=True)
+        if self.decoded_path is not None:
+            self.decoded_path.unlink(missing_ok=True)
+
+
+class MultipartStream:
+    """
+    Incremental multipart/form-data parser over an ASGI body stream.
+    Text fields are collected in `fields`; file parts are consumed with
+    next_file() / file_chunks() as their bytes arrive.
+    """
+
+    def __init__(self, content_type: str, body: AsyncIterator[bytes]):
+        _, params = parse_options_header(content_type)
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise ValueError("Missing multipart boundary")
+        self.fields: Dict[str, str] = {}
+        self._body = body.__aiter__()
+        self._events: Deque[tuple] = deque()
+        self._done = False
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: Dict[bytes, bytes] = {}
+        self._part: Optional[Tuple[str, Optional[str]]] = None
+        self._field_value = bytearray()
+        self._parser = multipart.MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+            },
+        )
+
+    # ---------- parser callbacks ----------
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._field_value = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("latin-1")
+        filename = options.get(b"filename")
+        if filename is not None:
+            filename = filename.decode("utf-8", errors="replace")
+        self._part = (name, filename)
+        if filename is not None:
+            self._events.append(("file", self._part))
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._part and self._part[1] is not None:
+            self._events.append(("data", bytes(data[start:end])))
+        else:
+            self._field_value += data[start:end]
+
+    def _on_part_end(self) -> None:
+        if self._part and self._part[1] is not None:
+            self._events.append(("end", None))
+        elif self._part:
+            self.fields[self._part[0]] = self._field_value.decode("utf-8", errors="replace")
+        self._part = None
+
+    # ---------- consumption ----------
+
+    async def _next_event(self) -> Optional[tuple]:
+        while not self._events:
+            if self._done:
+                return None
+            try:
+                chunk = await self._body.__anext__()
+            except StopAsyncIteration:
+                self._parser.finalize()
+                self._done = True
+                continue
+            if chunk:
+                self._parser.write(chunk)
+        return self._events.popleft()
+
+    async def next_file(self) -> Optional[Tuple[str, str]]:
+        """Advance to the next file part; returns (field name, filename) or None."""
+        while (event := await self._next_event()) is not None:
+            if event[0] == "file":
+                return event[1]
+        return None
+
+    async def file_chunks(self) -> AsyncIterator[bytes]:
+        """Bytes of the current file part, as they arrive."""
+        while (event := await self._next_event()) is not None:
+            if event[0] == "data":
+                yield event[1]
+            elif event[0] == "end":
+                return
+
+    async def finish(self) -> Dict[str, str]:
+        """Read the rest of the body; returns all text fields."""
+        while await self._next_event() is not None:
+            pass
+        return self.fields
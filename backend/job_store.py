@@ -0,0 +1,273 @@
+"""
+Durable job store backed by SQLite (WAL mode).
+Jobs survive restarts / machine suspend and can be shared by several uvicorn workers.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+FINISHED_STATUSES = ("complete", "error")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    user_id TEXT,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    data TEXT NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_updated ON jobs(status, updated_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_updated ON jobs(updated_at);
+"""
+
+# Columns added after the first schema version (name, SQL type)
+_LATE_COLUMNS = (
+    ("lease_owner", "TEXT"),
+    ("lease_expires", "REAL"),
+    ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+
+def open_sqlite(db_path: Path) -> sqlite3.Connection:
+    """Open a WAL-mode SQLite connection in autocommit mode (explicit BEGIN for transactions)."""
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path), timeout=5.0, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+class JobStore:
+    """
+    Job repository persisted in a single SQLite file.
+
+    Reads go through a small per-process cache (short TTL so other workers'
+    writes become visible quickly); writes are read-modify-write transactions.
+    Cached job dicts are shared: callers must treat `get()` results as read-only
+    and use `update()` to change a job.
+    """
+
+    def __init__(self, db_path: Path, cache_ttl_sec: float = 0.5):
+        self.db_path = Path(db_path)
+        self.cache_ttl_sec = cache_ttl_sec
+        self._local = threading.local()
+        self._cache: Dict[str, Tuple[float, dict]] = {}
+        self._cache_lock = threading.Lock()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    # ---------------------------------------------
+    # Connection handling
+    # ---------------------------------------------
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        conn = open_sqlite(self.db_path)
+        with self._schema_lock:
+            if not self._schema_ready:
+                conn.executescript(_SCHEMA)
+                existing = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+                for name, sql_type in _LATE_COLUMNS:
+                    if name not in existing:
+                        conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {sql_type}")
+                self._schema_ready = True
+        self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        """Close the connection owned by the calling thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ---------------------------------------------
+    # Cache helpers
+    # ---------------------------------------------
+
+    def _cache_get(self, job_id: str) -> Optional[dict]:
+        with self._cache_lock:
+            entry = self._cache.get(job_id)
+            if entry is None:
+                return None
+            expires_at, job = entry
+            if expires_at < time.monotonic():
+                self._cache.pop(job_id, None)
+                return None
+            return job
+
+    def _cache_put(self, job: dict) -> None:
+        with self._cache_lock:
+            self._cache[job["job_id"]] = (time.monotonic() + self.cache_ttl_sec, job)
+
+    def _cache_drop(self, job_id: Optional[str] = None) -> None:
+        with self._cache_lock:
+            if job_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(job_id, None)
+
+    # ---------------------------------------------
+    # Public API
+    # ---------------------------------------------
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Return a job (read-only view) or None."""
+        cached = self._cache_get(job_id)
+        if cached is not None:
+            return cached
+        row = self._conn().execute(
+            "SELECT data FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = json.loads(row[0])
+        self._cache_put(job)
+        return job
+
+    def put(self, job: dict) -> None:
+        """Insert or replace a job."""
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO jobs (job_id, user_id, status, created_at, updated_at, data) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                job["job_id"],
+                job.get("user_id"),
+                job.get("status", "queued"),
+                now,
+                now,
+                json.dumps(job),
+            ),
+        )
+        self._cache_put(job)
+
+    def update(self, job_id: str, mutate: Callable[[dict], None]) -> Optional[dict]:
+        """
+        Atomically apply `mutate(job)` to the stored job.
+        Returns the updated job, or None if the job does not exist.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT data FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                self._cache_drop(job_id)
+                return None
+            job = json.loads(row[0])
+            mutate(job)
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, data = ? WHERE job_id = ?",
+                (job.get("status", "queued"), time.time(), json.dumps(job), job_id),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._cache_put(job)
+        return job
+
+    def list_by_status(self, status: str) -> List[dict]:
+        """Return all jobs with the given status (oldest update first)."""
+        rows = self._conn().execute(
+            "SELECT data FROM jobs WHERE status = ? ORDER BY updated_at", (status,)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def purge_finished(self, max_age_sec: float) -> int:
+        """Delete finished jobs not updated for `max_age_sec` (single indexed delete)."""
+        cutoff = time.time() - max_age_sec
+        placeholders = ",".join("?" for _ in FINISHED_STATUSES)
+        cursor = self._conn().execute(
+            f"DELETE FROM jobs WHERE status IN ({placeholders}) AND updated_at < ?",
+            (*FINISHED_STATUSES, cutoff),
+        )
+        removed = cursor.rowcount or 0
+        if removed:
+            self._cache_drop()
+            logger.info(f"Purged {removed} finished jobs from store")
+        return removed
+
+    # ---------------------------------------------
+    # Runner leases (crash-resumable jobs)
+    # ---------------------------------------------
+
+    def acquire_lease(
+        self, job_id: str, owner: str, ttl_sec: float, attempt: bool = False
+    ) -> bool:
+        """
+        Take (or renew) the run lease of a job unless another live runner holds it.
+        With `attempt`, the job's run counter is incremented with the lease.
+        """
+        now = time.time()
+        cursor = self._conn().execute(
+            "UPDATE jobs SET lease_owner = ?, lease_expires = ?, attempts = attempts + ? "
+            "WHERE job_id = ? AND (lease_owner IS NULL OR lease_owner = ? OR lease_expires < ?)",
+            (owner, now + ttl_sec, int(attempt), job_id, owner, now),
+        )
+        return cursor.rowcount == 1
+
+    def attempts(self, job_id: str) -> int:
+        """Runs started for a job (first start plus every resume)."""
+        row = self._conn().execute(
+            "SELECT attempts FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return int(row[0]) if row else 0
+
+    def renew_leases(self, owner: str, ttl_sec: float) -> int:
+        """Extend every lease held by `owner`; returns the number of leases renewed."""
+        cursor = self._conn().execute(
+            "UPDATE jobs SET lease_expires = ? WHERE lease_owner = ?",
+            (time.time() + ttl_sec, owner),
+        )
+        return cursor.rowcount or 0
+
+    def release_lease(self, job_id: str, owner: str) -> None:
+        self._conn().execute(
+            "UPDATE jobs SET lease_owner = NULL, lease_expires = NULL "
+            "WHERE job_id = ? AND lease_owner = ?",
+            (job_id, owner),
+        )
+
+    def release_leases(self, owner: str) -> None:
+        """Drop all leases of `owner` (graceful shutdown: lets the next runner resume at once)."""
+        self._conn().execute(
+            "UPDATE jobs SET lease_owner = NULL, lease_expires = NULL WHERE lease_owner = ?",
+            (owner,),
+        )
+
+    def claim_orphaned(self, owner: str, ttl_sec: float, status: str = "running") -> List[dict]:
+        """
+        Claim jobs left in `status` without a live runner (process died, machine stopped).
+        Each claim counts as a new attempt (see attempts()). Returns the claimed jobs.
+        """
+        rows = self._conn().execute(
+            "SELECT job_id FROM jobs WHERE status = ? "
+            "AND (lease_owner IS NULL OR lease_expires < ?)",
+            (status, time.time()),
+        ).fetchall()
+        claimed = []
+        for (job_id,) in rows:
+            if self.acquire_lease(job_id, owner, ttl_sec, attempt=True):
+                self._cache_drop(job_id)
+                job = self.get(job_id)
+                if job is not None:
+                    claimed.append(job)
+        return claimed
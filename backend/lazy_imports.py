@@ -0,0 +1,101 @@
+"""
+Deferred imports for the audio/ML pipeline modules.
+`inference`, `separation`, `arranger`, `render` and `pretty_midi` pull in
+scipy.signal, librosa, numba and PIL; importing them at app load delays the
+first /health answer after a cold start. app.py holds them as LazyModule
+proxies, loaded together in a worker thread by the startup task (or by the
+first job that needs them), and reports readiness once they are in.
+
+Import-time report for a cold process:
+    python lazy_imports.py
+"""
+from __future__ import annotations
+
+import asyncio
+import importlib
+import threading
+import time
+from types import ModuleType
+from typing import Dict, Optional
+
+
+class LazyModule:
+    """Module proxy imported on first attribute access (or load())."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.import_sec: Optional[float] = None
+        self._module: Optional[ModuleType] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def load(self) -> ModuleType:
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(self.name)
+                    self.import_sec = time.perf_counter() - started
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
+
+
+class LazyModules:
+    """Modules loaded together off the event loop; awaited before first use."""
+
+    def __init__(self, *modules: LazyModule):
+        self.modules = modules
+        self.load_sec: Optional[float] = None
+        self._loading: Optional[asyncio.Future] = None
+
+    @property
+    def ready(self) -> bool:
+        return all(module.loaded for module in self.modules)
+
+    def load_all(self) -> None:
+        started = time.perf_counter()
+        for module in self.modules:
+            module.load()
+        if self.load_sec is None:
+            self.load_sec = time.perf_counter() - started
+
+    async def ensure_loaded(self) -> None:
+        """Import the modules in a worker thread (once; concurrent callers share it)."""
+        if self.ready:
+            return
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(asyncio.to_thread(self.load_all))
+        try:
+            await asyncio.shield(self._loading)
+        except Exception:
+            self._loading = None  # let the next caller retry (and surface the error)
+            raise
+
+    def report(self) -> Dict[str, Optional[float]]:
+        """Seconds spent importing each module (cumulative: shared deps count once)."""
+        return {
+            module.name: round(module.import_sec, 4) if module.import_sec is not None else None
+            for module in self.modules
+        }
+
+
+def main() -> None:
+    started = time.perf_counter()
+    import app
+
+    app_import = time.perf_counter() - started
+    app.pipeline_modules.load_all()
+    print(f"{'app (HTTP layer)':<24} {app_import:8.3f}s")
+    for name, seconds in app.pipeline_modules.report().items():
+        print(f"{name:<24} {seconds:8.3f}s")
+    print(f"{'pipeline total':<24} {app.pipeline_modules.load_sec:8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+On-demand level videos.
+
+With LAZY_VIDEO_RENDER, jobs only save each level's arranged MIDI
+({job_id}_L{n}.mid, plus a {job_id}_L{n}.render.json spec) and still publish
+video_url. The first request for {job_id}_L{n}_full.mp4 (or its _preview.mp4)
+renders the level from that MIDI, so levels nobody opens are never rendered:
+
+- concurrent requests for one level wait on the same render (coalescing)
+- renders run on a pool of LAZY_RENDER_WORKERS threads; with
+  LAZY_RENDER_MAX_PENDING levels rendering or queued, requests get a 503
+- rendered levels are kept within LAZY_RENDER_CACHE_MB, least recently served
+  evicted first; their MIDI stays, so an evicted level renders again
+- a failed render is remembered for LAZY_RENDER_FAILURE_TTL_SEC: requests in
+  that window get a 500 without rendering again
+
+The cache only knows levels rendered by this process; after a restart their
+files are left to the media retention sweep.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.staticfiles import StaticFiles
+from loguru import logger
+
+from metrics import LAZY_RENDERS
+
+# {job_id}_L{n}_full.mp4 / {job_id}_L{n}_full_preview.mp4 (job ids: see media_layout)
+LAZY_VIDEO_RE = re.compile(
+    r"^(?P<job_id>\d+_[0-9a-f]{32})_L(?P<level>[1-4])_full(?:_preview)?\.mp4$"
+)
+
+LevelKey = Tuple[str, int]
+
+
+def level_source(video_path: Path) -> Optional[Tuple[LevelKey, Path]]:
+    """((job_id, level), arranged MIDI) a level video is rendered from, if it is one."""
+    match = LAZY_VIDEO_RE.match(video_path.name)
+    if match is None:
+        return None
+    job_id, level = match.group("job_id"), int(match.group("level"))
+    return (job_id, level), video_path.with_name(f"{job_id}_L{level}.mid")
+
+
+def render_spec_path(midi_path: Path) -> Path:
+    return midi_path.with_suffix(".render.json")
+
+
+def write_render_spec(
+    midi_path: Path, with_audio: bool, encoder_profiles: Optional[Dict[str, str]] = None
+) -> Path:
+    """
+    Render options for a level rendered later (the job record may be gone by
+    then); rewritten with the encoder_profiles once the level is rendered.
+    """
+    spec: dict = {"with_audio": with_audio}
+    if encoder_profiles:
+        spec["encoder_profiles"] = encoder_profiles
+    path = render_spec_path(midi_path)
+    path.write_text(json.dumps(spec))
+    return path
+
+
+def read_render_spec(midi_path: Path) -> dict:
+    try:
+        return json.loads(render_spec_path(midi_path).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+class LazyVideoRenderer:
+    """
+    Materializes level videos on request. `render_level(job_id, level)` renders
+    one level (blocking, on the pool) and returns the files it wrote;
+    `delete_files(paths)` removes evicted ones.
+    """
+
+    def __init__(
+        self,
+        render_level: Callable[[str, int], List[Path]],
+        workers: int,
+        max_pending: int,
+        cache_budget_mb: float,
+        delete_files: Optional[Callable[[List[Path]], object]] = None,
+        failure_ttl_sec: float = 0.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.render_level = render_level
+        self.max_pending = max_pending
+        self.cache_budget_bytes = int(cache_budget_mb * 1024 * 1024)
+        self.delete_files = delete_files or _unlink_all
+        self.failure_ttl_sec = failure_ttl_sec
+        self.clock = clock
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lazy-render")
+        self._inflight: Dict[LevelKey, asyncio.Future] = {}
+        # Rendered levels, least recently served first: key -> (files, bytes)
+        self._cache: "OrderedDict[LevelKey, Tuple[List[Path], int]]" = OrderedDict()
+        # Levels whose last render failed: key -> clock time the failure expires
+        self._failed: Dict[LevelKey, float] = {}
+
+    @property
+    def pending(self) -> int:
+        return len(self._inflight)
+
+    @property
+    def cached_bytes(self) -> int:
+        return sum(size for _, size in self._cache.values())
+
+    async def materialize(self, video_path: Path) -> None:
+        """
+        Make `video_path` servable: wait for its level's render if one is
+        running, or start one if the video is missing but its MIDI exists.
+        Anything else (other files, unknown levels) is left to the caller.
+        """
+        source = level_source(video_path)
+        if source is None:
+            return
+        key, midi_path = source
+        pending = self._inflight.get(key)
+        if pending is not None:
+            LAZY_RENDERS.inc(result="coalesced")
+        elif video_path.is_file():
+            if key in self._cache:
+                self._cache.move_to_end(key)
+            return
+        elif not midi_path.is_file():
+            return
+        elif self._failed.get(key, float("-inf")) > self.clock():
+            LAZY_RENDERS.inc(result="failure_cached")
+            raise HTTPException(status_code=500, detail="Video rendering failed")
+        elif len(self._inflight) >= self.max_pending:
+            LAZY_RENDERS.inc(result="rejected")
+            raise HTTPException(
+                status_code=503,
+                detail="Too many videos rendering, retry shortly",
+                headers={"Retry-After": "5"},
+            )
+        else:
+            logger.info(f"Rendering {key[0]} level {key[1]} on demand")
+            pending = asyncio.get_running_loop().run_in_executor(
+                self._pool, self.render_level, *key
+            )
+            self._inflight[key] = pending
+            pending.add_done_callback(lambda done: self._finished(key, done))
+        try:
+            # Shielded: a client hanging up must not cancel the render for the others
+            await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            if not pending.cancelled():
+                raise  # this request was cancelled, not the render
+            raise HTTPException(
+                status_code=503,
+                detail="Video rendering was interrupted, retry shortly",
+                headers={"Retry-After": "5"},
+            )
+        except Exception:
+            raise HTTPException(status_code=500, detail="Video rendering failed")
+
+    def _finished(self, key: LevelKey, done: asyncio.Future) -> None:
+        del self._inflight[key]
+        if done.cancelled():
+            # Pool shut down before the render started
+            LAZY_RENDERS.inc(result="cancelled")
+            logger.warning(f"On-demand render of {key[0]} level {key[1]} was cancelled")
+            return
+        if done.exception() is not None:
+            LAZY_RENDERS.inc(result="failed")
+            now = self.clock()
+            self._failed = {k: until for k, until in self._failed.items() if until > now}
+            self._failed[key] = now + self.failure_ttl_sec
+            logger.error(f"On-demand render of {key[0]} level {key[1]} failed: {done.exception()}")
+            return
+        self._failed.pop(key, None)
+        LAZY_RENDERS.inc(result="rendered")
+        files = [path for path in done.result() if path.is_file()]
+        self._cache[key] = (files, sum(path.stat().st_size for path in files))
+        self._evict(keep=key)
+
+    def _evict(self, keep: LevelKey) -> None:
+        total = self.cached_bytes
+        for key in list(self._cache):
+            if total <= self.cache_budget_bytes:
+                break
+            if key == keep:
+                continue
+            files, size = self._cache.pop(key)
+            self.delete_files(files)
+            total -= size
+            LAZY_RENDERS.inc(result="evicted")
+            logger.info(f"Evicted on-demand videos of {key[0]} level {key[1]} ({size} bytes)")
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _unlink_all(paths: Iterable[Path]) -> None:
+    for path in paths:
+        path.unlink(missing_ok=True)
+
+
+class LazyMediaFiles(StaticFiles):
+    """StaticFiles that renders missing level videos under out/ before serving them."""
+
+    def __init__(self, *args, renderer: LazyVideoRenderer, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.renderer = renderer
+
+    async def get_response(self, path: str, scope):
+        if path.startswith("out/") and self.directory is not None:
+            await self.renderer.materialize(Path(self.directory) / path)
+        return await super().get_response(path, scope)
@@ -0,0 +1,388 @@
+"""
+Load test: drives the real FastAPI app through create -> start -> progress
+polling at a configurable arrival rate, with no Firebase or ACRCloud account.
+
+- Auth: get_current_user is replaced by a local verifier (FirebaseTokenVerifier
+  with a fake decoder), so bearer tokens still go through the claims cache.
+- Identification: the app's ACR client points at a local acr_stub server.
+- The app runs in-process over ASGI (startup/shutdown handlers included), in
+  the same event loop as a lag probe, so loop lag is the app's loop lag.
+- Media and the job/document databases go to a temporary directory (or
+  --media-dir), never to the app's real MEDIA_DIR.
+
+    python loadtest.py --rate 0.5 --duration 60
+    python loadtest.py --jobs 20 --rate 2 --level-mix 1:0.6 1,2,3,4:0.4 --out load.json
+
+Reports p50/p95/p99 job latency (create request to complete), overall and per
+level set, the latency of jobs that ended in error separately, throughput,
+rejected requests and event-loop lag.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence
+
+import numpy as np
+import soundfile as sf
+
+from acr_stub import DEFAULT_MATCH, AcrStubServer
+
+if TYPE_CHECKING:
+    from auth_cache import TokenClaimsCache
+
+NO_MATCH = {"status": {"code": 1001, "msg": "No result"}}
+TOKEN_PREFIX = "loadtest-"
+FINAL_STATUSES = {"complete", "error"}
+
+# Settings whose defaults derive from MEDIA_DIR at class definition: each one is set
+MEDIA_PATH_SETTINGS = {
+    "MEDIA_DIR": ".",
+    "INPUT_DIR": "in",
+    "OUTPUT_DIR": "out",
+    "SONG_LIBRARY_DIR": "library",
+    "JOBS_DB_PATH": "jobs.sqlite3",
+    "PERSISTENCE_SQLITE_PATH": "documents.sqlite3",
+}
+
+
+@dataclass
+class JobSample:
+    index: int
+    levels: str
+    job_id: Optional[str] = None
+    status: str = "pending"  # complete | error | rejected | timeout
+    http_status: Optional[int] = None
+    rejected_at: Optional[str] = None  # create | start | progress
+    create_sec: Optional[float] = None
+    start_sec: Optional[float] = None
+    latency_sec: Optional[float] = None
+
+
+@dataclass
+class LoadConfig:
+    rate: float = 0.5  # job arrivals per second (Poisson)
+    duration_sec: float = 60.0
+    jobs: Optional[int] = None  # stop after this many arrivals instead
+    level_mix: Dict[str, float] = field(default_factory=lambda: {"1,2,3,4": 1.0})
+    clip_sec: float = 8.0
+    users: int = 10
+    with_audio: bool = False
+    poll_interval_sec: float = 0.5
+    job_timeout_sec: float = 600.0
+    acr_delay_sec: float = 0.2
+    acr_match: bool = False  # a match makes repeat jobs song-library hits
+    seed: int = 0
+    keep_files: bool = False
+
+
+def percentiles(values: Sequence[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99/max/mean (nearest rank); None when there are no values."""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None, "mean": None}
+    ordered = sorted(values)
+
+    def rank(fraction: float) -> float:
+        return ordered[max(0, min(len(ordered) - 1, int(np.ceil(fraction * len(ordered))) - 1))]
+
+    return {
+        "p50": round(rank(0.50), 4),
+        "p95": round(rank(0.95), 4),
+        "p99": round(rank(0.99), 4),
+        "max": round(ordered[-1], 4),
+        "mean": round(sum(ordered) / len(ordered), 4),
+    }
+
+
+def parse_level_mix(items: Sequence[str]) -> Dict[str, float]:
+    """["1:0.6", "1,2,3,4:0.4"] -> {"1": 0.6, "1,2,3,4": 0.4}"""
+    mix = {}
+    for item in items:
+        levels, _, weight = item.partition(":")
+        parsed = [int(level) for level in levels.split(",")]
+        if not parsed or not all(1 <= level <= 4 for level in parsed):
+            raise ValueError(f"Invalid level set: {levels}")
+        mix[",".join(str(level) for level in parsed)] = float(weight or 1.0)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("Level mix needs at least one positive weight")
+    return mix
+
+
+def isolate_media(media_dir: Path) -> None:
+    """Point the app's media volume and databases at `media_dir`; call before importing app."""
+    if "config" in sys.modules:
+        raise RuntimeError("isolate_media() must run before the app settings are loaded")
+    for name, relative in MEDIA_PATH_SETTINGS.items():
+        os.environ[name] = str((Path(media_dir) / relative).resolve())
+
+
+def _upload_wav(index: int, clip_sec: float, seed: int) -> bytes:
+    """A melody clip made unique per job (ACR / library caches key on content)."""
+    from synth import SAMPLE_RATE, synth_clip
+
+    rng = np.random.default_rng(seed * 100003 + index)
+    kind = ("piano", "sine")[index % 2]  # monophonic: the pitch tracker rejects chords
+    audio = synth_clip(kind, clip_sec) + 1e-3 * rng.standard_normal(int(clip_sec * SAMPLE_RATE))
+    buffer = io.BytesIO()
+    sf.write(buffer, audio.astype(np.float32), SAMPLE_RATE, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+async def _probe_loop_lag(samples: List[float], interval_sec: float = 0.05) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval_sec
+        await asyncio.sleep(interval_sec)
+        samples.append(max(0.0, loop.time() - expected))
+
+
+def _install_local_auth(app_module) -> "TokenClaimsCache":
+    """Bearer tokens `loadtest-<uid>` verified locally (through a claims cache)."""
+    from fastapi import Header, HTTPException
+
+    from auth_cache import FirebaseTokenVerifier, PublicKeySet, TokenClaimsCache
+
+    def fake_decode(token: str) -> dict:
+        if not token.startswith(TOKEN_PREFIX):
+            raise ValueError("Not a load-test token")
+        return {"uid": token[len(TOKEN_PREFIX):], "exp": time.time() + 3600}
+
+    verifier = FirebaseTokenVerifier(
+        key_set=PublicKeySet(fetch=lambda url: ({}, 0.0)),
+        project_id=None,  # no signing keys: every miss goes to the fallback
+        cache=TokenClaimsCache(),
+        fallback=fake_decode,
+    )
+
+    def local_user(authorization: str = Header(None)) -> dict:
+        if not authorization or not authorization.lower().startswith("bearer "):
+            raise HTTPException(status_code=401, detail="Missing Authorization Bearer token")
+        try:
+            return verifier.verify(authorization.split(" ", 1)[1].strip())
+        except ValueError:
+            raise HTTPException(status_code=401, detail="Invalid token")
+
+    app_module.app.dependency_overrides[app_module.get_current_user] = local_user
+    return verifier.cache
+
+
+def _reject(sample: JobSample, stage: str, http_status: int) -> None:
+    sample.status, sample.rejected_at, sample.http_status = "rejected", stage, http_status
+
+
+async def _run_job(client, config: LoadConfig, sample: JobSample) -> None:
+    headers = {"Authorization": f"Bearer {TOKEN_PREFIX}user{sample.index % config.users}"}
+    audio = await asyncio.to_thread(_upload_wav, sample.index, config.clip_sec, config.seed)
+    form = {"levels": sample.levels, "with_audio": str(config.with_audio).lower()}
+    started = time.perf_counter()
+
+    files = {"audio": (f"load{sample.index}.wav", audio, "audio/wav")}
+    response = await client.post("/jobs", headers=headers, files=files, data=form)
+    sample.create_sec = round(time.perf_counter() - started, 4)
+    if response.status_code != 200:
+        _reject(sample, "create", response.status_code)
+        return
+    sample.job_id = response.json()["job_id"]
+
+    start_requested = time.perf_counter()
+    response = await client.post(f"/jobs/{sample.job_id}/start", headers=headers, data=form)
+    sample.start_sec = round(time.perf_counter() - start_requested, 4)
+    if response.status_code != 200:
+        _reject(sample, "start", response.status_code)
+        return
+
+    status = response.json()["status"]
+    while status not in FINAL_STATUSES:
+        if time.perf_counter() - started > config.job_timeout_sec:
+            sample.status = "timeout"
+            return
+        await asyncio.sleep(config.poll_interval_sec)
+        response = await client.get(f"/jobs/{sample.job_id}/progress", headers=headers)
+        if response.status_code != 200:
+            _reject(sample, "progress", response.status_code)
+            return
+        status = response.json()["status"]
+    sample.status = status
+    sample.latency_sec = round(time.perf_counter() - started, 4)
+
+
+async def run_load(config: LoadConfig) -> dict:
+    import httpx
+
+    import app as app_module
+    from identify import acr_identifier
+
+    rng = random.Random(config.seed)
+    level_sets = list(config.level_mix)
+    weights = [config.level_mix[levels] for levels in level_sets]
+    samples: List[JobSample] = []
+    lag_samples: List[float] = []
+
+    with AcrStubServer(
+        delay_sec=config.acr_delay_sec, response=DEFAULT_MATCH if config.acr_match else NO_MATCH
+    ) as stub:
+        acr_identifier.host, acr_identifier.protocol = stub.host, "http"
+        acr_identifier.access_key, acr_identifier.access_secret = "loadtest", "loadtest"
+        token_cache = _install_local_auth(app_module)
+
+        await app_module.app.router.startup()
+        # Measure the warm steady state: wait for the startup import + warmup
+        while not app_module.pipeline_ready():
+            await asyncio.sleep(0.1)
+        lag_probe = asyncio.create_task(_probe_loop_lag(lag_samples))
+        transport = httpx.ASGITransport(app=app_module.app)
+        tasks: List[asyncio.Task] = []
+        run_started = time.perf_counter()
+        try:
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://loadtest", timeout=None
+            ) as client:
+                while True:
+                    elapsed = time.perf_counter() - run_started
+                    if config.jobs is not None and len(samples) >= config.jobs:
+                        break
+                    if config.jobs is None and elapsed >= config.duration_sec:
+                        break
+                    levels = rng.choices(level_sets, weights)[0]
+                    sample = JobSample(index=len(samples), levels=levels)
+                    samples.append(sample)
+                    tasks.append(asyncio.create_task(_run_job(client, config, sample)))
+                    await asyncio.sleep(rng.expovariate(config.rate))
+                arrivals_sec = time.perf_counter() - run_started
+                await asyncio.gather(*tasks)
+            wall_sec = time.perf_counter() - run_started
+        finally:
+            lag_probe.cancel()
+            if not config.keep_files:
+                for sample in samples:
+                    if sample.job_id:
+                        await asyncio.to_thread(
+                            app_module.artifact_index.delete_job, sample.job_id
+                        )
+            await app_module.app.router.shutdown()
+            app_module.app.dependency_overrides.clear()
+        identify_calls = len(stub.sample_sizes)
+
+    report = build_report(config, samples, lag_samples, wall_sec, arrivals_sec, identify_calls)
+    report["auth_cache"] = token_cache.stats()
+    return report
+
+
+def build_report(
+    config: LoadConfig,
+    samples: List[JobSample],
+    lag_samples: List[float],
+    wall_sec: float,
+    arrivals_sec: float,
+    identify_calls: int = 0,
+) -> dict:
+    by_status: Dict[str, int] = {}
+    for sample in samples:
+        by_status[sample.status] = by_status.get(sample.status, 0) + 1
+    # Failed jobs can end early (or late): they are kept out of the latency figures
+    completed = [s for s in samples if s.status == "complete"]
+    failed = [s for s in samples if s.status == "error"]
+    rejected: Dict[str, int] = {}
+    for sample in samples:
+        if sample.rejected_at:
+            key = f"{sample.rejected_at}:{sample.http_status}"
+            rejected[key] = rejected.get(key, 0) + 1
+    by_levels = {
+        levels: percentiles([s.latency_sec for s in completed if s.levels == levels])
+        for levels in config.level_mix
+    }
+    throughput = by_status.get("complete", 0) / wall_sec * 60 if wall_sec else 0.0
+    return {
+        "config": {key: value for key, value in asdict(config).items() if key != "keep_files"},
+        "wall_sec": round(wall_sec, 3),
+        "arrivals_sec": round(arrivals_sec, 3),
+        "jobs": {
+            "submitted": len(samples),
+            "by_status": by_status,
+            "rejected": rejected,
+            "identify_calls": identify_calls,
+        },
+        "throughput_jobs_per_min": round(throughput, 3),
+        "latency_sec": percentiles([s.latency_sec for s in completed]),
+        "latency_sec_by_levels": by_levels,
+        "error_latency_sec": percentiles([s.latency_sec for s in failed]),
+        "create_sec": percentiles([s.create_sec for s in samples if s.create_sec is not None]),
+        "start_sec": percentiles([s.start_sec for s in samples if s.start_sec is not None]),
+        "loop_lag_ms": {
+            key: (round(value * 1000, 2) if value is not None else None)
+            for key, value in percentiles(lag_samples).items()
+        },
+        "samples": [asdict(s) for s in samples],
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="ShazaPiano job load test (local auth + ACR stub)")
+    parser.add_argument("--rate", type=float, default=0.5, help="Job arrivals per second (Poisson)")
+    parser.add_argument("--duration", type=float, default=60.0, help="Arrival window in seconds")
+    parser.add_argument("--jobs", type=int, help="Number of jobs (overrides --duration)")
+    parser.add_argument("--level-mix", nargs="+", default=["1,2,3,4:1"],
+                        help="Weighted level sets, e.g. 1:0.6 1,2,3,4:0.4")
+    parser.add_argument("--clip-sec", type=float, default=8.0)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--with-audio", action="store_true")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--job-timeout", type=float, default=600.0)
+    parser.add_argument("--acr-delay", type=float, default=0.2, help="Stub identify latency")
+    parser.add_argument("--acr-match", action="store_true",
+                        help="Stub identifies every clip as the same known song")
+    parser.add_argument("--max-concurrent-jobs", type=int, help="Override MAX_CONCURRENT_JOBS")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--media-dir", help="Media and databases directory (default: temporary)")
+    parser.add_argument("--keep-files", action="store_true", help="Keep job media after the run")
+    parser.add_argument("--out", help="Write the full report (with per-job samples) as JSON")
+    args = parser.parse_args(argv)
+
+    if args.max_concurrent_jobs:
+        # Read by config.Settings when the app is imported
+        os.environ["MAX_CONCURRENT_JOBS"] = str(args.max_concurrent_jobs)
+
+    config = LoadConfig(
+        rate=args.rate,
+        duration_sec=args.duration,
+        jobs=args.jobs,
+        level_mix=parse_level_mix(args.level_mix),
+        clip_sec=args.clip_sec,
+        users=args.users,
+        with_audio=args.with_audio,
+        poll_interval_sec=args.poll_interval,
+        job_timeout_sec=args.job_timeout,
+        acr_delay_sec=args.acr_delay,
+        acr_match=args.acr_match,
+        seed=args.seed,
+        keep_files=args.keep_files,
+    )
+    media_dir = Path(args.media_dir or tempfile.mkdtemp(prefix="shazapiano-load-"))
+    isolate_media(media_dir)
+    try:
+        report = asyncio.run(run_load(config))
+    finally:
+        if args.keep_files:
+            print(f"Job media kept in {media_dir}", file=sys.stderr)
+        elif not args.media_dir:
+            shutil.rmtree(media_dir, ignore_errors=True)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    summary = {key: value for key, value in report.items() if key not in ("samples", "config")}
+    print(json.dumps(summary, indent=2))
+    return 0 if report["jobs"]["by_status"].get("complete") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""
+Event-loop lag monitor.
+A timer task measures how late the loop wakes it (LOOP_LAG_SECONDS). A
+watchdog thread notices when that timer is overdue by more than the block
+threshold: it logs the loop thread's stack once per stall and charges the
+stalled time to the task running on the loop (a stall with the loop idle in
+select() is GIL starvation by worker threads, charged to no task).
+LoopBlockMiddleware uses that to tag requests whose handler blocked the loop
+(X-Event-Loop-Blocked-Ms header, warning log, BLOCKING_REQUESTS counter).
+"""
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Optional
+
+from loguru import logger
+
+from metrics import BLOCKING_REQUESTS, LOOP_BLOCKS, LOOP_LAG_SECONDS
+
+_STACK_LIMIT = 25  # innermost frames kept per captured stack
+
+
+@dataclass
+class LoopBlock:
+    task: str
+    started_at: float  # time.time()
+    stack: str
+    duration_sec: float = 0.0
+
+
+class LoopMonitor:
+    def __init__(self, interval_sec: float = 0.1, threshold_sec: float = 0.25):
+        self.interval_sec = interval_sec
+        self.threshold_sec = threshold_sec
+        self.recent_blocks: Deque[LoopBlock] = deque(maxlen=20)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = time.monotonic()
+        self._blocked: "weakref.WeakKeyDictionary[asyncio.Task, float]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._episode: Optional[tuple] = None  # (task, LoopBlock, task total before the stall)
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def blocked_seconds(self, task: Optional[asyncio.Task]) -> float:
+        """Loop time a task has spent blocking the loop (stalls beyond the threshold)."""
+        return self._blocked.get(task, 0.0) if task is not None else 0.0
+
+    async def run(self) -> None:
+        """Sample loop lag until cancelled (also runs the watchdog thread)."""
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        try:
+            while True:
+                self._heartbeat = time.monotonic()
+                expected = loop.time() + self.interval_sec
+                await asyncio.sleep(self.interval_sec)
+                LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - expected))
+        finally:
+            self._stop.set()
+
+    # ---------- watchdog thread ----------
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval_sec):
+            stalled = time.monotonic() - self._heartbeat - self.interval_sec
+            if stalled < self.threshold_sec:
+                self._end_episode()
+                continue
+            try:
+                task = asyncio.current_task(self._loop)
+            except RuntimeError:
+                task = None
+            if self._episode is None or self._episode[0] is not task:
+                self._end_episode()
+                self._begin_episode(task)
+            episode_task, block, before = self._episode
+            block.duration_sec = stalled
+            if episode_task is not None:
+                self._blocked[episode_task] = before + stalled
+
+    def _begin_episode(self, task: Optional[asyncio.Task]) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)[-_STACK_LIMIT:]) if frame else ""
+        if task is not None:
+            name = task.get_name()
+        elif frame is not None and frame.f_code.co_filename.endswith("selectors.py"):
+            # Nothing is running on the loop: its thread can't get the GIL back
+            # from CPU-bound worker threads after select() returns
+            name = "<loop idle in select: GIL starvation>"
+        else:
+            name = "<loop callback>"
+        block = LoopBlock(task=name, started_at=time.time(), stack=stack)
+        self._episode = (task, block, self.blocked_seconds(task))
+        self.recent_blocks.append(block)
+        LOOP_BLOCKS.inc()
+        logger.warning(
+            f"Event loop blocked for >{self.threshold_sec * 1000:.0f} ms in {name}:\n{stack}"
+        )
+
+    def _end_episode(self) -> None:
+        if self._episode is not None:
+            block = self._episode[1]
+            logger.warning(
+                f"Event loop unblocked after {block.duration_sec * 1000:.0f} ms ({block.task})"
+            )
+            self._episode = None
+
+
+class LoopBlockMiddleware:
+    """
+    Pure ASGI middleware (the handler runs in this request's task, so stalls
+    the monitor charges to that task are the handler's).
+    """
+
+    def __init__(self, app, monitor: LoopMonitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        task = asyncio.current_task()
+        before = self.monitor.blocked_seconds(task)
+
+        async def send_tagged(message):
+            if message["type"] == "http.response.start":
+                blocked = self.monitor.blocked_seconds(task) - before
+                if blocked > 0:
+                    headers = list(message.get("headers", []))
+                    headers.append(
+                        (b"x-event-loop-blocked-ms", str(round(blocked * 1000)).encode())
+                    )
+                    message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_tagged)
+        finally:
+            blocked = self.monitor.blocked_seconds(task) - before
+            if blocked > 0:
+                endpoint = scope.get("endpoint")
+                route = getattr(endpoint, "__name__", None) or scope.get("path", "")
+                BLOCKING_REQUESTS.inc(method=scope.get("method", ""), route=route)
+                logger.warning(
+                    f"{scope.get('method')} {scope.get('path')} blocked the event loop "
+                    f"for {blocked * 1000:.0f} ms"
+                )
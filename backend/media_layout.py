@@ -0,0 +1,159 @@
+"""
+Sharded per-job media layout.
+
+    media/in/ab/cd/{job_id}/...   uploads, decoded audio, separated stems
+    media/out/ab/cd/{job_id}/...  MIDI, videos, expected notes
+
+`ab/cd` are the first hex digits of sha1(job_id), which keeps every directory
+small. File names inside a job directory are unchanged ({job_id}_L1_full.mp4, ...),
+so pre-sharding flat URLs (/media/out/{job_id}_L1_full.mp4) can still be resolved.
+
+Migration of an existing flat tree:
+    python media_layout.py migrate [--dry-run]
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import re
+import shutil
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from loguru import logger
+
+from config import settings
+
+# Job ids are "{unix_ts}_{uuid4 hex}" (see app._new_job_id)
+JOB_FILE_RE = re.compile(r"^(?P<job_id>\d+_[0-9a-f]{32})_")
+
+
+def shard_parts(job_id: str) -> Tuple[str, str]:
+    digest = hashlib.sha1(job_id.encode("utf-8")).hexdigest()
+    return digest[:2], digest[2:4]
+
+
+def _job_dir(root: Path, job_id: str, create: bool) -> Path:
+    first, second = shard_parts(job_id)
+    path = root / first / second / job_id
+    if create:
+        path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def job_input_dir(job_id: str, create: bool = True) -> Path:
+    return _job_dir(settings.INPUT_DIR, job_id, create)
+
+
+def job_output_dir(job_id: str, create: bool = True) -> Path:
+    return _job_dir(settings.OUTPUT_DIR, job_id, create)
+
+
+def job_dirs(job_id: str) -> List[Path]:
+    """Both per-job directories (they may not exist)."""
+    return [job_input_dir(job_id, create=False), job_output_dir(job_id, create=False)]
+
+
+def media_url(path: Path) -> str:
+    """Absolute client URL for a file under MEDIA_DIR (served by the /media mount)."""
+    relative = Path(path).resolve().relative_to(settings.MEDIA_DIR.resolve())
+    return f"{settings.BASE_URL.rstrip('/')}/media/{relative.as_posix()}"
+
+
+def job_id_from_filename(filename: str) -> Optional[str]:
+    match = JOB_FILE_RE.match(filename)
+    return match.group("job_id") if match else None
+
+
+def resolve_output_file(filename: str) -> Optional[Path]:
+    """
+    Map a flat /media/out/{filename} URL to the file on disk:
+    the sharded job directory first, then the legacy flat directory.
+    """
+    job_id = job_id_from_filename(filename)
+    if job_id is None or "/" in filename or "\\" in filename:
+        return None
+    for candidate in (
+        job_output_dir(job_id, create=False) / filename,
+        settings.OUTPUT_DIR / filename,
+    ):
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+# ============================================
+# Migration from the flat layout
+# ============================================
+
+def _move(src: Path, dst: Path, dry_run: bool, moves: List[Tuple[Path, Path]]) -> None:
+    moves.append((src, dst))
+    if dry_run:
+        return
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(str(src), str(dst))
+
+
+def migrate_flat_layout(dry_run: bool = False) -> List[Tuple[Path, Path]]:
+    """
+    Move flat media/in and media/out files (and media/in/separated stems)
+    into their per-job directories. Returns the (src, dst) moves.
+    """
+    moves: List[Tuple[Path, Path]] = []
+
+    for root, job_dir in (
+        (settings.OUTPUT_DIR, job_output_dir),
+        (settings.INPUT_DIR, job_input_dir),
+    ):
+        if not root.is_dir():
+            continue
+        for path in root.iterdir():
+            job_id = job_id_from_filename(path.name)
+            if job_id and path.is_file():
+                _move(path, job_dir(job_id, create=False) / path.name, dry_run, moves)
+
+    separated = settings.INPUT_DIR / "separated"
+    if separated.is_dir():
+        # HPSS stems: separated/{job}_..._melody.wav
+        for path in separated.iterdir():
+            job_id = job_id_from_filename(path.name)
+            if job_id and path.is_file():
+                dst = job_input_dir(job_id, create=False) / "separated" / path.name
+                _move(path, dst, dry_run, moves)
+        # Demucs stems: separated/{model}/{job}_input/{target}.wav
+        for model_dir in [p for p in separated.iterdir() if p.is_dir()]:
+            for stem_dir in list(model_dir.iterdir()):
+                job_id = job_id_from_filename(stem_dir.name)
+                if job_id and stem_dir.is_dir():
+                    dst = (
+                        job_input_dir(job_id, create=False)
+                        / "separated"
+                        / model_dir.name
+                        / stem_dir.name
+                    )
+                    _move(stem_dir, dst, dry_run, moves)
+
+    return moves
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="ShazaPiano media layout tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="Move flat media files into per-job shard dirs")
+    migrate.add_argument("--dry-run", action="store_true", help="Only print planned moves")
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        from retention import ArtifactIndex
+
+        index = ArtifactIndex(settings.JOBS_DB_PATH)
+        moves = migrate_flat_layout(dry_run=args.dry_run)
+        for src, dst in moves:
+            logger.info(f"{'[dry-run] ' if args.dry_run else ''}{src} -> {dst}")
+            if not args.dry_run:
+                index.relocate(src, dst)
+        logger.success(f"{len(moves)} entries {'to move' if args.dry_run else 'moved'}")
+
+
+if __name__ == "__main__":
+    main()
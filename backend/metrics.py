@@ -0,0 +1,286 @@
+"""
+Process metrics in Prometheus text format (served on /metrics).
+Small self-contained registry (counters, gauges, histograms with labels) so
+pipeline modules can record timings without an extra dependency.
+
+    with stage_timer("decode"):
+        ...
+"""
+from __future__ import annotations
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+# Seconds: sub-second steps (cache hits, arrangement) up to multi-minute Demucs runs
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Compute the (unlabelled) value at scrape time."""
+        self._function = function
+
+    def value(self, **labels: str) -> float:
+        if self._function is not None:
+            return float(self._function())
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterable[str]:
+        if self._function is not None:
+            yield f"{self.name} {_format_value(self._function())}"
+            return
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (per-bucket counts + overflow, sum, count)
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, totals = self._series.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0, 0.0])
+            )
+            counts[index] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(self._key(labels))
+        return int(series[1][1]) if series else 0
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted((key, (list(c), list(t))) for key, (c, t) in self._series.items())
+        for key, (counts, (total, count)) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {int(count)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ============================================
+# ShazaPiano metrics
+# ============================================
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "shazapiano_stage_duration_seconds",
+    "Wall time of pipeline stages (upload, decode, separation_hpss, separation_demucs, "
+    "pitch_tracking, arrangement, frame_render, encode, preview, audio_synthesis, "
+    "firestore_write).",
+    ["stage", "level"],
+))
+JOBS_QUEUED = REGISTRY.register(Gauge(
+    "shazapiano_jobs_queued", "Jobs waiting for a processing slot (MAX_CONCURRENT_JOBS)."
+))
+JOBS_ACTIVE = REGISTRY.register(Gauge(
+    "shazapiano_jobs_active", "Jobs currently holding a processing slot."
+))
+WORKER_UTILIZATION = REGISTRY.register(Gauge(
+    "shazapiano_worker_utilization_ratio", "Busy processing slots / MAX_CONCURRENT_JOBS."
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "shazapiano_cache_requests_total",
+    "Cache lookups by cache (auth_token, acr, song_library) and result (hit, miss).",
+    ["cache", "result"],
+))
+AUTH_VERIFY_SAVED_SECONDS = REGISTRY.register(Counter(
+    "shazapiano_auth_verify_saved_seconds_total",
+    "ID-token verification time saved by claims-cache hits (hits x average verify time).",
+))
+PERSISTENCE_PENDING = REGISTRY.register(Gauge(
+    "shazapiano_persistence_pending_writes", "Firestore writes queued behind requests."
+))
+STARTUP_SECONDS = REGISTRY.register(Gauge(
+    "shazapiano_startup_seconds",
+    "Cold-start phases (pipeline_import: audio/ML modules loaded after the HTTP layer is up).",
+    ["phase"],
+))
+LOOP_LAG_SECONDS = REGISTRY.register(Histogram(
+    "shazapiano_event_loop_lag_seconds",
+    "Scheduling delay of a periodic event-loop timer.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+))
+LOOP_BLOCKS = REGISTRY.register(Counter(
+    "shazapiano_event_loop_blocks_total",
+    "Event-loop stalls longer than LOOP_BLOCK_THRESHOLD_SEC.",
+))
+RENDER_QUEUE_FRAMES = REGISTRY.register(Histogram(
+    "shazapiano_render_queue_frames",
+    "Frames waiting for the encoder writer, sampled as each rendered frame is queued.",
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16),
+))
+RENDER_QUEUE_WAIT_SECONDS = REGISTRY.register(Counter(
+    "shazapiano_render_queue_wait_seconds_total",
+    "Time blocked on the render/encode queue: side=renderer waits on a full queue "
+    "(encoder-bound), side=encoder on an empty one (render-bound).",
+    ["side"],
+))
+VIDEO_ENCODES = REGISTRY.register(Counter(
+    "shazapiano_video_encodes_total",
+    "Videos encoded, by output (full/preview) and encoder profile.",
+    ["output", "profile"],
+))
+LAZY_RENDERS = REGISTRY.register(Counter(
+    "shazapiano_lazy_renders_total",
+    "On-demand level renders (lazy_render.py) by result: rendered, coalesced (waited on a "
+    "running render), rejected (LAZY_RENDER_MAX_PENDING), failed, failure_cached (recent "
+    "failure, not retried yet), cancelled (pool shut down), evicted (cache budget).",
+    ["result"],
+))
+BLOCKING_REQUESTS = REGISTRY.register(Counter(
+    "shazapiano_loop_blocking_requests_total",
+    "Requests whose handler blocked the event loop, by route.",
+    ["method", "route"],
+))
+
+
+@contextmanager
+def stage_timer(stage: str, level: Optional[int] = None) -> Iterator[None]:
+    """Observe the wall time of a pipeline stage (also when it raises)."""
+    with STAGE_SECONDS.time(stage=stage, level="" if level is None else str(level)):
+        yield
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
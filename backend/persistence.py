@@ -0,0 +1,256 @@
+"""
+Write-behind persistence queue.
+Handlers enqueue job / practice-session documents and return immediately; a
+background task batches them into sink commits (Firestore batch writes in
+production), retries failed batches with exponential backoff and flushes on
+shutdown. In-memory and SQLite sinks exist for tests and load runs.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Protocol
+
+from loguru import logger
+
+from job_store import open_sqlite
+from metrics import stage_timer
+
+
+def merge_payload(base: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    `update` merged into a copy of `base` the way Firestore's set(merge=True)
+    does: nested maps are merged key by key, any other value replaces.
+    """
+    merged = dict(base)
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_payload(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+@dataclass
+class PendingWrite:
+    """One document merge-write: users/{user_id}/{collection}/{doc_id}."""
+
+    collection: str
+    user_id: str
+    doc_id: str
+    payload: Dict[str, Any]
+
+    @property
+    def path(self) -> str:
+        return f"users/{self.user_id}/{self.collection}/{self.doc_id}"
+
+
+class PersistenceSink(Protocol):
+    def commit(self, writes: List[PendingWrite]) -> None:
+        """Persist all writes atomically or raise."""
+
+
+class MemorySink:
+    """Keeps merged documents in a dict (tests, load runs)."""
+
+    def __init__(self):
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self.commits = 0
+        self._lock = threading.Lock()
+
+    def commit(self, writes: List[PendingWrite]) -> None:
+        with self._lock:
+            for write in writes:
+                self.documents[write.path] = merge_payload(
+                    self.documents.get(write.path, {}), write.payload
+                )
+            self.commits += 1
+
+
+class SQLiteSink:
+    """Stores merged documents in a local SQLite table (load runs without Firestore)."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = open_sqlite(self.db_path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents "
+                "(path TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def commit(self, writes: List[PendingWrite]) -> None:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for write in writes:
+                row = conn.execute(
+                    "SELECT data FROM documents WHERE path = ?", (write.path,)
+                ).fetchone()
+                data = merge_payload(json.loads(row[0]) if row else {}, write.payload)
+                conn.execute(
+                    "INSERT OR REPLACE INTO documents (path, data, updated_at) VALUES (?, ?, ?)",
+                    (write.path, json.dumps(data), time.time()),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT data FROM documents WHERE path = ?", (path,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+class PersistenceQueue:
+    """Batches enqueued writes into sink commits from a background task."""
+
+    def __init__(
+        self,
+        sink: PersistenceSink,
+        batch_size: int = 100,
+        flush_interval_sec: float = 0.5,
+        max_retries: int = 5,
+        backoff_base_sec: float = 0.5,
+        max_pending: int = 10000,
+    ):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval_sec = flush_interval_sec
+        self.max_retries = max_retries
+        self.backoff_base_sec = backoff_base_sec
+        self.max_pending = max_pending
+        self._pending: List[PendingWrite] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._commit_lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+        self.committed = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def enqueue(self, collection: str, user_id: str, doc_id: str, payload: Dict[str, Any]) -> bool:
+        """Queue a merge-write; returns False if the queue is full."""
+        if len(self._pending) >= self.max_pending:
+            logger.error(f"Persistence queue full; dropping {collection}/{doc_id}")
+            self.dropped += 1
+            return False
+        payload = dict(payload)
+        payload["userId"] = user_id
+        self._pending.append(PendingWrite(collection, user_id, doc_id, payload))
+        if self._wakeup is not None and len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def _take_batch(self) -> List[PendingWrite]:
+        """Pop up to batch_size writes, merging repeated writes to the same document."""
+        batch = self._pending[: self.batch_size]
+        del self._pending[: self.batch_size]
+        merged: Dict[str, PendingWrite] = {}
+        for write in batch:
+            previous = merged.get(write.path)
+            if previous is not None:
+                # A new PendingWrite: the enqueued payloads stay untouched
+                write = PendingWrite(
+                    write.collection,
+                    write.user_id,
+                    write.doc_id,
+                    merge_payload(previous.payload, write.payload),
+                )
+            merged[write.path] = write
+        return list(merged.values())
+
+    async def _commit_with_retry(self, batch: List[PendingWrite]) -> None:
+        try:
+            await self._commit_attempts(batch)
+        except asyncio.CancelledError:
+            # Back to the front of the queue for the next flush (writes are merges,
+            # so committing one twice is harmless)
+            self._pending[:0] = batch
+            raise
+
+    async def _commit_attempts(self, batch: List[PendingWrite]) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                with stage_timer("firestore_write"):
+                    await asyncio.to_thread(self.sink.commit, batch)
+                self.committed += len(batch)
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.dropped += len(batch)
+                    logger.error(
+                        f"Dropping {len(batch)} writes after {attempt + 1} failed commits: {e}"
+                    )
+                    return
+                delay = self.backoff_base_sec * (2 ** attempt)
+                logger.warning(f"Persistence commit failed ({e}); retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def flush(self) -> None:
+        """Commit everything pending now."""
+        if self._commit_lock is None:
+            self._commit_lock = asyncio.Lock()
+        async with self._commit_lock:
+            while self._pending:
+                await self._commit_with_retry(self._take_batch())
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval_sec)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:  # pragma: no cover - flush already logs per batch
+                logger.error(f"Persistence flush failed: {e}")
+
+    def start(self) -> None:
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._commit_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stop the background task after its current flush (a batch it is
+        committing or retrying is finished, not abandoned), then flush the rest.
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        logger.info(
+            f"Persistence queue stopped (committed={self.committed}, dropped={self.dropped})"
+        )
+
+
+def build_sink(kind: str, sqlite_path: Optional[Path] = None) -> PersistenceSink:
+    """Sink from settings.PERSISTENCE_SINK: firestore | memory | sqlite."""
+    if kind == "memory":
+        return MemorySink()
+    if kind == "sqlite":
+        if sqlite_path is None:
+            raise ValueError("sqlite sink requires a path")
+        return SQLiteSink(sqlite_path)
+    if kind == "firestore":
+        from firebase_client import FirestoreSink
+
+        return FirestoreSink()
+    raise ValueError(f"Unknown persistence sink: {kind}")
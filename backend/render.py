@@ -3,16 +3,34 @@ ShazaPiano - Video Renderer
 Generates animated piano keyboard videos from MIDI
 """
 from pathlib import Path
-from typing import Tuple, Optional, Iterator
+from typing import Callable, Tuple, Optional, Iterator
 import subprocess
 import gc
+import queue
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass
 
 import pretty_midi
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 from loguru import logger
 
-from config import settings
+from config import get_encoder_profile, settings
+from metrics import (
+    RENDER_QUEUE_FRAMES,
+    RENDER_QUEUE_WAIT_SECONDS,
+    STAGE_SECONDS,
+    VIDEO_ENCODES,
+    stage_timer,
+)
+from render_profile import FrameProfiler
+
+_NO_STEP = nullcontext()
+# ffmpeg rawvideo input format by frame layout: (h, w, 3) rgb24, (h, w, 4)
+# RGBX (4th byte ignored), (h * 3 / 2, w) planar yuv420p
+_RAW_PIX_FMTS = {3: "rgb24", 4: "rgb0", 2: "yuv420p"}
 
 
 # ============================================
@@ -38,6 +56,22 @@ COLOR_BLACK_KEY_ACTIVE = (33, 199, 163)  # PrimaryVariant #21C7A3
 COLOR_BACKGROUND = (11, 15, 16)  # Background #0B0F10
 COLOR_TEXT = (233, 245, 241)  # TextPrimary #E9F5F1
 COLOR_KEY_LABEL = (60, 60, 60)
+COLOR_FALLING_BAR = (255, 204, 0)
+
+# Every color the renderer draws (palette of yuv420p frames)
+PALETTE = (
+    COLOR_BACKGROUND,
+    COLOR_WHITE_KEY,
+    COLOR_BLACK_KEY,
+    COLOR_WHITE_KEY_ACTIVE,
+    COLOR_BLACK_KEY_ACTIVE,
+    COLOR_FALLING_BAR,
+    COLOR_KEY_LABEL,
+    COLOR_TEXT,
+)
+RELEASE_EPSILON_SEC = 0.02  # tiny release margin to avoid sticky keys
+PIXEL_FORMATS = ("rgb0", "yuv420p")
+RENDER_BACKENDS = ("pil", "ffmpeg")
 
 NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
 
@@ -59,6 +93,15 @@ def note_label(midi_note: int) -> str:
     return base
 
 
+def rgb_to_yuv(color: Tuple[int, int, int]) -> Tuple[int, int, int]:
+    """BT.601 limited range, as ffmpeg converts rgb24 input for yuv420p output."""
+    r, g, b = color
+    y = 16 + (65.481 * r + 128.553 * g + 24.966 * b) / 255
+    u = 128 + (-37.797 * r - 74.203 * g + 112.0 * b) / 255
+    v = 128 + (112.0 * r - 93.786 * g - 18.214 * b) / 255
+    return tuple(int(min(255, max(0, round(c)))) for c in (y, u, v))
+
+
 def get_key_position(midi_note: int) -> Tuple[int, int, bool]:
     """
     Get visual position of a key
@@ -97,6 +140,159 @@ def get_key_position(midi_note: int) -> Tuple[int, int, bool]:
     return (x, y, is_black)
 
 
+@dataclass(frozen=True)
+class KeyboardLayout:
+    """Keyboard placement for a frame size, shared by the keys and the falling bars."""
+
+    keyboard_x: int
+    keyboard_y: int
+    white_key_width: int
+    black_key_width: int
+    fall_area: int
+
+    @classmethod
+    def for_frame(cls, width: int, height: int) -> "KeyboardLayout":
+        # Calculate keyboard position (bottom of screen, scaled to fit width)
+        total_white_keys = 35  # 5 octaves = 35 white keys
+
+        # Scale keys to fill ~75% of screen width with dynamic sizing (gives more breathing room / less zoom)
+        available_width = int(width * 0.75)
+        white_key_width = max(8, available_width // total_white_keys)  # Scale keys but min 8px
+        keyboard_width = total_white_keys * white_key_width
+
+        # Piano sits flush at bottom (no gap) so falling bars disappear behind it
+        piano_bottom_padding = 0
+        return cls(
+            keyboard_x=(width - keyboard_width) // 2,
+            keyboard_y=height - WHITE_KEY_HEIGHT - piano_bottom_padding,
+            white_key_width=white_key_width,
+            black_key_width=max(6, (white_key_width * BLACK_KEY_WIDTH) // WHITE_KEY_WIDTH),
+            fall_area=min(settings.VIDEO_FALLING_AREA_HEIGHT, max(200, int(height * 0.7))),
+        )
+
+    def scale_x(self, x_base: int) -> int:
+        """Scale base x (using WHITE_KEY_WIDTH grid) to the dynamic key width grid."""
+        return self.keyboard_x + (x_base * self.white_key_width) // WHITE_KEY_WIDTH
+
+    @property
+    def bar_min_top(self) -> int:
+        """Highest row of a bar before its note starts (top of the fall area)."""
+        return self.keyboard_y - self.fall_area - settings.VIDEO_BAR_START_Y_OFFSET
+
+    def bar_columns(self, pitch: int) -> Tuple[int, int]:
+        """(left x, right x - left x) of a pitch's falling bar, centered on its key."""
+        x_base, _, is_black = get_key_position(pitch)
+        key_width = self.black_key_width if is_black else self.white_key_width
+        bar_width = max(4, key_width - 4)
+        return self.scale_x(x_base) + (key_width - bar_width) // 2, bar_width
+
+    @staticmethod
+    def bar_height(start: float, end: float) -> int:
+        """Bar length in pixels, proportional to how long the key stays pressed."""
+        note_duration = max(0.1, end - start)
+        return max(20, int(note_duration * settings.VIDEO_FALLING_SPEED_PX_PER_SEC))
+
+
+class FrameBuffers:
+    """
+    Small ring of preallocated frame buffers for the streaming renderer.
+
+    rgb0: each buffer is a (height, width, 4) uint8 array (RGBX) with a PIL
+    image mapped onto the same memory, so frames are drawn in place.
+
+    yuv420p: each buffer is a (height * 3 / 2, width) planar array (Y, then
+    U and V at half resolution): what libx264 encodes, at half the pipe
+    bandwidth of rgb24 and with no colorspace conversion left for ffmpeg.
+    Frames are drawn into the Y plane through a PIL "P" image whose palette
+    index for each color is its Y value (the PALETTE colors have distinct
+    Y), so the luma needs no conversion; finish() derives the chroma planes
+    from it, each sample the mean of its 2x2 block.
+
+    Either way frames reach ffmpeg's stdin without per-frame allocation. A
+    frame stays valid until `size` more frames have been drawn.
+    """
+
+    def __init__(self, width: int, height: int, size: int = 2, pixel_format: str = "rgb0"):
+        if pixel_format not in PIXEL_FORMATS:
+            raise ValueError(f"Unknown pixel format: {pixel_format}")
+        self.pixel_format = pixel_format
+        self._next = 0
+        if pixel_format == "rgb0":
+            self.arrays = [np.empty((height, width, 4), dtype=np.uint8) for _ in range(size)]
+            self.images = [self._mapped_image("RGBX", array) for array in self.arrays]
+            return
+
+        if width % 2 or height % 2:
+            raise ValueError(f"yuv420p frames need even dimensions, got {width}x{height}")
+        palette, self._chroma_lut = _luma_palette()
+        self.arrays = [np.empty((height * 3 // 2, width), dtype=np.uint8) for _ in range(size)]
+        self.images = []
+        for array in self.arrays:
+            image = self._mapped_image("P", array[:height])
+            image.putpalette(palette)
+            self.images.append(image)
+        self._palette_colors = dict(self.images[0].palette.colors)
+        # Scratch for the chroma lookups (np.take would allocate intp copies
+        # of uint8 indices on every call)
+        self._block = np.empty((height // 2, width // 2), dtype=np.intp)
+        self._chroma = np.empty((2, height // 2, width // 2), dtype=np.uint16)
+        self._sample = np.empty((height // 2, width // 2), dtype=np.uint16)
+
+    @staticmethod
+    def _mapped_image(mode: str, array: np.ndarray) -> Image.Image:
+        height, width = array.shape[:2]
+        image = Image.frombuffer(mode, (width, height), array, "raw", mode, 0, 1)
+        # frombuffer maps the array read-only; drawing would silently copy it
+        image.readonly = 0
+        return image
+
+    def next(self) -> Tuple[Image.Image, np.ndarray]:
+        """(image to draw into, frame array it becomes after finish())."""
+        index = self._next
+        self._next = (index + 1) % len(self.arrays)
+        return self.images[index], self.arrays[index]
+
+    def finish(self, frame: np.ndarray) -> None:
+        """Complete a drawn frame (yuv420p: chroma planes from the Y plane)."""
+        if self.pixel_format != "yuv420p":
+            return
+        # PIL gives colors missing from the palette a free index: not their Y
+        image = self.images[(self._next - 1) % len(self.images)]
+        if image.palette.colors != self._palette_colors:
+            raise ValueError("Drew a color outside render.PALETTE into a yuv420p frame")
+        height = frame.shape[0] * 2 // 3
+        luma = frame[:height]
+        chroma, sample, block = self._chroma, self._sample, self._block
+        for corner, (dy, dx) in enumerate(((0, 0), (0, 1), (1, 0), (1, 1))):
+            np.copyto(block, luma[dy::2, dx::2])
+            for lut, plane in zip(self._chroma_lut, chroma):
+                if corner == 0:
+                    np.take(lut, block, out=plane, mode="clip")
+                else:
+                    np.take(lut, block, out=sample, mode="clip")
+                    plane += sample
+        chroma += 2
+        chroma >>= 2
+        np.copyto(frame[height:].reshape(chroma.shape), chroma, casting="unsafe")
+
+
+def _luma_palette() -> Tuple[list, np.ndarray]:
+    """
+    256-entry palette putting each PALETTE color at the index equal to its Y
+    (other entries: placeholder blues never drawn), and the (2, 256) U/V
+    table by Y.
+    """
+    entries = [(0, 0, index) for index in range(256)]
+    chroma_lut = np.full((2, 256), 128, dtype=np.uint16)
+    for color in PALETTE:
+        y, u, v = rgb_to_yuv(color)
+        if entries[y] in PALETTE or color in entries:
+            raise ValueError(f"PALETTE color {color} collides at Y={y}")
+        entries[y] = color
+        chroma_lut[0, y], chroma_lut[1, y] = u, v
+    return [channel for color in entries for channel in color], chroma_lut
+
+
 def render_keyboard_frame(
     active_notes: set,
     width: int,
@@ -105,6 +301,7 @@ def render_keyboard_frame(
     current_time: float = 0.0,
     upcoming_notes: Optional[list] = None,
     show_level_label: bool = False,
+    into: Optional[Image.Image] = None,
 ) -> Image.Image:
     """
     Render single frame of piano keyboard
@@ -114,41 +311,27 @@ def render_keyboard_frame(
         width: Frame width
         height: Frame height
         level_name: Optional level name to display
+        into: Optional image to draw into (cleared first) instead of
+            allocating a new one (see FrameBuffers)
         
     Returns:
         PIL Image
     """
-    # Create image
-    img = Image.new('RGB', (width, height), COLOR_BACKGROUND)
-    draw = ImageDraw.Draw(img)
-    font = ImageFont.load_default()
-    
-    # Calculate keyboard position (bottom of screen, scaled to fit width)
-    total_white_keys = 35  # 5 octaves = 35 white keys
-    
-    # Scale keys to fill ~75% of screen width with dynamic sizing (gives more breathing room / less zoom)
-    available_width = int(width * 0.75)
-    dynamic_white_key_width = max(8, available_width // total_white_keys)  # Scale keys but min 8px
-    keyboard_width = total_white_keys * dynamic_white_key_width
-    keyboard_x = (width - keyboard_width) // 2
-    
-    # Piano sits flush at bottom (no gap) so falling bars disappear behind it
-    piano_bottom_padding = 0
-    keyboard_y = height - WHITE_KEY_HEIGHT - piano_bottom_padding
-
-    # Precompute scaling helpers so falling bars and keys align perfectly
-    scaled_black_key_width = max(6, (dynamic_white_key_width * BLACK_KEY_WIDTH) // WHITE_KEY_WIDTH)
-    def scale_x(x_base: int) -> int:
-        """Scale base x (using WHITE_KEY_WIDTH grid) to the dynamic key width grid."""
-        return keyboard_x + (x_base * dynamic_white_key_width) // WHITE_KEY_WIDTH
+    # Create image (or reuse the caller's buffer)
+    if into is not None:
+        img = into
+        draw = ImageDraw.Draw(img)
+        draw.rectangle([0, 0, width, height], fill=COLOR_BACKGROUND)
+    else:
+        img = Image.new('RGB', (width, height), COLOR_BACKGROUND)
+        draw = ImageDraw.Draw(img)
+    layout = KeyboardLayout.for_frame(width, height)
+    keyboard_y = layout.keyboard_y
 
     # Draw falling notes
     if upcoming_notes:
         lookahead = settings.VIDEO_LOOKAHEAD_SEC
-        fall_area = min(settings.VIDEO_FALLING_AREA_HEIGHT, max(200, int(height * 0.7)))
         speed_px = settings.VIDEO_FALLING_SPEED_PX_PER_SEC
-        fall_color = (255, 204, 0)
-        bar_start_y = keyboard_y - fall_area - settings.VIDEO_BAR_START_Y_OFFSET
         
         for pitch, start, end in upcoming_notes:
             if current_time > end:
@@ -168,20 +351,12 @@ def render_keyboard_frame(
                 elapsed = -time_to_start  # time since note started
                 bar_bottom = keyboard_y + elapsed * speed_px
 
-            # Horizontal position scaled to current key sizes
-            x_base, _, is_black = get_key_position(pitch)
-            x = scale_x(x_base)
-            key_width = scaled_black_key_width if is_black else dynamic_white_key_width
-            bar_width = max(4, key_width - 4)
-
-            note_duration = max(0.1, end - start)
-            # Make bar height proportional to how long the key will stay pressed
-            bar_height = int(note_duration * speed_px)
-            bar_height = max(20, bar_height)
+            bar_left, bar_width = layout.bar_columns(pitch)
+            bar_height = layout.bar_height(start, end)
             bar_top = bar_bottom - bar_height
 
             # Clamp so pre-start bars don't start above the visible fall area
-            min_top = keyboard_y - fall_area - settings.VIDEO_BAR_START_Y_OFFSET
+            min_top = layout.bar_min_top
             min_bottom = min_top + 1  # ensure bottom stays >= top
             if time_to_start >= 0:
                 if bar_bottom < min_bottom:
@@ -193,23 +368,40 @@ def render_keyboard_frame(
             if bar_bottom <= bar_top:
                 bar_bottom = bar_top + 1
 
-            # Center bar on the key width for cleaner alignment
-            x_offset = (key_width - bar_width) // 2
             y0 = bar_top
             y1 = bar_bottom
             draw.rectangle(
-                [x + x_offset, y0, x + x_offset + bar_width, y1],
-                fill=fall_color,
+                [bar_left, y0, bar_left + bar_width, y1],
+                fill=COLOR_FALLING_BAR,
                 outline=None,
             )
     
+    draw_keys(draw, layout, active_notes)
+
+    # Level label intentionally disabled to avoid duplicate overlays
+
+    # Mask area below keys to hide falling bars once they pass the keyboard
+    draw.rectangle(
+        [0, keyboard_y + WHITE_KEY_HEIGHT, width, height],
+        fill=COLOR_BACKGROUND,
+        outline=None,
+    )
+    
+    return img
+
+
+def draw_keys(draw: ImageDraw.ImageDraw, layout: KeyboardLayout, active_notes: set) -> None:
+    """Draw the keyboard (white keys, then black keys on top)."""
+    font = ImageFont.load_default()
+    keyboard_y = layout.keyboard_y
+
     # Draw white keys first
     for midi_note in range(FIRST_KEY, LAST_KEY + 1):
         if not is_black_key(midi_note):
             x, y, _ = get_key_position(midi_note)
             # Scale position and size by ratio
-            key_width = dynamic_white_key_width
-            x = scale_x(x)
+            key_width = layout.white_key_width
+            x = layout.scale_x(x)
             y += keyboard_y
             
             # Active or inactive
@@ -237,8 +429,8 @@ def render_keyboard_frame(
         if is_black_key(midi_note):
             x, y, _ = get_key_position(midi_note)
             # Scale position and size by ratio
-            black_key_width = max(6, (dynamic_white_key_width * BLACK_KEY_WIDTH) // WHITE_KEY_WIDTH)
-            x = scale_x(x)
+            black_key_width = layout.black_key_width
+            x = layout.scale_x(x)
             y += keyboard_y
             
             color = COLOR_BLACK_KEY_ACTIVE if midi_note in active_notes else COLOR_BLACK_KEY
@@ -249,17 +441,6 @@ def render_keyboard_frame(
                 outline=COLOR_BACKGROUND,
                 width=1
             )
-    
-    # Level label intentionally disabled to avoid duplicate overlays
-
-    # Mask area below keys to hide falling bars once they pass the keyboard
-    draw.rectangle(
-        [0, keyboard_y + WHITE_KEY_HEIGHT, width, height],
-        fill=COLOR_BACKGROUND,
-        outline=None,
-    )
-    
-    return img
 
 
 def _sanitize_notes(notes: list[tuple[int, float, float]], frame_dt: float) -> list[tuple[int, float, float]]:
@@ -288,11 +469,46 @@ def _sanitize_notes(notes: list[tuple[int, float, float]], frame_dt: float) -> l
     return sanitized
 
 
+def video_timeline(
+    midi: pretty_midi.PrettyMIDI,
+    max_duration: float | None = None,
+    fps: Optional[int] = None,
+) -> tuple[list[tuple[int, float, float]], int, float]:
+    """
+    Notes and frame count of a level video (shared by the render backends)
+
+    Returns:
+        (sanitized (pitch, start, end) notes, num_frames, duration_sec)
+    """
+    fps = fps or settings.VIDEO_FPS
+
+    # Calculate duration
+    midi_duration = midi.get_end_time()
+    # Force target duration: limit to max_duration if specified (e.g., 16s)
+    if max_duration:
+        duration = min(max_duration, midi_duration)
+    else:
+        duration = midi_duration
+    effective_duration = duration + settings.VIDEO_PREROLL_SEC
+    num_frames = int(effective_duration * fps)
+
+    # Collect all notes with timing
+    all_notes = []
+    for instrument in midi.instruments:
+        all_notes.extend(instrument.notes)
+    # Convert to tuples for speed (keep all pitches, we'll clamp positions visually)
+    all_notes = [(n.pitch, n.start, n.end) for n in all_notes]
+    return _sanitize_notes(all_notes, 1.0 / fps), num_frames, duration
+
+
 def generate_video_frames(
     midi: pretty_midi.PrettyMIDI,
     level: int,
     level_name: str,
     max_duration: float | None = None,
+    profiler: Optional[FrameProfiler] = None,
+    pixel_format: Optional[str] = None,
+    fps: Optional[int] = None,
 ) -> tuple[Iterator[np.ndarray], int, float]:
     """
     Generate video frames from MIDI as a stream
@@ -301,81 +517,288 @@ def generate_video_frames(
         midi: PrettyMIDI object
         level: Level number
         level_name: Level name for display
+        profiler: Optional per-frame step timings (note lookup, draw,
+            to_array: palette -> YUV planes)
+        pixel_format: "yuv420p" or "rgb0" (default RENDER_PIXEL_FORMAT)
+        fps: Frame rate (default VIDEO_FPS)
         
     Returns:
         (frame_iterator, num_frames, duration_sec)
+
+    Frames are yuv420p (height * 3 / 2, width) planar arrays or
+    (height, width, 4) RGBX arrays, views into a FrameBuffers ring of
+    RENDER_QUEUE_FRAMES + 2 buffers (queued frames, the one being written,
+    the one being drawn): each is overwritten that many frames later, so
+    consumers that keep frames must copy them.
     """
     logger.info(f"Generating frames for Level {level}...")
     
-    fps = settings.VIDEO_FPS
+    fps = fps or settings.VIDEO_FPS
     width = settings.VIDEO_WIDTH
     height = settings.VIDEO_HEIGHT
     frame_dt = 1.0 / fps
     time_offset = settings.VIDEO_TIME_OFFSET_MS / 1000.0
-    
-    # Calculate duration
-    midi_duration = midi.get_end_time()
     preroll = settings.VIDEO_PREROLL_SEC
-    # Force target duration: limit to max_duration if specified (e.g., 16s)
-    if max_duration:
-        duration = min(max_duration, midi_duration)
-    else:
-        duration = midi_duration
-    effective_duration = duration + preroll
-    num_frames = int(effective_duration * fps)
-    
-    # Collect all notes with timing
-    all_notes = []
-    for instrument in midi.instruments:
-        all_notes.extend(instrument.notes)
-    # Convert to tuples for speed (keep all pitches, we'll clamp positions visually)
-    all_notes = [(n.pitch, n.start, n.end) for n in all_notes]
-    all_notes = _sanitize_notes(all_notes, frame_dt)
-    release_epsilon = 0.02  # tiny release margin to avoid sticky keys
+    all_notes, num_frames, duration = video_timeline(midi, max_duration, fps)
+    step = profiler.step if profiler is not None else (lambda name: _NO_STEP)
 
     def frame_iterator() -> Iterator[np.ndarray]:
+        buffers = FrameBuffers(
+            width,
+            height,
+            size=settings.RENDER_QUEUE_FRAMES + 2,
+            pixel_format=pixel_format or settings.RENDER_PIXEL_FORMAT,
+        )
         # Generate each frame
         for frame_idx in range(num_frames):
             time = frame_idx * frame_dt - preroll + time_offset  # start with preroll so bars fall from the sky
+            if profiler is not None:
+                profiler.begin_frame(frame_idx, time)
+
+            with step("note_lookup"):
+                # Find active notes at this time (with global offset)
+                active_notes = set()
+                for pitch, start, end in all_notes:
+                    s = start + time_offset
+                    e = end + time_offset
+                    tolerance_start = 0.05 * frame_dt
+                    tolerance_end = 0.1 * frame_dt
+                    if (s - tolerance_start) <= time <= (e + tolerance_end - RELEASE_EPSILON_SEC):
+                        active_notes.add(pitch)
 
-            # Find active notes at this time (with global offset)
-            active_notes = set()
-            for pitch, start, end in all_notes:
-                s = start + time_offset
-                e = end + time_offset
-                tolerance_start = 0.05 * frame_dt
-                tolerance_end = 0.1 * frame_dt
-                if (s - tolerance_start) <= time <= (e + tolerance_end - release_epsilon):
-                    active_notes.add(pitch)
-
-            # Upcoming notes for falling bars
-            upcoming = []
-            for pitch, start, end in all_notes:
-                s = start + time_offset
-                e = end + time_offset
-                if (time <= s <= time + settings.VIDEO_LOOKAHEAD_SEC) or (s <= time <= e):
-                    upcoming.append((pitch, s, e))
+                # Upcoming notes for falling bars
+                upcoming = []
+                for pitch, start, end in all_notes:
+                    s = start + time_offset
+                    e = end + time_offset
+                    if (time <= s <= time + settings.VIDEO_LOOKAHEAD_SEC) or (s <= time <= e):
+                        upcoming.append((pitch, s, e))
 
             # Render frame
-            frame = render_keyboard_frame(
-                active_notes=active_notes,
-                width=width,
-                height=height,
-                level_name="",  # Hide text in video to avoid duplicated titles (front can overlay)
-                current_time=time,
-                upcoming_notes=upcoming,
-                show_level_label=False,
-            )
+            with step("draw"):
+                image, frame_array = buffers.next()
+                render_keyboard_frame(
+                    active_notes=active_notes,
+                    width=width,
+                    height=height,
+                    level_name="",  # Hide text in video to avoid duplicated titles (front can overlay)
+                    current_time=time,
+                    upcoming_notes=upcoming,
+                    show_level_label=False,
+                    into=image,
+                )
 
             # Log progress
             if frame_idx % (fps * 2) == 0:  # Every 2 seconds
                 logger.debug(f"Frame {frame_idx}/{num_frames} ({time:.1f}s)")
 
-            yield np.array(frame)
+            with step("to_array"):
+                buffers.finish(frame_array)
+            yield frame_array
 
     return frame_iterator(), num_frames, duration
 
 
+def encoder_args(name: str) -> list[str]:
+    """libx264 output options of an encoder profile (config.ENCODER_PROFILES)."""
+    profile = get_encoder_profile(name)
+    args = ["-c:v", "libx264", "-preset", profile["preset"]]
+    if profile["crf"] is not None:
+        args += ["-crf", str(profile["crf"])]
+    if profile["tune"]:
+        args += ["-tune", profile["tune"]]
+    if profile["keyint"] is not None:
+        args += ["-g", str(profile["keyint"])]
+    if profile["threads"] is not None:
+        args += ["-threads", str(profile["threads"])]
+    if profile["x264_params"]:
+        args += ["-x264-params", profile["x264_params"]]
+    return args
+
+
+def select_encoder_profile(queued_jobs: int) -> str:
+    """
+    Encoder profile for the next full video: ENCODER_PROFILE, or with
+    ENCODER_ADAPTIVE one step down ENCODER_LOAD_PROFILES per
+    ENCODER_LOAD_STEP_JOBS jobs waiting for a slot (faster presets, then a
+    lower frame rate). Evaluated per level, so quality comes back as soon as
+    the queue drains.
+    """
+    ladder = [settings.ENCODER_PROFILE]
+    if settings.ENCODER_ADAPTIVE:
+        ladder += settings.ENCODER_LOAD_PROFILES
+    step = queued_jobs // max(1, settings.ENCODER_LOAD_STEP_JOBS)
+    return ladder[min(step, len(ladder) - 1)]
+
+
+def hls_playlist_path(video_path: Path) -> Path:
+    """HLS playlist written next to a full video (VIDEO_HLS)."""
+    return video_path.with_suffix(".m3u8")
+
+
+def hls_files(video_path: Path) -> list[Path]:
+    """Playlist, init segment and media segments of a full video's HLS output."""
+    playlist = hls_playlist_path(video_path)
+    files = [playlist, video_path.with_name(f"{video_path.stem}_init.mp4")]
+    files += sorted(video_path.parent.glob(f"{video_path.stem}_[0-9]*.m4s"))
+    return [path for path in files if path.exists()]
+
+
+def video_output_args(output_path: Path, hls: bool = False) -> list[str]:
+    """
+    ffmpeg output for a full video: the MP4, or with hls the same encode
+    teed into the MP4 and an HLS event playlist of fMP4 segments that grows
+    while frames are encoded (keyframe every HLS_SEGMENT_SEC so segments cut
+    there). HLS output names are relative: run ffmpeg in output_path's dir.
+    """
+    if not hls:
+        return [str(output_path)]
+    segment_sec = settings.HLS_SEGMENT_SEC
+    stem = output_path.stem
+    hls_options = ":".join([
+        "f=hls",
+        f"hls_time={segment_sec}",
+        "hls_playlist_type=event",
+        "hls_segment_type=fmp4",
+        f"hls_fmp4_init_filename={stem}_init.mp4",
+        f"hls_segment_filename={stem}_%05d.m4s",
+    ])
+    return [
+        "-force_key_frames",
+        f"expr:gte(t,n_forced*{segment_sec})",
+        "-f",
+        "tee",
+        f"[f=mp4:movflags=+faststart]{output_path.name}"
+        f"|[{hls_options}]{hls_playlist_path(output_path).name}",
+    ]
+
+
+class _PlaylistWatcher:
+    """Calls on_ready(playlist) from a thread once the playlist lists a segment."""
+
+    def __init__(
+        self, playlist: Path, on_ready: Callable[[Path], None], interval_sec: float = 0.05
+    ):
+        self.playlist = playlist
+        self.on_ready = on_ready
+        self.interval_sec = interval_sec
+        self.ready_after_sec: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="hls-watcher", daemon=True)
+
+    def __enter__(self) -> "_PlaylistWatcher":
+        self._started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_sec):
+            try:
+                listed = "#EXTINF" in self.playlist.read_text()
+            except OSError:
+                continue
+            if listed:
+                self.ready_after_sec = time.perf_counter() - self._started
+                logger.info(
+                    f"First HLS segment of {self.playlist.name} after {self.ready_after_sec:.2f}s"
+                )
+                try:
+                    self.on_ready(self.playlist)
+                except Exception as e:
+                    logger.warning(f"HLS ready callback failed: {e}")
+                return
+
+
+class _FrameWriter:
+    """
+    Encoder side of create_video_from_frames: a thread writing queued frames
+    to ffmpeg's stdin while the caller rasterizes the next ones. Time the
+    renderer spends blocked on a full queue means ffmpeg is the bottleneck;
+    time the writer spends waiting on an empty one means rendering is.
+
+    With depth 0 frames are written inline by the caller (on a single core
+    the extra thread only adds GIL hand-offs); the waits then are each
+    write (renderer blocked) and each render (encoder idle).
+    """
+
+    def __init__(self, stdin, depth: int, profiler: Optional[FrameProfiler] = None):
+        self.stdin = stdin
+        self.profiler = profiler
+        self.failed = threading.Event()  # set on a write error: stop rendering
+        self.broken_pipe = False
+        self.error: Optional[Exception] = None
+        self.frames_written = 0
+        self.write_seconds = 0.0
+        self.renderer_wait_sec = 0.0
+        self.encoder_wait_sec = 0.0
+        self.queue: Optional["queue.Queue[Optional[np.ndarray]]"] = None
+        self._thread: Optional[threading.Thread] = None
+        self._last_write_end: Optional[float] = None
+        if depth > 0:
+            self.queue = queue.Queue(maxsize=depth)
+            self._thread = threading.Thread(target=self._run, name="frame-writer", daemon=True)
+            self._thread.start()
+
+    def put(self, frame: np.ndarray) -> None:
+        started = time.perf_counter()
+        if self.queue is None:
+            if self._last_write_end is not None:
+                self.encoder_wait_sec += started - self._last_write_end
+            self._write(frame)
+            self._last_write_end = time.perf_counter()
+            self.renderer_wait_sec += self._last_write_end - started
+            return
+        RENDER_QUEUE_FRAMES.observe(self.queue.qsize())
+        self.queue.put(frame)
+        self.renderer_wait_sec += time.perf_counter() - started
+
+    def close(self) -> None:
+        """Wait until every queued frame is written (or dropped after a failure)."""
+        if self.queue is not None:
+            self.queue.put(None)
+            self._thread.join()
+        RENDER_QUEUE_WAIT_SECONDS.inc(self.renderer_wait_sec, side="renderer")
+        RENDER_QUEUE_WAIT_SECONDS.inc(self.encoder_wait_sec, side="encoder")
+
+    def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            frame = self.queue.get()
+            self.encoder_wait_sec += time.perf_counter() - started
+            if frame is None:
+                return
+            self._write(frame)
+
+    def _write(self, frame: np.ndarray) -> None:
+        if self.failed.is_set():
+            return  # keep draining so the renderer never blocks on a dead writer
+        started = time.perf_counter()
+        try:
+            # No copy for renderer frames (already contiguous uint8): ffmpeg
+            # reads straight from the frame buffer
+            frame_data = memoryview(np.ascontiguousarray(frame, dtype=np.uint8)).cast("B")
+            converted = time.perf_counter()
+            self.stdin.write(frame_data)
+        except BrokenPipeError:
+            self.broken_pipe = True
+            self.failed.set()
+            return
+        except Exception as exc:
+            self.error = exc
+            self.failed.set()
+            return
+        written = time.perf_counter()
+        self.write_seconds += written - converted
+        if self.profiler is not None:
+            self.profiler.add("to_array", converted - started, frame=self.frames_written)
+            self.profiler.add("pipe_write", written - converted, frame=self.frames_written)
+        self.frames_written += 1
+
+
 def create_video_from_frames(
     frames: Iterator[np.ndarray],
     output_path: Path,
@@ -386,9 +809,19 @@ def create_video_from_frames(
     height: Optional[int] = None,
     expected_frames: Optional[int] = None,
     duration_sec: Optional[float] = None,
+    level: Optional[int] = None,
+    profiler: Optional[FrameProfiler] = None,
+    queue_frames: Optional[int] = None,
+    encoder: Optional[str] = None,
+    hls: bool = False,
 ) -> Path:
     """
     Create MP4 video from frames
+
+    The calling thread pulls (rasterizes) frames while a writer thread feeds
+    them to ffmpeg, through a queue of at most queue_frames frames
+    (RENDER_QUEUE_FRAMES by default; frame buffers must survive that many
+    later frames, see generate_video_frames). 0 writes inline.
     
     Args:
         frames: Iterator of numpy arrays (frames)
@@ -400,6 +833,12 @@ def create_video_from_frames(
         height: Frame height
         expected_frames: Optional expected frame count
         duration_sec: Optional duration in seconds
+        level: Level number (metrics label only)
+        profiler: Optional per-frame timings; receives pipe write time
+            (encoder back-pressure), queue waits and the final encoder flush
+        queue_frames: Bounded queue depth between renderer and encoder
+        encoder: Encoder profile name (default ENCODER_PROFILE)
+        hls: Also write an HLS playlist while encoding (video_output_args)
         
     Returns:
         Path to created video
@@ -417,6 +856,20 @@ def create_video_from_frames(
                 f"Clamped frames to {max_frames} for {max_duration}s max duration"
             )
 
+    # Frames are produced lazily: time inside next() is rendering, time in
+    # write()/communicate() is ffmpeg encoding (pipe back-pressure). The
+    # first frame is drawn before ffmpeg starts: its layout picks the raw
+    # input format.
+    render_seconds = 0.0
+    frames = iter(frames)
+    started = time.perf_counter()
+    frame = next(frames, None)
+    render_seconds += time.perf_counter() - started
+    if frame is None:
+        layout = 3
+    else:
+        layout = frame.shape[2] if frame.ndim == 3 else frame.ndim
+
     cmd = [
         "ffmpeg",
         "-y",
@@ -426,7 +879,7 @@ def create_video_from_frames(
         "-f",
         "rawvideo",
         "-pix_fmt",
-        "rgb24",
+        _RAW_PIX_FMTS[layout],
         "-s",
         f"{width}x{height}",
         "-r",
@@ -434,10 +887,13 @@ def create_video_from_frames(
         "-i",
         "-",
     ]
+    cmd += ["-map", "0:v"]
     if audio_path and audio_path.exists():
         cmd += [
             "-i",
             str(audio_path),
+            "-map",
+            "1:a",
             "-shortest",
             "-c:a",
             "aac",
@@ -447,51 +903,57 @@ def create_video_from_frames(
     else:
         cmd += ["-an"]
 
-    cmd += [
-        "-c:v",
-        "libx264",
-        "-preset",
-        "veryfast",
-        "-pix_fmt",
-        "yuv420p",
-        str(output_path),
-    ]
+    encoder = encoder or settings.ENCODER_PROFILE
+    cmd += encoder_args(encoder) + ["-pix_fmt", "yuv420p"] + video_output_args(output_path, hls)
 
     process = subprocess.Popen(
-        cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE
+        cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE, cwd=output_path.parent if hls else None
     )
-    broken_pipe = False
     stream_error = None
-    frame_count = 0
-
+    queued = 0
+    writer = _FrameWriter(
+        process.stdin,
+        settings.RENDER_QUEUE_FRAMES if queue_frames is None else queue_frames,
+        profiler,
+    )
     try:
-        for frame in frames:
-            if max_frames is not None and frame_count >= max_frames:
-                break
-            frame_data = np.ascontiguousarray(frame, dtype=np.uint8)
-            try:
-                process.stdin.write(frame_data.tobytes())
-            except BrokenPipeError:
-                broken_pipe = True
+        while frame is not None and not writer.failed.is_set():
+            writer.put(frame)
+            queued += 1
+            if max_frames is not None and queued >= max_frames:
                 break
-            frame_count += 1
+            started = time.perf_counter()
+            frame = next(frames, None)
+            render_seconds += time.perf_counter() - started
     except Exception as exc:
         stream_error = exc
     finally:
-        if process.stdin:
-            process.stdin.close()
+        writer.close()
+    if stream_error is None:
+        stream_error = writer.error
+    broken_pipe = writer.broken_pipe
+    frame_count = writer.frames_written
+    encode_seconds = writer.write_seconds
 
+    # communicate() flushes and closes stdin itself (closing it first makes
+    # the flush fail with "flush of closed file").
     stderr_output = b""
-    return_code = None
-    if process.stderr:
-        try:
-            _, stderr_output = process.communicate(timeout=10)
-        except subprocess.TimeoutExpired:
-            process.kill()
-            _, stderr_output = process.communicate()
-        return_code = process.returncode
-    else:
-        return_code = process.wait()
+    started = time.perf_counter()
+    try:
+        _, stderr_output = process.communicate(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        _, stderr_output = process.communicate()
+    flush_seconds = time.perf_counter() - started
+    encode_seconds += flush_seconds
+    if profiler is not None:
+        profiler.encoder_flush_sec += flush_seconds
+        profiler.renderer_blocked_sec += writer.renderer_wait_sec
+        profiler.encoder_idle_sec += writer.encoder_wait_sec
+    return_code = process.returncode
+    level_label = "" if level is None else str(level)
+    STAGE_SECONDS.observe(render_seconds, stage="frame_render", level=level_label)
+    STAGE_SECONDS.observe(encode_seconds, stage="encode", level=level_label)
 
     stderr_text = stderr_output.decode("utf-8", errors="replace")
     tail = "\n".join(stderr_text.splitlines()[-40:])
@@ -514,19 +976,23 @@ def create_video_from_frames(
     else:
         duration_sec = max(duration_sec, measured_duration)
 
+    VIDEO_ENCODES.inc(output="full", profile=encoder)
     logger.success(f"Video saved: {output_path.name}")
     logger.success(f"Encoded {frame_count} frames ({duration_sec:.1f}s)")
     gc.collect()
     return output_path
 
 
-def create_preview_video(full_video_path: Path, duration_sec: int = None) -> Path:
+def create_preview_video(
+    full_video_path: Path, duration_sec: int = None, encoder: Optional[str] = None
+) -> Path:
     """
     Create preview (truncated) version of video
     
     Args:
         full_video_path: Path to full video
         duration_sec: Preview duration in seconds (default from settings)
+        encoder: Encoder profile name (default PREVIEW_ENCODER_PROFILE)
         
     Returns:
         Path to preview video
@@ -540,13 +1006,13 @@ def create_preview_video(full_video_path: Path, duration_sec: int = None) -> Pat
     
     logger.info(f"Creating {duration_sec}s preview with FFmpeg trim...")
     
+    encoder = encoder or settings.PREVIEW_ENCODER_PROFILE
     # Use FFmpeg to trim video to exact duration with fast encoding
     cmd = [
         'ffmpeg',
         '-i', str(full_video_path),
         '-t', str(float(duration_sec)),  # Duration in seconds
-        '-c:v', 'libx264',
-        '-preset', 'ultrafast',  # Fastest encode
+        *encoder_args(encoder),
         '-c:a', 'aac',
         '-y',
         str(preview_path)
@@ -554,6 +1020,7 @@ def create_preview_video(full_video_path: Path, duration_sec: int = None) -> Pat
     
     try:
         subprocess.run(cmd, capture_output=True, check=True, timeout=60)
+        VIDEO_ENCODES.inc(output="preview", profile=encoder)
         logger.success(f"Preview created: {preview_path.name}")
         return preview_path
     except Exception as e:
@@ -597,13 +1064,88 @@ def synthesize_audio(midi: pretty_midi.PrettyMIDI, output_path: Path) -> Path:
 # Main Rendering Pipeline
 # ============================================
 
+def _encode_full_video(
+    midi: pretty_midi.PrettyMIDI,
+    level: int,
+    full_video_path: Path,
+    audio_file: Optional[Path],
+    job_id: str,
+    profile: bool,
+    encoder_profile: str,
+    fps: int,
+    hls: bool,
+) -> Path:
+    """Full video with the configured render backend (see render_level_video)."""
+    if settings.RENDER_BACKEND == "ffmpeg":
+        # ffmpeg draws the frames itself from a compiled filter graph
+        from render_ffmpeg import render_video
+
+        if profile:
+            logger.warning("Render profiling needs the PIL backend; skipped")
+        full_video_path = render_video(
+            midi,
+            full_video_path,
+            audio_path=audio_file,
+            max_duration=settings.FULL_VIDEO_MAX_DURATION_SEC,
+            level=level,
+            fps=fps,
+            encoder=encoder_profile,
+            hls=hls,
+        )
+    else:
+        # Generate frames (streamed)
+        profiler = FrameProfiler() if profile else None
+        frame_iter, num_frames, duration_sec = generate_video_frames(
+            midi,
+            level,
+            "",  # hide level/title text in video (front can display it)
+            max_duration=settings.FULL_VIDEO_MAX_DURATION_SEC,
+            profiler=profiler,
+            fps=fps,
+        )
+
+        # Create full video
+        full_video_path = create_video_from_frames(
+            frame_iter,
+            full_video_path,
+            fps=fps,
+            audio_path=audio_file,
+            max_duration=settings.FULL_VIDEO_MAX_DURATION_SEC,
+            width=settings.VIDEO_WIDTH,
+            height=settings.VIDEO_HEIGHT,
+            expected_frames=num_frames,
+            duration_sec=duration_sec,
+            level=level,
+            profiler=profiler,
+            encoder=encoder_profile,
+            hls=hls,
+        )
+        if profiler is not None:
+            report_json, _ = profiler.write_report(
+                full_video_path,
+                {
+                    "job_id": job_id,
+                    "level": level,
+                    "fps": fps,
+                    "encoder_profile": encoder_profile,
+                    "width": settings.VIDEO_WIDTH,
+                    "height": settings.VIDEO_HEIGHT,
+                },
+            )
+            logger.info(f"Render profile saved: {report_json.name}")
+    return full_video_path
+
+
 def render_level_video(
     midi: pretty_midi.PrettyMIDI,
     level: int,
     level_name: str,
     output_dir: Path,
     job_id: str,
-    with_audio: bool = False
+    with_audio: bool = False,
+    profile: bool = False,
+    encoder_profile: Optional[str] = None,
+    on_stream_ready: Optional[Callable[[Path], None]] = None,
 ) -> Tuple[Path, Path, Optional[Path]]:
     """
     Complete pipeline: MIDI → Frames → Video (full + preview)
@@ -615,6 +1157,13 @@ def render_level_video(
         output_dir: Output directory
         job_id: Job ID for naming files
         with_audio: Whether to synthesize and add audio
+        profile: Write a per-frame timing report next to the full video
+            (see render_profile; PIL backend only)
+        encoder_profile: Encoder profile of the full video (default
+            ENCODER_PROFILE; see select_encoder_profile); its fps, if set,
+            overrides VIDEO_FPS
+        on_stream_ready: With VIDEO_HLS, called (from a watcher thread)
+            with the HLS playlist once its first segment is written
         
     Returns:
         Tuple of (full_video_path, preview_video_path, audio_path)
@@ -636,34 +1185,32 @@ def render_level_video(
     # Synthesize audio if requested
     audio_file = None
     if with_audio:
-        audio_file = synthesize_audio(midi, audio_path)
-    
-    # Generate frames (streamed)
-    frame_iter, num_frames, duration_sec = generate_video_frames(
-        midi,
-        level,
-        "",  # hide level/title text in video (front can display it)
-        max_duration=settings.FULL_VIDEO_MAX_DURATION_SEC,
-    )
+        with stage_timer("audio_synthesis", level):
+            audio_file = synthesize_audio(midi, audio_path)
     
-    # Create full video
-    full_video_path = create_video_from_frames(
-        frame_iter,
-        full_video_path,
-        fps=settings.VIDEO_FPS,
-        audio_path=audio_file,
-        max_duration=settings.FULL_VIDEO_MAX_DURATION_SEC,
-        width=settings.VIDEO_WIDTH,
-        height=settings.VIDEO_HEIGHT,
-        expected_frames=num_frames,
-        duration_sec=duration_sec,
+    if settings.RENDER_BACKEND not in RENDER_BACKENDS:
+        raise ValueError(f"Unknown render backend: {settings.RENDER_BACKEND}")
+    encoder_profile = encoder_profile or settings.ENCODER_PROFILE
+    fps = get_encoder_profile(encoder_profile)["fps"] or settings.VIDEO_FPS
+    hls = settings.VIDEO_HLS
+    for stale in hls_files(full_video_path) if hls else []:
+        stale.unlink()  # a re-render must not publish the previous playlist
+    watcher = (
+        _PlaylistWatcher(hls_playlist_path(full_video_path), on_stream_ready)
+        if hls and on_stream_ready is not None
+        else nullcontext()
     )
-    
+    with watcher:
+        full_video_path = _encode_full_video(
+            midi, level, full_video_path, audio_file, job_id, profile, encoder_profile, fps, hls
+        )
+
     # Create preview (16s by config)
-    preview_video_path = create_preview_video(
-        full_video_path,
-        duration_sec=settings.PREVIEW_DURATION_SEC,
-    )
+    with stage_timer("preview", level):
+        preview_video_path = create_preview_video(
+            full_video_path,
+            duration_sec=settings.PREVIEW_DURATION_SEC,
+        )
     
     logger.success(f"✅ Level {level} complete!")
     return full_video_path, preview_video_path, audio_path
@@ -0,0 +1,349 @@
+"""
+Filter-graph render backend.
+Compiles a level's notes into one ffmpeg filter graph, so ffmpeg draws and
+encodes the whole video with no Python per-frame work and no raw frames on
+a pipe:
+
+    background   color source
+    falling bars one single-frame color source per note, overlaid with a y
+                 expression in t, enabled while the note is on screen (one
+                 pass falling to the keyboard, clamped at the top of the
+                 fall area, then one while the note sustains)
+    keyboard     still RGBA input (transparent between keys, like the PIL
+                 frame where bars show through the gaps)
+    key presses  per-pitch sprites (the pixels a pressed key changes),
+                 enabled over the note's press window
+
+Geometry and timing are those of render.render_keyboard_frame /
+generate_video_frames (shared KeyboardLayout and video_timeline), so frames
+match the PIL backend (rgb0) pixel for pixel up to rounding at time
+boundaries; `python benchmark.py --compare-backends` measures both.
+Selected with RENDER_BACKEND=ffmpeg.
+"""
+from __future__ import annotations
+
+import dataclasses
+import functools
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pretty_midi
+from PIL import Image, ImageDraw
+from loguru import logger
+
+from config import settings
+from metrics import STAGE_SECONDS, VIDEO_ENCODES
+from render import (
+    COLOR_BACKGROUND,
+    COLOR_FALLING_BAR,
+    FIRST_KEY,
+    LAST_KEY,
+    RELEASE_EPSILON_SEC,
+    KeyboardLayout,
+    draw_keys,
+    encoder_args,
+    video_output_args,
+    video_timeline,
+)
+
+# Compositing runs in packed RGB: exact colors, overlay positions are not
+# rounded to even rows/columns as with yuv420p, and overlay blends rgba
+# frames ~2.5x faster than planar gbrp
+_WORK_PIX_FMT = "rgba"
+_KEY_MARKER = (255, 0, 255)  # second backdrop telling drawn key pixels from gaps
+
+
+def _hex(color: Tuple[int, int, int]) -> str:
+    return "0x" + "".join(f"{channel:02X}" for channel in color)
+
+
+def _num(value: float) -> str:
+    return repr(float(value))
+
+
+def _drawn_pixels(drawn: Image.Image, reference: Image.Image) -> Image.Image:
+    """RGBA image of `drawn`, opaque only where it differs from `reference`."""
+    mask = np.any(np.asarray(drawn) != np.asarray(reference), axis=2)
+    rgba = drawn.convert("RGBA")
+    rgba.putalpha(Image.fromarray((mask * 255).astype(np.uint8)))
+    return rgba
+
+
+@functools.lru_cache(maxsize=4)
+def keyboard_images(
+    layout: KeyboardLayout, width: int, height: int
+) -> Tuple[Image.Image, Dict[int, Tuple[Image.Image, int, int]]]:
+    """
+    (keyboard RGBA image placed at layout.keyboard_y, {pitch: (sprite, x, y)})
+
+    A sprite holds the pixels pressing that key changes (its fill and label;
+    black keys are drawn over white ones either way, so sprites of pressed
+    neighbours never overlap). Cached per layout: drawing the 62 keyboards
+    takes ~0.5s. Callers must not modify the images.
+    """
+    strip = dataclasses.replace(layout, keyboard_y=0)
+    size = (width, height - layout.keyboard_y)
+
+    def keys(active: set, backdrop=COLOR_BACKGROUND) -> Image.Image:
+        image = Image.new("RGB", size, backdrop)
+        draw_keys(ImageDraw.Draw(image), strip, active)
+        return image
+
+    idle = keys(set())
+    # Opaque: pixels drawn over either backdrop alike, and labels anti-aliased
+    # onto the background (small frames, where labels overflow their keys)
+    pixels = np.asarray(idle)
+    covered = np.all(pixels == np.asarray(keys(set(), _KEY_MARKER)), axis=2)
+    covered |= np.any(pixels != np.array(COLOR_BACKGROUND, dtype=np.uint8), axis=2)
+    keyboard = idle.convert("RGBA")
+    keyboard.putalpha(Image.fromarray((covered * 255).astype(np.uint8)))
+
+    sprites = {}
+    for pitch in range(FIRST_KEY, LAST_KEY + 1):
+        sprite = _drawn_pixels(keys({pitch}), idle)
+        box = sprite.getbbox()
+        if box is not None:
+            sprites[pitch] = (sprite.crop(box), box[0], layout.keyboard_y + box[1])
+    return keyboard, sprites
+
+
+def build_filter_graph(
+    notes: List[Tuple[int, float, float]],
+    work_dir: Path,
+    width: int,
+    height: int,
+    fps: int,
+    output_pix_fmt: str = "yuv420p",
+) -> Tuple[str, List[Path]]:
+    """
+    Compile notes (as from video_timeline) into a filter graph.
+
+    Returns:
+        (filter script, still image inputs in input order); the graph's
+        output pad is [out].
+    """
+    layout = KeyboardLayout.for_frame(width, height)
+    keyboard_y = layout.keyboard_y
+    min_top = layout.bar_min_top
+    min_bottom = min_top + 1
+    speed = settings.VIDEO_FALLING_SPEED_PX_PER_SEC
+    lookahead = settings.VIDEO_LOOKAHEAD_SEC
+    frame_dt = 1.0 / fps
+    time_offset = settings.VIDEO_TIME_OFFSET_MS / 1000.0
+    # generate_video_frames' frame time, with the same float operations (from
+    # the frame index) so visibility and truncation ties resolve the same way.
+    # The index comes from t: overlay's n counts frames already consumed
+    now = (
+        f"(round(t*{fps})*{_num(frame_dt)}"
+        f"-{_num(settings.VIDEO_PREROLL_SEC)}+{_num(time_offset)})"
+    )
+
+    keyboard, sprites = keyboard_images(layout, width, height)
+    # Nothing is drawn left or right of the keys
+    keyboard_x = keyboard.getbbox()[0]
+    keyboard = keyboard.crop((keyboard_x, 0, keyboard.getbbox()[2], keyboard.height))
+    inputs = [work_dir / "keyboard.png"]
+    keyboard.save(inputs[0])
+
+    lines = []
+    fmt = f"format={_WORK_PIX_FMT}"
+
+    def source(color, w, h, label, still=True) -> None:
+        rate = "r=1:d=1" if still else f"r={fps}"
+        lines.append(f"color=c={_hex(color)}:s={w}x{h}:{rate},{fmt}[{label}]")
+
+    def overlay(main: str, top: str, out: str, x="0", y="0", enable: Optional[str] = None) -> None:
+        options = f"x={x}:y='{y}':format=rgb"
+        if enable is not None:
+            options += f":enable='{enable}'"
+        lines.append(f"[{main}][{top}]overlay={options}[{out}]")
+
+    source(COLOR_BACKGROUND, width, height, "v0", still=False)
+    stage = 0
+    sustained = []
+    for index, (pitch, start, end) in enumerate(notes):
+        s = _num(start + time_offset)
+        e = _num(end + time_offset)
+        bar_left, bar_width = layout.bar_columns(pitch)
+        bar_height = layout.bar_height(start + time_offset, end + time_offset)
+        # PIL rectangles include both corners: bar_height + 1 rows, truncated
+        source(COLOR_FALLING_BAR, bar_width + 1, bar_height + 1, f"bar{index}")
+        source(COLOR_FALLING_BAR, bar_width + 1, bar_height + 1, f"sus{index}")
+        overlay(
+            f"v{stage}",
+            f"bar{index}",
+            f"v{stage + 1}",
+            x=str(bar_left),
+            y=f"trunc(max({keyboard_y}-({s}-{now})*{speed},{min_bottom}))-{bar_height}",
+            # upcoming (within lookahead) and not skipped as too far ahead
+            enable=(
+                f"lte({now},{s})*lte({s},{now}+{_num(lookahead)})"
+                f"*lte({s}-{now},{_num(lookahead)})"
+            ),
+        )
+        stage += 1
+        sustained.append((index, bar_left, bar_height, s, e))
+
+    # Bars before their note starts are clamped at the top of the fall area:
+    # clear what they drew above it, before sustained bars (not clamped)
+    if min_top > 0:
+        source(COLOR_BACKGROUND, width, min_top, "clamp")
+        overlay(f"v{stage}", "clamp", f"v{stage + 1}")
+        stage += 1
+
+    for index, bar_left, bar_height, s, e in sustained:
+        overlay(
+            f"v{stage}",
+            f"sus{index}",
+            f"v{stage + 1}",
+            x=str(bar_left),
+            y=f"trunc({keyboard_y}+({now}-{s})*{speed})-{bar_height}",
+            enable=f"gt({now},{s})*lte({now},{e})",
+        )
+        stage += 1
+
+    # The keyboard sits flush with the bottom edge (KeyboardLayout), so the
+    # PIL path's mask below it is always empty
+    overlay(f"v{stage}", "0:v", f"v{stage + 1}", x=str(keyboard_x), y=str(keyboard_y))
+    stage += 1
+
+    presses: Dict[int, List[str]] = {}
+    for pitch, start, end in notes:
+        if pitch in sprites:
+            pressed = (start + time_offset) - 0.05 * frame_dt
+            released = (end + time_offset) + 0.1 * frame_dt - RELEASE_EPSILON_SEC
+            presses.setdefault(pitch, []).append(f"between({now},{_num(pressed)},{_num(released)})")
+    for pitch, windows in sorted(presses.items()):
+        sprite, x, y = sprites[pitch]
+        inputs.append(work_dir / f"key_{pitch}.png")
+        sprite.save(inputs[-1])
+        overlay(
+            f"v{stage}",
+            f"{len(inputs) - 1}:v",
+            f"v{stage + 1}",
+            x=str(x),
+            y=str(y),
+            enable="+".join(windows),
+        )
+        stage += 1
+
+    lines.append(f"[v{stage}]format={output_pix_fmt}[out]")
+    return ";\n".join(lines) + "\n", inputs
+
+
+def _ffmpeg_command(
+    midi: pretty_midi.PrettyMIDI,
+    work_dir: Path,
+    max_duration: Optional[float],
+    output_pix_fmt: str,
+    audio_path: Optional[Path] = None,
+    fps: Optional[int] = None,
+) -> Tuple[List[str], int, float]:
+    """(ffmpeg command up to the output codec options, frame count, duration_sec)."""
+    fps = fps or settings.VIDEO_FPS
+    notes, num_frames, duration = video_timeline(midi, max_duration, fps)
+    if max_duration:
+        # Same clamp as create_video_from_frames
+        num_frames = min(num_frames, int(max_duration * fps))
+    script, inputs = build_filter_graph(
+        notes, work_dir, settings.VIDEO_WIDTH, settings.VIDEO_HEIGHT, fps, output_pix_fmt
+    )
+    script_path = work_dir / "graph.txt"
+    script_path.write_text(script)
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error"]
+    for path in inputs:
+        cmd += ["-i", str(path)]
+    if audio_path and audio_path.exists():
+        cmd += ["-i", str(audio_path)]
+    cmd += [
+        "-filter_complex_script",
+        str(script_path),
+        "-map",
+        "[out]",
+        "-frames:v",
+        str(num_frames),
+    ]
+    if audio_path and audio_path.exists():
+        cmd += ["-map", f"{len(inputs)}:a", "-shortest", "-c:a", "aac", "-b:a", "128k"]
+    else:
+        cmd += ["-an"]
+    return cmd, num_frames, duration
+
+
+def render_video(
+    midi: pretty_midi.PrettyMIDI,
+    output_path: Path,
+    audio_path: Optional[Path] = None,
+    max_duration: Optional[float] = None,
+    level: Optional[int] = None,
+    fps: Optional[int] = None,
+    encoder: Optional[str] = None,
+    hls: bool = False,
+) -> Path:
+    """
+    Render and encode a level video in one ffmpeg run
+    (same output as generate_video_frames + create_video_from_frames)
+
+    Args:
+        midi: Arranged MIDI for this level
+        output_path: Output video path
+        audio_path: Optional audio file to add
+        max_duration: Optional max duration in seconds
+        level: Level number (metrics label only)
+        fps: Frame rate (default VIDEO_FPS)
+        encoder: Encoder profile name (default ENCODER_PROFILE)
+        hls: Also write an HLS playlist while encoding (video_output_args)
+
+    Returns:
+        Path to created video
+    """
+    logger.info(f"Creating video (filter graph): {output_path.name}")
+    with tempfile.TemporaryDirectory(prefix="shazapiano-graph-") as tmp:
+        cmd, num_frames, _ = _ffmpeg_command(
+            midi, Path(tmp), max_duration, "yuv420p", audio_path, fps
+        )
+        encoder = encoder or settings.ENCODER_PROFILE
+        cmd += encoder_args(encoder) + ["-pix_fmt", "yuv420p"] + video_output_args(output_path, hls)
+
+        started = time.perf_counter()
+        result = subprocess.run(cmd, capture_output=True, cwd=output_path.parent if hls else None)
+        # Drawing happens inside ffmpeg: the whole run counts as encoding
+        level_label = "" if level is None else str(level)
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="encode", level=level_label)
+    if result.returncode != 0:
+        tail = "\n".join(result.stderr.decode("utf-8", errors="replace").splitlines()[-40:])
+        raise RuntimeError(f"FFmpeg failed while encoding {output_path.name}:\n{tail}")
+
+    VIDEO_ENCODES.inc(output="full", profile=encoder)
+    logger.success(f"Video saved: {output_path.name}")
+    logger.success(f"Encoded {num_frames} frames ({num_frames / (fps or settings.VIDEO_FPS):.1f}s)")
+    return output_path
+
+
+def render_rgb_frames(
+    midi: pretty_midi.PrettyMIDI, max_duration: Optional[float] = None
+) -> Iterator[np.ndarray]:
+    """Frames of the filter graph as (height, width, 3) RGB arrays (for comparisons)."""
+    width, height = settings.VIDEO_WIDTH, settings.VIDEO_HEIGHT
+    frame_bytes = width * height * 3
+    with tempfile.TemporaryDirectory(prefix="shazapiano-graph-") as tmp:
+        cmd, _, _ = _ffmpeg_command(midi, Path(tmp), max_duration, "rgb24")
+        cmd += ["-f", "rawvideo", "-"]
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            while True:
+                data = process.stdout.read(frame_bytes)
+                if len(data) < frame_bytes:
+                    break
+                yield np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)
+        finally:
+            process.stdout.close()
+            stderr_output = process.stderr.read()
+            process.wait()
+    if process.returncode != 0:
+        tail = "\n".join(stderr_output.decode("utf-8", errors="replace").splitlines()[-40:])
+        raise RuntimeError(f"FFmpeg filter graph failed:\n{tail}")
@@ -0,0 +1,116 @@
+"""
+Opt-in per-frame render profiling.
+Splits each frame's time into note lookup, PIL drawing, conversion to the
+encoder's raw buffer (a no-op for the renderer's own frame buffers) and the
+write to ffmpeg's stdin (encoder back-pressure), and writes the result next
+to the video:
+
+    {job}_L{n}_full.profile.csv    one row per frame (milliseconds)
+    {job}_L{n}_full.profile.json   per-step totals / mean / p50 / p95 / max
+
+Enabled for every job with RENDER_PROFILE, or per job with the
+X-Render-Profile header (DEBUG only).
+"""
+from __future__ import annotations
+
+import csv
+import json
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+STEPS = ("note_lookup", "draw", "to_array", "pipe_write")
+
+
+def report_paths(video_path: Path) -> Tuple[Path, Path]:
+    """(json, csv) report paths for a video."""
+    return (
+        video_path.with_name(f"{video_path.stem}.profile.json"),
+        video_path.with_name(f"{video_path.stem}.profile.csv"),
+    )
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class FrameProfiler:
+    """
+    Per-frame step timings. The frame generator opens a row with
+    begin_frame(); the generator adds step durations to the current row with
+    add() or step(), the encoder's writer thread to the row of the frame it
+    wrote (add(..., frame=index)).
+    """
+
+    def __init__(self):
+        self.rows: List[Dict[str, float]] = []
+        self.encoder_flush_sec = 0.0
+        self.renderer_blocked_sec = 0.0  # renderer waiting on a full encoder queue
+        self.encoder_idle_sec = 0.0  # encoder writer waiting on an empty queue
+        self._started = perf_counter()
+
+    def begin_frame(self, index: int, time_sec: float) -> None:
+        row = {"frame": index, "time_sec": time_sec}
+        row.update((step, 0.0) for step in STEPS)
+        self.rows.append(row)
+
+    def add(self, step: str, seconds: float, frame: Optional[int] = None) -> None:
+        if frame is not None:
+            if frame < len(self.rows):
+                self.rows[frame][step] += seconds
+        elif self.rows:
+            self.rows[-1][step] += seconds
+
+    def step(self, step: str) -> "_StepTimer":
+        return _StepTimer(self, step)
+
+    def summary(self) -> dict:
+        steps = {}
+        for step in STEPS:
+            values = sorted(row[step] * 1000.0 for row in self.rows)
+            steps[step] = {
+                "total_ms": round(sum(values), 3),
+                "mean_ms": round(sum(values) / len(values), 4) if values else 0.0,
+                "p50_ms": round(_percentile(values, 0.5), 4),
+                "p95_ms": round(_percentile(values, 0.95), 4),
+                "max_ms": round(values[-1], 4) if values else 0.0,
+            }
+        return {
+            "frames": len(self.rows),
+            "wall_ms": round((perf_counter() - self._started) * 1000.0, 3),
+            "encoder_flush_ms": round(self.encoder_flush_sec * 1000.0, 3),
+            "renderer_blocked_ms": round(self.renderer_blocked_sec * 1000.0, 3),
+            "encoder_idle_ms": round(self.encoder_idle_sec * 1000.0, 3),
+            "steps": steps,
+        }
+
+    def write_report(self, video_path: Path, extra: Optional[dict] = None) -> Tuple[Path, Path]:
+        json_path, csv_path = report_paths(video_path)
+        with csv_path.open("w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", "time_sec"] + [f"{step}_ms" for step in STEPS])
+            for row in self.rows:
+                writer.writerow(
+                    [row["frame"], f"{row['time_sec']:.6f}"]
+                    + [f"{row[step] * 1000.0:.4f}" for step in STEPS]
+                )
+        report = {"video": video_path.name, **(extra or {}), **self.summary()}
+        json_path.write_text(json.dumps(report, indent=2))
+        return json_path, csv_path
+
+
+class _StepTimer:
+    __slots__ = ("_profiler", "_step", "_started")
+
+    def __init__(self, profiler: FrameProfiler, step: str):
+        self._profiler = profiler
+        self._step = step
+
+    def __enter__(self) -> None:
+        self._started = perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self._profiler.add(self._step, perf_counter() - self._started)
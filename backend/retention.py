@@ -0,0 +1,235 @@
+"""
+Media retention: artifact index + background sweeper.
+Enforces INPUT_RETENTION_HOURS / OUTPUT_RETENTION_DAYS and a total disk budget
+for the media volume. Every file a job produces is recorded in the index, so
+looking up or deleting a job's files never scans the media directories.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Set
+
+from loguru import logger
+
+from job_store import open_sqlite
+
+KIND_INPUT = "input"
+KIND_OUTPUT = "output"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    path TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_artifacts_job ON artifacts(job_id);
+CREATE INDEX IF NOT EXISTS idx_artifacts_kind_created ON artifacts(kind, created_at);
+CREATE INDEX IF NOT EXISTS idx_artifacts_created ON artifacts(created_at);
+"""
+
+
+class ArtifactIndex:
+    """
+    SQLite index of media artifacts: path, job, kind (input/output), size, created time.
+    `job_dirs(job_id)` returns the per-job directories; deleting a whole job removes
+    those directories instead of unlinking file by file.
+    """
+
+    def __init__(self, db_path: Path, job_dirs: Optional[Callable[[str], List[Path]]] = None):
+        self.db_path = Path(db_path)
+        self.job_dirs = job_dirs
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        conn = open_sqlite(self.db_path)
+        with self._schema_lock:
+            if not self._schema_ready:
+                conn.executescript(_SCHEMA)
+                self._schema_ready = True
+        self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def record(self, job_id: str, kind: str, paths: Iterable[Optional[Path]]) -> None:
+        """Record (or refresh the size of) existing files for a job."""
+        rows = []
+        now = time.time()
+        for path in paths:
+            if path is None:
+                continue
+            path = Path(path)
+            try:
+                size = path.stat().st_size
+            except OSError:
+                continue
+            rows.append((str(path), job_id, kind, size, now))
+        if not rows:
+            return
+        # Keep the original created_at when a file is re-recorded (e.g. re-rendered)
+        self._conn().executemany(
+            "INSERT INTO artifacts (path, job_id, kind, size, created_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET size = excluded.size",
+            rows,
+        )
+
+    def job_artifacts(self, job_id: str) -> List[Path]:
+        rows = self._conn().execute(
+            "SELECT path FROM artifacts WHERE job_id = ?", (job_id,)
+        ).fetchall()
+        return [Path(row[0]) for row in rows]
+
+    def total_size(self) -> int:
+        row = self._conn().execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()
+        return int(row[0])
+
+    def _delete_paths(self, paths: List[Path]) -> List[str]:
+        deleted = []
+        gone = []
+        for path in paths:
+            try:
+                path.unlink()
+                deleted.append(path.name)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not delete {path}: {e}")
+                continue  # keep it indexed so the next sweep retries
+            gone.append((str(path),))
+        self._conn().executemany("DELETE FROM artifacts WHERE path = ?", gone)
+        return deleted
+
+    def delete_files(self, paths: Iterable[Path]) -> List[str]:
+        """Delete individual files and their index rows; returns deleted file names."""
+        return self._delete_paths([Path(path) for path in paths])
+
+    def delete_job(self, job_id: str, kind: Optional[str] = None) -> List[str]:
+        """Delete a job's files (optionally only one kind); returns deleted file names."""
+        if kind is None:
+            deleted: List[str] = []
+            for directory in self.job_dirs(job_id) if self.job_dirs else []:
+                if directory.is_dir():
+                    deleted.extend(p.name for p in directory.rglob("*") if p.is_file())
+                    shutil.rmtree(directory, ignore_errors=True)
+            # Files outside the job directories (legacy flat layout) are unlinked one by one
+            leftovers = [p for p in self.job_artifacts(job_id) if p.exists()]
+            deleted.extend(self._delete_paths(leftovers))
+            self._conn().execute("DELETE FROM artifacts WHERE job_id = ?", (job_id,))
+            return deleted
+        else:
+            rows = self._conn().execute(
+                "SELECT path FROM artifacts WHERE job_id = ? AND kind = ?", (job_id, kind)
+            ).fetchall()
+            paths = [Path(row[0]) for row in rows]
+        return self._delete_paths(paths)
+
+    def relocate(self, src: Path, dst: Path) -> None:
+        """Rewrite indexed paths after a file or directory move (layout migration)."""
+        src_s, dst_s = str(src), str(dst)
+        conn = self._conn()
+        rows = conn.execute(
+            "SELECT path FROM artifacts WHERE path = ? OR path LIKE ?",
+            (src_s, src_s + os.sep + "%"),
+        ).fetchall()
+        conn.executemany(
+            "UPDATE artifacts SET path = ? WHERE path = ?",
+            [(dst_s + path[len(src_s):], path) for (path,) in rows],
+        )
+
+    def jobs_created_before(self, kind: str, cutoff: float) -> List[str]:
+        rows = self._conn().execute(
+            "SELECT DISTINCT job_id FROM artifacts WHERE kind = ? AND created_at < ?",
+            (kind, cutoff),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def jobs_oldest_first(self) -> List[tuple]:
+        """(job_id, total_size, first_created_at) per job, oldest job first."""
+        return self._conn().execute(
+            "SELECT job_id, SUM(size), MIN(created_at) AS first FROM artifacts "
+            "GROUP BY job_id ORDER BY first"
+        ).fetchall()
+
+
+class RetentionService:
+    """
+    Evicts media by age (inputs after INPUT_RETENTION_HOURS, whole jobs after
+    OUTPUT_RETENTION_DAYS) and, oldest job first, when the indexed total exceeds
+    the disk budget. Jobs returned by `protected_jobs()` (e.g. running) are skipped.
+    `untracked_bytes()` is what else lives on the volume (databases, ...); it counts
+    against the budget but is never evicted here.
+    """
+
+    def __init__(
+        self,
+        index: ArtifactIndex,
+        input_retention_hours: float,
+        output_retention_days: float,
+        disk_budget_mb: float,
+        protected_jobs: Optional[Callable[[], Set[str]]] = None,
+        untracked_bytes: Optional[Callable[[], int]] = None,
+    ):
+        self.index = index
+        self.input_retention_sec = input_retention_hours * 3600
+        self.output_retention_sec = output_retention_days * 86400
+        self.disk_budget_bytes = int(disk_budget_mb * 1024 * 1024)
+        self.protected_jobs = protected_jobs or (lambda: set())
+        self.untracked_bytes = untracked_bytes or (lambda: 0)
+
+    def sweep(self) -> dict:
+        """Run one eviction pass; returns counters for logging/metrics."""
+        now = time.time()
+        protected = self.protected_jobs()
+        stats = {"inputs_expired": 0, "jobs_expired": 0, "jobs_evicted_for_budget": 0}
+
+        for job_id in self.index.jobs_created_before(KIND_INPUT, now - self.input_retention_sec):
+            if job_id in protected:
+                continue
+            self.index.delete_job(job_id, kind=KIND_INPUT)
+            stats["inputs_expired"] += 1
+
+        for job_id in self.index.jobs_created_before(KIND_OUTPUT, now - self.output_retention_sec):
+            if job_id in protected:
+                continue
+            self.index.delete_job(job_id)
+            stats["jobs_expired"] += 1
+
+        total = self.index.total_size() + self.untracked_bytes()
+        if total > self.disk_budget_bytes:
+            for job_id, size, _ in self.index.jobs_oldest_first():
+                if total <= self.disk_budget_bytes:
+                    break
+                if job_id in protected:
+                    continue
+                self.index.delete_job(job_id)
+                total -= int(size or 0)
+                stats["jobs_evicted_for_budget"] += 1
+
+        stats["total_bytes"] = total
+        if stats["inputs_expired"] or stats["jobs_expired"] or stats["jobs_evicted_for_budget"]:
+            logger.info(f"Retention sweep: {stats}")
+        return stats
+
+    async def run_forever(self, interval_sec: float) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.warning(f"Retention sweep failed: {e}")
+            await asyncio.sleep(interval_sec)
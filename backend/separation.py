@@ -12,6 +12,7 @@ import soundfile as sf
 from loguru import logger
 
 from config import settings
+from metrics import stage_timer
 
 
 def _separate_with_demucs(audio_path: Path) -> Optional[Path]:
@@ -34,7 +35,8 @@ def _separate_with_demucs(audio_path: Path) -> Optional[Path]:
             str(audio_path),
         ]
         logger.info(f"Running Demucs: {' '.join(cmd)}")
-        subprocess.run(cmd, check=True, timeout=settings.DEMUCS_TIMEOUT)
+        with stage_timer("separation_demucs"):
+            subprocess.run(cmd, check=True, timeout=settings.DEMUCS_TIMEOUT)
 
         # Expected path: <out>/<model>/<basename>/<target>.wav
         candidate = output_dir / settings.DEMUCS_MODEL / audio_path.stem / f"{settings.DEMUCS_TARGET}.wav"
@@ -54,8 +56,11 @@ def _separate_with_demucs(audio_path: Path) -> Optional[Path]:
 def _separate_with_hpss(audio_path: Path) -> Optional[Path]:
     """Fallback harmonic/percussive separation with librosa."""
     try:
-        y, sr = librosa.load(str(audio_path), sr=None, mono=True)
-        harmonic, _ = librosa.effects.hpss(y)
+        with stage_timer("separation_hpss"):
+            y, sr = librosa.load(
+                str(audio_path), sr=None, mono=True, duration=settings.MAX_AUDIO_DURATION_SEC
+            )
+            harmonic, _ = librosa.effects.hpss(y)
         output_dir = audio_path.parent / "separated"
         output_dir.mkdir(exist_ok=True)
         out_path = output_dir / f"{audio_path.stem}_melody.wav"
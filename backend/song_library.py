@@ -0,0 +1,396 @@
+"""
+Known-song arrangement library keyed by ACRCloud acrid.
+
+    media/library/{acrid}/entry.json
+    media/library/{acrid}/{rev}/base.mid                best-quality (or curated) base MIDI
+    media/library/{acrid}/{rev}/L{n}[_audio].mid        arranged MIDI per level
+    media/library/{acrid}/{rev}/L{n}[_audio]_full.mp4   rendered videos (+ _preview.mp4)
+
+When a job's track is identified with score >= ACR_LIBRARY_MIN_SCORE and the
+acrid is in the library, the pipeline links these files into the job instead
+of transcribing and rendering. Jobs offer their own results back: a base MIDI
+replaces the stored one only if its melody_quality is higher, and curated
+entries are never replaced.
+
+Each base MIDI revision has its own directory, so jobs still linking from a
+replaced revision keep their files; retired revisions are deleted after
+RETIRED_REVISION_GRACE_SEC. The library is kept within SONG_LIBRARY_MAX_MB:
+beyond it, the least recently used non-curated songs are evicted. Updates are
+serialized across workers with a lock file.
+
+Adding a curated base MIDI:
+    python song_library.py add <acrid> song.mid --title "..." --artist "..."
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+from config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows (run_backend.ps1)
+    fcntl = None
+    import msvcrt
+
+SOURCE_CURATED = "curated"
+SOURCE_JOB = "job"
+
+_ACRID_RE = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+# How long a replaced revision's files stay for jobs that looked it up before
+RETIRED_REVISION_GRACE_SEC = 600
+
+
+def _lock_file(lock_file) -> None:
+    """Exclusive, blocking lock on an open file (shared by worker processes)."""
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return
+    lock_file.seek(0)
+    while True:
+        try:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:  # LK_LOCK gives up after ~10s
+            continue
+
+
+def _unlock_file(lock_file) -> None:
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return
+    lock_file.seek(0)
+    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def link_or_copy(src: Path, dst: Path) -> None:
+    """Hard-link src to dst (same volume, no copy); copy if linking is not possible."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class SongLibrary:
+    """acrid -> stored base MIDI and per-level renders (see module docstring)."""
+
+    def __init__(self, root: Path, min_score: float, max_mb: Optional[float] = None):
+        self.root = Path(root)
+        self.min_score = min_score
+        self.max_bytes = int(max_mb * 1024 * 1024) if max_mb else None
+        self._entries: Dict[str, Tuple[int, dict]] = {}
+        self._lock = threading.Lock()  # entry cache
+        self._update_lock = threading.Lock()  # updates within this process
+
+    # ---------- lookup ----------
+
+    def match(self, identified: Optional[dict]) -> Optional[str]:
+        """The acrid of an identification confident enough to use the library."""
+        if not identified:
+            return None
+        acrid = identified.get("acrid")
+        try:
+            score = float(identified.get("score") or 0)
+        except (TypeError, ValueError):
+            return None
+        if not acrid or not _ACRID_RE.match(acrid) or score < self.min_score:
+            return None
+        return acrid
+
+    def _entry_dir(self, acrid: str) -> Path:
+        return self.root / acrid
+
+    def lookup(self, acrid: str) -> Optional[dict]:
+        """Entry for an acrid; re-read only when entry.json changed (other workers)."""
+        entry_path = self._entry_dir(acrid) / "entry.json"
+        try:
+            mtime = entry_path.stat().st_mtime_ns
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._entries.get(acrid)
+            if cached is None or cached[0] != mtime:
+                try:
+                    cached = (mtime, json.loads(entry_path.read_text()))
+                except (OSError, ValueError):
+                    return None
+                self._entries[acrid] = cached
+            return cached[1]
+
+    def stored_base(self, acrid: str) -> Optional[Tuple[dict, Path]]:
+        """
+        (entry, base MIDI path) from a single lookup, so the MIDI always matches
+        the entry's revision and metadata. Counts as a use for eviction.
+        """
+        entry = self.lookup(acrid)
+        if not entry or not entry.get("base_midi"):
+            return None
+        path = self._entry_dir(acrid) / entry["base_midi"]
+        if not path.exists():
+            return None
+        try:
+            (self._entry_dir(acrid) / ".used").touch()
+        except OSError:
+            pass
+        return entry, path
+
+    @staticmethod
+    def _variant(level: int, with_audio: bool) -> str:
+        return f"L{level}_audio" if with_audio else f"L{level}"
+
+    def level_files(
+        self, acrid: str, revision: str, level: int, with_audio: bool
+    ) -> Optional[Dict[str, Path]]:
+        """
+        Stored {midi, full_video, preview_video} for a level, if they were made
+        from base MIDI `revision` and are all on disk.
+        """
+        entry = self.lookup(acrid)
+        if not entry or entry.get("revision") != revision:
+            return None
+        stored = entry.get("levels", {}).get(self._variant(level, with_audio))
+        if not stored:
+            return None
+        files = {name: self._entry_dir(acrid) / rel for name, rel in stored.items()}
+        return files if all(path.exists() for path in files.values()) else None
+
+    # ---------- updates ----------
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Serialize updates between threads and between worker processes."""
+        with self._update_lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(self.root / ".lock", "a+") as lock_file:
+                _lock_file(lock_file)
+                try:
+                    yield
+                finally:
+                    _unlock_file(lock_file)
+
+    def _read_entry(self, acrid: str) -> Optional[dict]:
+        """entry.json as on disk (no cache); call with the update lock held."""
+        try:
+            return json.loads((self._entry_dir(acrid) / "entry.json").read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _write_entry(self, acrid: str, entry: dict) -> None:
+        entry_dir = self._entry_dir(acrid)
+        entry_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = entry_dir / "entry.json.tmp"
+        tmp_path.write_text(json.dumps(entry, indent=2))
+        os.replace(tmp_path, entry_dir / "entry.json")
+
+    def offer_base(
+        self,
+        acrid: str,
+        identified: dict,
+        midi_path: Path,
+        metadata: Dict[str, Any],
+        job_id: Optional[str] = None,
+        source: str = SOURCE_JOB,
+    ) -> Optional[str]:
+        """
+        Store a base MIDI if it beats the current one. Returns the new entry
+        revision (renders made from this MIDI are offered with it), else None.
+        """
+        quality = metadata.get("melody_quality")
+        with self._locked():
+            current = self._read_entry(acrid)
+            if current and source != SOURCE_CURATED:
+                if current.get("source") == SOURCE_CURATED:
+                    return None
+                current_quality = current.get("quality")
+                if current_quality is not None and (
+                    quality is None or quality <= current_quality
+                ):
+                    return None
+
+            revision = uuid.uuid4().hex
+            retired = dict((current or {}).get("retired") or {})
+            if current and current.get("revision"):
+                # Renders of the previous base MIDI no longer match; its files
+                # stay for RETIRED_REVISION_GRACE_SEC for jobs linking from them
+                retired[current["revision"]] = time.time()
+            try:
+                revision_dir = self._entry_dir(acrid) / revision
+                revision_dir.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(midi_path, revision_dir / "base.mid")
+                self._write_entry(
+                    acrid,
+                    {
+                        "acrid": acrid,
+                        "title": identified.get("title"),
+                        "artist": identified.get("artist"),
+                        "source": source,
+                        "job_id": job_id,
+                        "quality": quality,
+                        "metadata": metadata,
+                        "base_midi": f"{revision}/base.mid",
+                        "revision": revision,
+                        "levels": {},
+                        "retired": self._prune_retired(acrid, retired),
+                        "updated_at": time.time(),
+                    },
+                )
+            except OSError as e:
+                logger.warning(f"Song library: could not store base MIDI for {acrid}: {e}")
+                return None
+            self._enforce_budget(keep=acrid)
+        logger.info(
+            f"Song library: stored base MIDI for {acrid} (quality={quality}, source={source})"
+        )
+        return revision
+
+    def offer_level(
+        self,
+        acrid: str,
+        revision: str,
+        level: int,
+        with_audio: bool,
+        midi_path: Path,
+        full_video: Path,
+        preview_video: Path,
+    ) -> bool:
+        """
+        Store a level's arrangement and videos. Only renders made from the
+        currently stored base MIDI (same `revision`) are accepted.
+        """
+        variant = self._variant(level, with_audio)
+        with self._locked():
+            # Re-read under the lock: another job may just have replaced the base MIDI
+            entry = self._read_entry(acrid)
+            if not entry or entry.get("revision") != revision:
+                return False
+            entry_dir = self._entry_dir(acrid)
+            stored = {}
+            try:
+                for name, src, suffix in (
+                    ("midi", midi_path, ".mid"),
+                    ("full_video", full_video, "_full.mp4"),
+                    ("preview_video", preview_video, "_preview.mp4"),
+                ):
+                    rel = f"{revision}/{variant}{suffix}"
+                    # Copied, not linked: the job's files may be rewritten in place later
+                    shutil.copy2(src, entry_dir / rel)
+                    stored[name] = rel
+                entry["levels"] = dict(entry.get("levels") or {}, **{variant: stored})
+                entry["updated_at"] = time.time()
+                self._write_entry(acrid, entry)
+            except OSError as e:
+                logger.warning(f"Song library: could not store {variant} for {acrid}: {e}")
+                return False
+            self._enforce_budget(keep=acrid)
+        logger.info(f"Song library: stored {variant} for {acrid}")
+        return True
+
+    # ---------- cleanup ----------
+
+    def _prune_retired(self, acrid: str, retired: Dict[str, float]) -> Dict[str, float]:
+        """Delete revisions retired longer than the grace period; returns the rest."""
+        now = time.time()
+        kept = {}
+        for revision, retired_at in retired.items():
+            if now - retired_at > RETIRED_REVISION_GRACE_SEC:
+                shutil.rmtree(self._entry_dir(acrid) / revision, ignore_errors=True)
+            else:
+                kept[revision] = retired_at
+        return kept
+
+    def _usage(self) -> List[Tuple[float, str, int, bool]]:
+        """(last used, acrid, bytes, curated) per stored song."""
+        songs = []
+        for entry_dir in self.root.iterdir() if self.root.is_dir() else ():
+            if not entry_dir.is_dir():
+                continue
+            size = 0
+            for path in entry_dir.rglob("*"):
+                try:
+                    size += path.stat().st_size if path.is_file() else 0
+                except OSError:
+                    pass
+            entry = self._read_entry(entry_dir.name) or {}
+            used_at = 0.0
+            for marker in (".used", "entry.json"):
+                try:
+                    used_at = max(used_at, (entry_dir / marker).stat().st_mtime)
+                except OSError:
+                    pass
+            curated = entry.get("source") == SOURCE_CURATED
+            songs.append((used_at, entry_dir.name, size, curated))
+        return songs
+
+    def size_bytes(self) -> int:
+        """Bytes stored in the library (counted against MEDIA_DISK_BUDGET_MB)."""
+        return sum(size for _, _, size, _ in self._usage())
+
+    def _enforce_budget(self, keep: str) -> None:
+        """
+        Prune retired revisions, then evict least recently used non-curated
+        songs (never `keep`) until the library fits max_bytes. Update lock held.
+        """
+        for entry_dir in self.root.iterdir():
+            entry = self._read_entry(entry_dir.name) if entry_dir.is_dir() else None
+            if entry and entry.get("retired"):
+                retired = self._prune_retired(entry_dir.name, entry["retired"])
+                if retired != entry["retired"]:
+                    self._write_entry(entry_dir.name, dict(entry, retired=retired))
+        if self.max_bytes is None:
+            return
+        songs = sorted(self._usage())
+        total = sum(size for _, _, size, _ in songs)
+        for _, acrid, size, curated in songs:
+            if total <= self.max_bytes:
+                break
+            if curated or acrid == keep:
+                continue
+            shutil.rmtree(self._entry_dir(acrid), ignore_errors=True)
+            with self._lock:
+                self._entries.pop(acrid, None)
+            total -= size
+            logger.info(f"Song library: evicted {acrid} ({size} bytes) to stay within budget")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ShazaPiano song library tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("add", help="Add a curated base MIDI for an acrid")
+    add.add_argument("acrid")
+    add.add_argument("midi", type=Path)
+    add.add_argument("--title")
+    add.add_argument("--artist")
+    add.add_argument("--key", default="C")
+    add.add_argument("--tempo", type=float, default=120.0)
+    args = parser.parse_args()
+
+    if args.command == "add":
+        library = SongLibrary(
+            settings.SONG_LIBRARY_DIR, settings.ACR_LIBRARY_MIN_SCORE, settings.SONG_LIBRARY_MAX_MB
+        )
+        library.offer_base(
+            args.acrid,
+            {"title": args.title, "artist": args.artist},
+            args.midi,
+            {"key": args.key, "tempo": args.tempo, "melody_quality": None},
+            source=SOURCE_CURATED,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Deterministic synthetic audio: sine and piano-like melodies, chords, noise and
+silence. Used by the startup warmup, the benchmark corpus and the load test.
+"""
+from __future__ import annotations
+
+from typing import Callable
+
+import numpy as np
+
+SAMPLE_RATE = 22050
+
+# C major phrase (MIDI pitches), repeated to fill the clip
+MELODY = (60, 62, 64, 65, 67, 65, 64, 62, 64, 67, 72, 71, 69, 67, 65, 64)
+_CHORDS = ((60, 64, 67), (57, 60, 64), (53, 57, 60), (55, 59, 62))
+NOTE_SEC = 0.4
+_CHORD_SEC = 1.6
+
+
+def _hz(pitch: int) -> float:
+    return 440.0 * 2 ** ((pitch - 69) / 12)
+
+
+def _tone(pitch: int, seconds: float, piano: bool) -> np.ndarray:
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    freq = _hz(pitch)
+    if piano:
+        # Decaying partials with a short attack, roughly piano-like
+        wave = sum(
+            (0.6 ** k) * np.sin(2 * np.pi * freq * (k + 1) * t) for k in range(5)
+        )
+        envelope = np.minimum(t / 0.005, 1.0) * np.exp(-3.0 * t)
+    else:
+        wave = np.sin(2 * np.pi * freq * t)
+        # 10 ms fades avoid clicks between notes
+        envelope = np.minimum(1.0, np.minimum(t, seconds - t) / 0.01)
+    return (wave * envelope).astype(np.float32)
+
+
+def _fill(pieces: Callable[[int], np.ndarray], length_sec: float) -> np.ndarray:
+    total = int(length_sec * SAMPLE_RATE)
+    out = np.zeros(total, dtype=np.float32)
+    offset = 0
+    index = 0
+    while offset < total:
+        piece = pieces(index)[: total - offset]
+        out[offset:offset + len(piece)] = piece
+        offset += len(piece)
+        index += 1
+    return out
+
+
+def synth_clip(kind: str, length_sec: float, seed: int = 0) -> np.ndarray:
+    """Deterministic mono float32 clip at SAMPLE_RATE."""
+    if kind == "sine":
+        audio = _fill(lambda i: _tone(MELODY[i % len(MELODY)], NOTE_SEC, False), length_sec)
+    elif kind == "piano":
+        audio = _fill(lambda i: _tone(MELODY[i % len(MELODY)], NOTE_SEC, True), length_sec)
+    elif kind == "chords":
+        audio = _fill(
+            lambda i: sum(_tone(p, _CHORD_SEC, True) for p in _CHORDS[i % len(_CHORDS)]) / 3,
+            length_sec,
+        )
+    elif kind == "noise":
+        rng = np.random.default_rng(seed)
+        audio = rng.standard_normal(int(length_sec * SAMPLE_RATE)).astype(np.float32)
+    elif kind == "silence":
+        audio = np.zeros(int(length_sec * SAMPLE_RATE), dtype=np.float32)
+    else:
+        raise ValueError(f"Unknown clip kind: {kind}")
+    peak = float(np.max(np.abs(audio))) if len(audio) else 0.0
+    return audio * (0.5 / peak) if peak > 0 else audio
@@ -29,6 +29,52 @@ def test_root_endpoint():
     assert data["status"] == "ok"
 
 
+def test_ready_endpoint(monkeypatch):
+    """Test readiness once the pipeline modules are loaded and warmed up"""
+    import app as app_module
+
+    from warmup import WarmupReport
+
+    app_module.pipeline_modules.load_all()
+    monkeypatch.setattr(app_module, "warmup_report", None)
+    assert client.get("/ready").status_code == 503
+
+    monkeypatch.setattr(app_module, "warmup_report", WarmupReport({"decode": 0.01}, 0.01))
+    response = client.get("/ready")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "ready"
+    assert set(data["imports_sec"]) == {
+        "inference", "separation", "arranger", "render", "pretty_midi"
+    }
+    assert data["warmup_sec"] == {"decode": 0.01}
+
+
+def test_ready_without_warmup_when_image_cache_is_baked(tmp_path, monkeypatch):
+    """The startup warmup is skipped (and not waited for) when the image ships a warm cache"""
+    import app as app_module
+
+    from warmup import BAKED_MARKER
+
+    app_module.pipeline_modules.load_all()
+    monkeypatch.setattr(app_module, "warmup_report", None)
+    monkeypatch.setenv("NUMBA_CACHE_DIR", str(tmp_path))
+    (tmp_path / BAKED_MARKER).write_text("{}")
+
+    assert client.get("/ready").status_code == 200
+
+
+def test_metrics_endpoint():
+    """Test Prometheus metrics endpoint"""
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE shazapiano_stage_duration_seconds histogram" in response.text
+    assert "shazapiano_worker_utilization_ratio 0.0" in response.text
+
+
 def test_process_missing_file():
     """Test process endpoint without file"""
     response = client.post("/process")
@@ -44,6 +90,285 @@ def test_process_invalid_levels():
     assert response.status_code == 400  # Bad request
 
 
+def test_process_rejects_overlong_audio(tmp_path):
+    """Audio longer than REJECT_AUDIO_DURATION_SEC is refused from its header"""
+    import subprocess
+
+    path = tmp_path / "long.wav"
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "anullsrc=r=8000:cl=mono",
+         "-t", "90", "-y", str(path)],
+        check=True,
+    )
+    files = {"audio": ("long.wav", path.read_bytes(), "audio/wav")}
+    response = client.post("/process", files=files, data={"levels": "1"})
+
+    assert response.status_code == 413
+
+
+def test_streaming_job_upload(tmp_path):
+    """POST /jobs/stream takes the /jobs form and decodes while receiving"""
+    import subprocess
+
+    path = tmp_path / "clip.wav"
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "sine=frequency=440:duration=3",
+         "-y", str(path)],
+        check=True,
+    )
+    files = {"audio": ("clip.wav", path.read_bytes(), "audio/wav")}
+    response = client.post("/jobs/stream", files=files, data={"levels": "1,2"})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "awaiting_ad"
+    assert [level["level"] for level in data["levels"]] == [1, 2]
+    client.delete(f"/cleanup/{data['job_id']}")
+
+
+def test_process_notes_only(tmp_path):
+    """notes_only skips the videos and keeps MIDI and expected notes"""
+    import subprocess
+
+    from media_layout import job_output_dir
+
+    path = tmp_path / "clip.wav"
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "sine=frequency=440:duration=3",
+         "-y", str(path)],
+        check=True,
+    )
+    files = {"audio": ("clip.wav", path.read_bytes(), "audio/wav")}
+    response = client.post("/process", files=files, data={"levels": "1", "notes_only": "true"})
+
+    assert response.status_code == 200
+    data = response.json()
+    level = data["levels"][0]
+    assert level["status"] == "success"
+    assert level["video_available"] is False
+    assert level["video_url"] == level["preview_url"] == ""
+    assert level["midi_url"].endswith("_L1.mid")
+    assert data["expected_notes_urls"]["L1"]
+    assert not list(job_output_dir(data["job_id"]).glob("*.mp4"))
+    client.delete(f"/cleanup/{data['job_id']}")
+
+
+def test_process_runs_in_a_job_slot(tmp_path, monkeypatch):
+    """/process stages count as an active job, like the /jobs runner"""
+    import subprocess
+
+    import app as app_module
+    from metrics import JOBS_ACTIVE
+
+    arrange_level = app_module.arranger.arrange_level
+    active = []
+
+    def recording_arrange(**kwargs):
+        active.append(JOBS_ACTIVE.value())
+        return arrange_level(**kwargs)
+
+    monkeypatch.setattr(app_module.arranger, "arrange_level", recording_arrange)
+    path = tmp_path / "clip.wav"
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "sine=frequency=440:duration=3",
+         "-y", str(path)],
+        check=True,
+    )
+    files = {"audio": ("clip.wav", path.read_bytes(), "audio/wav")}
+    response = client.post("/process", files=files, data={"levels": "1", "notes_only": "true"})
+
+    assert response.status_code == 200
+    assert active == [1]
+    assert JOBS_ACTIVE.value() == 0
+    client.delete(f"/cleanup/{response.json()['job_id']}")
+
+
+def _seed_running_job(checkpoints, levels):
+    """A running job whose runner died after the given checkpoints"""
+    import app as app_module
+
+    job_id = app_module._new_job_id()
+    input_path = app_module.job_input_dir(job_id) / f"{job_id}_input.wav"
+    input_path.write_bytes(b"RIFF")
+    app_module.job_store.put({
+        "job_id": job_id,
+        "user_id": "u1",
+        "status": "running",
+        "input_path": str(input_path),
+        "requested_levels": levels,
+        "levels": [app_module._build_level_payload(level, "processing") for level in levels],
+        "checkpoints": checkpoints(job_id, app_module.job_output_dir(job_id)),
+    })
+    return job_id
+
+
+def test_resumed_job_skips_checkpointed_stages(monkeypatch):
+    """Raw MIDI and level 1 are checkpointed: no transcription, only level 2 renders"""
+    import asyncio
+
+    import pretty_midi
+
+    import app as app_module
+
+    def checkpoints(job_id, output_dir):
+        midi = pretty_midi.PrettyMIDI()
+        piano = pretty_midi.Instrument(program=0)
+        piano.notes += [pretty_midi.Note(100, 60 + i, i * 0.5, i * 0.5 + 0.4) for i in range(4)]
+        midi.instruments.append(piano)
+        raw = output_dir / f"{job_id}_raw.mid"
+        midi.write(str(raw))
+        full = output_dir / f"{job_id}_L1_full.mp4"
+        full.write_bytes(b"video")
+        return {
+            "raw_midi": {"path": str(raw), "metadata": {"key": "C", "tempo": 120}},
+            "L1_rendered": {
+                "path": str(full),
+                "full_video": str(full),
+                "preview_video": str(full),
+                "expected_notes_url": "/media/L1.json",
+                "level": {
+                    "status": "success",
+                    "video_url": "/media/L1_full.mp4",
+                    "preview_url": "/media/L1_preview.mp4",
+                    "midi_url": "/media/L1.mid",
+                },
+            },
+        }
+
+    def transcribe(*args, **kwargs):
+        raise AssertionError("raw MIDI is checkpointed")
+
+    rendered = []
+
+    def render_level_video(midi, level, level_name, output_dir, job_id, **kwargs):
+        rendered.append(level)
+        full = output_dir / f"{job_id}_L{level}_full.mp4"
+        preview = output_dir / f"{job_id}_L{level}_full_preview.mp4"
+        for path in (full, preview):
+            path.write_bytes(b"video")
+        return full, preview, None
+
+    app_module.pipeline_modules.load_all()
+    monkeypatch.setattr(app_module.inference, "process_audio_to_midi", transcribe)
+    monkeypatch.setattr(app_module.render, "render_level_video", render_level_video)
+    job_id = _seed_running_job(checkpoints, [1, 2])
+
+    try:
+        asyncio.run(app_module._run_job_stages(job_id, [1, 2], False))
+
+        job = app_module.job_store.get(job_id)
+        assert rendered == [2]
+        assert job["status"] == "complete"
+        assert job["expected_notes_urls"]["L1"] == "/media/L1.json"
+        # The runner died after checkpointing L1: its result is restored, not left processing
+        assert [level["status"] for level in job["levels"]] == ["success", "success"]
+        assert job["levels"][0]["video_url"] == "/media/L1_full.mp4"
+        assert job["levels"][0]["preview_url"] == "/media/L1_preview.mp4"
+        assert job["levels"][0]["midi_url"] == "/media/L1.mid"
+        assert job["checkpoints"]["L2_rendered"]["level"]["video_url"] == (
+            job["levels"][1]["video_url"]
+        )
+    finally:
+        client.delete(f"/cleanup/{job_id}")
+
+
+@pytest.mark.parametrize("profile,offered", [("balanced", [1]), ("degraded", [])])
+def test_only_full_quality_levels_are_offered_to_the_song_library(monkeypatch, profile, offered):
+    """Levels encoded with a load profile are not stored for later jobs of the song"""
+    import asyncio
+
+    import pretty_midi
+
+    import app as app_module
+
+    def checkpoints(job_id, output_dir):
+        midi = pretty_midi.PrettyMIDI()
+        piano = pretty_midi.Instrument(program=0)
+        piano.notes += [pretty_midi.Note(100, 60 + i, i * 0.5, i * 0.5 + 0.4) for i in range(4)]
+        midi.instruments.append(piano)
+        raw = output_dir / f"{job_id}_raw.mid"
+        midi.write(str(raw))
+        return {"raw_midi": {"path": str(raw), "metadata": {}, "library_revision": "rev-1"}}
+
+    def render_level_video(midi, level, level_name, output_dir, job_id, **kwargs):
+        full = output_dir / f"{job_id}_L{level}_full.mp4"
+        preview = output_dir / f"{job_id}_L{level}_full_preview.mp4"
+        for path in (full, preview):
+            path.write_bytes(b"video")
+        return full, preview, None
+
+    stored = []
+    app_module.pipeline_modules.load_all()
+    monkeypatch.setattr(app_module.settings, "LAZY_VIDEO_RENDER", False)
+    monkeypatch.setattr(app_module.render, "render_level_video", render_level_video)
+    monkeypatch.setattr(app_module.render, "select_encoder_profile", lambda queued: profile)
+    monkeypatch.setattr(app_module.song_library, "level_files", lambda *args: None)
+    monkeypatch.setattr(
+        app_module.song_library,
+        "offer_level",
+        lambda acrid, revision, level, *args: stored.append(level),
+    )
+    job_id = _seed_running_job(checkpoints, [1])
+    app_module.job_store.update(
+        job_id, lambda job: job.update(identified={"acrid": "abc123", "score": 100})
+    )
+
+    try:
+        asyncio.run(app_module._run_job_stages(job_id, [1], False))
+
+        assert app_module.job_store.get(job_id)["levels"][0]["status"] == "success"
+        assert stored == offered
+    finally:
+        client.delete(f"/cleanup/{job_id}")
+
+
+def test_job_interrupted_too_often_is_not_resumed(monkeypatch):
+    """After JOB_MAX_ATTEMPTS runs died, the orphaned job is failed instead of resumed"""
+    import asyncio
+
+    import app as app_module
+
+    spawned = []
+    monkeypatch.setattr(app_module, "_spawn_job", lambda job_id, *args: spawned.append(job_id))
+    monkeypatch.setattr(app_module.settings, "JOB_MAX_ATTEMPTS", 2)
+    job_id = _seed_running_job(lambda job_id, output_dir: {}, [1])
+    store = app_module.job_store
+
+    try:
+        store.acquire_lease(job_id, "dead-runner", ttl_sec=-1, attempt=True)
+        asyncio.run(app_module._resume_orphaned_jobs())
+        assert job_id in spawned and store.attempts(job_id) == 2
+
+        store.release_lease(job_id, app_module.RUNNER_ID)
+        spawned.clear()
+        asyncio.run(app_module._resume_orphaned_jobs())
+
+        job = store.get(job_id)
+        assert job_id not in spawned
+        assert job["status"] == "error"
+        assert job["levels"][0]["error"] == "Job interrupted 2 times, not resumed"
+    finally:
+        client.delete(f"/cleanup/{job_id}")
+
+
+def test_retention_protects_pending_jobs():
+    """Uploaded jobs awaiting /start keep their input until INPUT_RETENTION_HOURS"""
+    import app as app_module
+
+    store = app_module.job_store
+    fresh, stale = app_module._new_job_id(), app_module._new_job_id()
+    store.put({"job_id": fresh, "status": "awaiting_ad", "created_at": app_module._now_iso()})
+    store.put({"job_id": stale, "status": "awaiting_ad", "created_at": "2000-01-01T00:00:00"})
+
+    try:
+        protected = app_module._protected_jobs()
+        assert fresh in protected
+        assert stale not in protected
+    finally:
+        client.delete(f"/cleanup/{fresh}")
+        client.delete(f"/cleanup/{stale}")
+
+
 def test_cleanup_endpoint():
     """Test cleanup endpoint"""
     response = client.delete("/cleanup/test_job_123")
@@ -0,0 +1,56 @@
+"""
+Tests for audio_probe.py - duration from upload headers
+"""
+import asyncio
+import shutil
+import subprocess
+
+import pytest
+
+from audio_probe import PROBE_BYTES, probe_duration, probe_header
+
+
+def _encode(path, duration, *args):
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+         *args, "-y", str(path)],
+        check=True,
+    )
+    return path
+
+
+@pytest.mark.parametrize(
+    "name,args,container",
+    [
+        ("clip.wav", [], "wav"),
+        ("clip.mp3", ["-c:a", "libmp3lame"], "mp3"),
+        ("clip.m4a", ["-c:a", "aac", "-movflags", "+faststart"], "mp4"),
+    ],
+)
+def test_duration_from_first_bytes(tmp_path, name, args, container):
+    path = _encode(tmp_path / name, 40, *args)
+    head = path.read_bytes()[:PROBE_BYTES]
+
+    result = probe_header(head)
+
+    assert result.container == container
+    assert result.duration_sec == pytest.approx(40, abs=0.2)
+
+
+@pytest.mark.skipif(shutil.which("ffprobe") is None, reason="ffprobe not installed")
+def test_ffprobe_fallback(tmp_path):
+    path = _encode(tmp_path / "clip.m4a", 40, "-c:a", "aac", "-b:a", "192k")
+    assert asyncio.run(probe_duration(path)) == pytest.approx(40, abs=0.2)
+
+
+def test_moov_at_end_is_unknown_from_header(tmp_path):
+    """Phone recordings often put moov after mdat: only ffprobe on the stored file can tell"""
+    path = _encode(tmp_path / "clip.m4a", 40, "-c:a", "aac", "-b:a", "192k")
+    result = probe_header(path.read_bytes()[:PROBE_BYTES])
+
+    assert result.container == "mp4"
+    assert result.duration_sec is None
+
+
+def test_unknown_container():
+    assert probe_header(b"fake audio data").duration_sec is None
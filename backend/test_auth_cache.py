@@ -0,0 +1,179 @@
+"""
+Tests for auth_cache.py - ID-token claims cache (offline: local RSA key set,
+tokens signed with google.auth.crypt, verified by the production decoder).
+google-auth and cryptography come with firebase-admin (requirements.txt).
+"""
+import datetime
+import time
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from google.auth import crypt
+from google.auth import jwt as google_jwt
+
+from auth_cache import FirebaseTokenVerifier, PublicKeySet, TokenClaimsCache, _google_jwt_decode
+from metrics import AUTH_VERIFY_SAVED_SECONDS
+
+PROJECT_ID = "shazapiano-test"
+
+
+def _key_pair(kid):
+    """(signer, PEM certificate) for a fresh RSA key, like Google's x509 key set"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken.test")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    pem_key = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    signer = crypt.RSASigner.from_string(pem_key, key_id=kid)
+    return signer, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+SIGNERS, CERTS = {}, {}
+for _kid in ("kid-1", "kid-2", "attacker"):
+    SIGNERS[_kid], CERTS[_kid] = _key_pair(_kid)
+KEY_SET = {kid: CERTS[kid] for kid in ("kid-1", "kid-2")}
+
+
+class FakeClock:
+    """Cache/key-set clock; starts at real time since the decoder checks exp itself"""
+
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+def make_token(kid="kid-1", signer=None, **claims):
+    """Token signed with `signer` (default: kid's key), its header naming `kid`"""
+    return google_jwt.encode(signer or SIGNERS[kid], claims, key_id=kid).decode()
+
+
+@pytest.fixture
+def setup():
+    clock = FakeClock()
+    fetches = []
+
+    def fetch(url):
+        fetches.append(url)
+        return KEY_SET, 3600
+
+    calls = []
+
+    def decode(token, certs, audience):
+        calls.append(token)
+        return _google_jwt_decode(token, certs, audience)
+
+    key_set = PublicKeySet(fetch=fetch, clock=clock)
+    cache = TokenClaimsCache(max_entries=2, clock=clock)
+    verifier = FirebaseTokenVerifier(key_set, PROJECT_ID, cache, decode=decode)
+    return clock, fetches, calls, cache, verifier
+
+
+def _claims(clock, sub="user-1", ttl=600, **extra):
+    now = int(time.time())
+    claims = {
+        "iss": f"https://securetoken.google.com/{PROJECT_ID}",
+        "aud": PROJECT_ID,
+        "sub": sub,
+        "iat": now,
+        "exp": now + ttl,
+    }
+    claims.update(extra)
+    return claims
+
+
+def test_verify_then_cache_hit(setup):
+    """Second verification of the same token is served from the cache"""
+    clock, fetches, calls, cache, verifier = setup
+    token = make_token(**_claims(clock))
+    saved = AUTH_VERIFY_SAVED_SECONDS.value()
+
+    first = verifier.verify(token)
+    second = verifier.verify(token)
+
+    assert first["uid"] == "user-1"
+    assert second == first
+    assert len(calls) == 1
+    assert len(fetches) == 1
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert AUTH_VERIFY_SAVED_SECONDS.value() == pytest.approx(saved + stats["verify_seconds_avg"])
+
+
+def test_cache_entry_expires_at_token_exp(setup):
+    """A cached token stops being served once its exp passes"""
+    clock, _, calls, _, verifier = setup
+    token = make_token(**_claims(clock, ttl=60))
+    verifier.verify(token)
+
+    clock.now += 61
+    verifier.verify(token)
+
+    assert len(calls) == 2
+
+
+def test_rejects_expired_token(setup):
+    """The decoder enforces exp"""
+    clock, _, _, cache, verifier = setup
+    claims = _claims(clock, iat=int(time.time()) - 120, exp=int(time.time()) - 60)
+
+    with pytest.raises(ValueError):
+        verifier.verify(make_token(**claims))
+    assert len(cache) == 0
+
+
+def test_rejects_bad_signature_audience_and_issuer(setup):
+    """Forged signatures, other audiences and foreign issuers are rejected and never cached"""
+    clock, _, _, cache, verifier = setup
+    with pytest.raises(ValueError):  # claims a known kid, signed with another key
+        verifier.verify(make_token(signer=SIGNERS["attacker"], **_claims(clock)))
+    with pytest.raises(ValueError):
+        verifier.verify(make_token(kid="attacker", **_claims(clock)))
+    with pytest.raises(ValueError):
+        verifier.verify(make_token(**_claims(clock, aud="other-project")))
+    with pytest.raises(ValueError):
+        verifier.verify(make_token(**_claims(clock, iss="https://evil.example")))
+    assert len(cache) == 0
+
+
+def test_cache_is_bounded_lru(setup):
+    """Oldest entries are evicted beyond max_entries"""
+    clock, _, calls, cache, verifier = setup
+    tokens = [make_token(**_claims(clock, sub=f"user-{i}")) for i in range(3)]
+    for token in tokens:
+        verifier.verify(token)
+
+    assert len(cache) == 2
+    verifier.verify(tokens[0])
+    assert len(calls) == 4
+
+
+def test_key_set_refreshes_after_max_age(setup):
+    """Keys are refetched when their Cache-Control max-age elapses"""
+    clock, fetches, _, _, verifier = setup
+    verifier.verify(make_token(**_claims(clock, sub="a")))
+    clock.now += 3601
+    verifier.verify(make_token(kid="kid-2", **_claims(clock, sub="b")))
+
+    assert len(fetches) == 2
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
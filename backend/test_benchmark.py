@@ -0,0 +1,60 @@
+"""
+Tests for benchmark.py - synthetic corpus and regression comparison
+"""
+import shutil
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from benchmark import KINDS, SAMPLE_RATE, build_corpus, compare, frame_copies, measure, synth_clip
+
+
+def test_corpus_is_deterministic(tmp_path):
+    for kind in KINDS:
+        first = synth_clip(kind, 1.0)
+        assert len(first) == SAMPLE_RATE
+        assert np.array_equal(first, synth_clip(kind, 1.0))
+    assert not synth_clip("silence", 1.0).any()
+
+    corpus = build_corpus(tmp_path, kinds=("piano", "noise"), lengths=(0.5,))
+    assert [name for name, _ in corpus] == ["piano_0.5s", "noise_0.5s"]
+    audio, sr = sf.read(str(corpus[0][1]))
+    assert sr == SAMPLE_RATE
+    assert 0.4 < np.max(np.abs(audio)) <= 0.5
+
+
+def test_measure_records_errors():
+    def fail():
+        raise ValueError("no melody")
+
+    measurement, result = measure("noise_5s", "transcription", fail)
+    assert result is None
+    assert measurement.error == "ValueError: no melody"
+    assert measurement.wall_sec >= 0
+    assert measurement.peak_rss_mb > 0
+
+
+def test_compare_flags_slowdowns_beyond_tolerance():
+    def report(*rows):
+        return {
+            "results": [
+                {"clip": c, "stage": s, "wall_sec": w, "error": None} for c, s, w in rows
+            ]
+        }
+
+    baseline = report(("piano_5s", "pipeline", 10.0), ("piano_5s", "render_L1", 2.0))
+    current = report(("piano_5s", "pipeline", 11.0), ("piano_5s", "render_L1", 3.0))
+
+    regressions = compare(current, baseline, tolerance=0.2)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("piano_5s/render_L1")
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_frames_reach_ffmpeg_without_per_frame_copies():
+    result = frame_copies(frames=12)
+
+    assert result["frames"] >= 10
+    # Steady state: no frame-sized allocation between the renderer and the pipe
+    assert result["allocated_bytes_per_frame_max"] < result["frame_bytes"] // 10
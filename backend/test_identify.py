@@ -0,0 +1,75 @@
+"""
+Tests for identify.py - async ACRCloud identification against a local stub
+"""
+import asyncio
+import subprocess
+import time
+
+import pytest
+
+from acr_stub import AcrStubServer
+from identify import AcrIdentifier
+
+
+@pytest.fixture(scope="module")
+def long_audio(tmp_path_factory):
+    """30s 44.1kHz stereo WAV (~5MB), far larger than the excerpt"""
+    path = tmp_path_factory.mktemp("acr") / "song.wav"
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "sine=frequency=440:duration=30",
+         "-ac", "2", "-ar", "44100", "-y", str(path)],
+        check=True,
+    )
+    return path
+
+
+def _identifier(stub, **kwargs):
+    return AcrIdentifier(
+        host=stub.host, access_key="key", access_secret="secret", protocol="http", **kwargs
+    )
+
+
+def test_uploads_excerpt_and_caches_by_content(long_audio, tmp_path):
+    with AcrStubServer() as stub:
+        identifier = _identifier(stub, excerpt_sec=10)
+
+        async def scenario():
+            first = await identifier.identify(long_audio)
+            second = await identifier.identify(long_audio)
+            copy = tmp_path / "copy.wav"
+            copy.write_bytes(long_audio.read_bytes())
+            third = await identifier.identify(copy)
+            await identifier.aclose()
+            return first, second, third
+
+        first, second, third = asyncio.run(scenario())
+
+    assert first["title"] == "Stub Song"
+    assert first["artist"] == "Stub Artist"
+    assert first["acrid"] == "stub-acrid-0001"
+    assert second == first and third == first
+    assert stub.requests == 1  # same content hash -> served from cache
+    # 10s mono 8kHz 16-bit WAV instead of the 30s stereo 44.1kHz upload
+    assert stub.sample_sizes[0] < 200_000 < long_audio.stat().st_size
+
+
+def test_deadline_returns_none(long_audio):
+    with AcrStubServer(delay_sec=2.0) as stub:
+        identifier = _identifier(stub, deadline_sec=0.5)
+
+        async def scenario():
+            started = time.perf_counter()
+            result = await identifier.identify(long_audio)
+            await identifier.aclose()
+            return result, time.perf_counter() - started
+
+        result, elapsed = asyncio.run(scenario())
+
+    assert result is None
+    assert elapsed < 1.5
+    assert len(identifier._cache) == 0  # timeouts are not cached
+
+
+def test_disabled_without_credentials(long_audio):
+    identifier = AcrIdentifier(host=None, access_key=None, access_secret=None)
+    assert asyncio.run(identifier.identify(long_audio)) is None
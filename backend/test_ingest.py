@@ -0,0 +1,133 @@
+"""
+Tests for ingest.py - streaming decode and incremental multipart parsing
+"""
+import asyncio
+import hashlib
+import subprocess
+import sys
+
+import pytest
+
+import ingest as ingest_module
+from ingest import MultipartStream, StreamingIngest
+
+
+def _encode(path, duration, *args):
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+         *args, "-y", str(path)],
+        check=True,
+    )
+    return path.read_bytes()
+
+
+async def _ingest(tmp_path, data, suffix, chunk_size=4096, max_duration_sec=None):
+    ingest = StreamingIngest(
+        tmp_path / f"input{suffix}", tmp_path / "decoded.wav", max_duration_sec=max_duration_sec
+    )
+    await ingest.start()
+    for offset in range(0, len(data), chunk_size):
+        await ingest.feed(data[offset:offset + chunk_size])
+    return await ingest.finish()
+
+
+def test_decodes_while_storing(tmp_path):
+    data = _encode(tmp_path / "src.mp3", 20, "-c:a", "libmp3lame")
+
+    upload = asyncio.run(_ingest(tmp_path, data, ".mp3", max_duration_sec=5))
+
+    assert (tmp_path / "input.mp3").read_bytes() == data
+    assert upload.size == len(data)
+    assert upload.sha256 == hashlib.sha256(data).hexdigest()
+    assert upload.decoded_path == tmp_path / "decoded.wav"
+    # cut to max_duration_sec: 5s of 22.05kHz mono 16-bit PCM
+    assert upload.decoded_path.stat().st_size == pytest.approx(5 * 22050 * 2, rel=0.02)
+
+
+def test_undecodable_upload_falls_back(tmp_path):
+    """If ffmpeg can't decode the stream, the file is still stored for a later decode"""
+    data = b"not audio at all" * 1000
+
+    upload = asyncio.run(_ingest(tmp_path, data, ".m4a"))
+
+    assert upload.decoded_path is None
+    assert not (tmp_path / "decoded.wav").exists()
+    assert (tmp_path / "input.m4a").read_bytes() == data
+
+
+def _fake_decoder(monkeypatch, script):
+    """Run `script` in place of ffmpeg (same pipes)"""
+    spawn = asyncio.create_subprocess_exec
+
+    def fake_exec(*cmd, **kwargs):
+        return spawn(sys.executable, "-c", script, **kwargs)
+
+    monkeypatch.setattr(ingest_module.asyncio, "create_subprocess_exec", fake_exec)
+
+
+async def _ingest_with(tmp_path, data, drain_timeout_sec):
+    ingest = StreamingIngest(
+        tmp_path / "input.m4a", tmp_path / "decoded.wav", drain_timeout_sec=drain_timeout_sec
+    )
+    await ingest.start()
+    for offset in range(0, len(data), 65536):
+        await ingest.feed(data[offset:offset + 65536])
+    return ingest, await ingest.finish()
+
+
+def test_decoder_error_flood_does_not_stall_the_upload(tmp_path, monkeypatch):
+    """More stderr than a pipe holds: it is drained while the upload is fed"""
+    _fake_decoder(
+        monkeypatch,
+        "import sys; sys.stderr.write('corrupt packet\\n' * 50000); sys.stderr.flush(); "
+        "sys.stdin.buffer.read(); sys.exit(1)",
+    )
+    data = b"x" * (1024 * 1024)
+
+    ingest, upload = asyncio.run(_ingest_with(tmp_path, data, drain_timeout_sec=5))
+
+    assert ingest._proc.returncode == 1  # exited by itself, not killed on a drain timeout
+    assert upload.decoded_path is None
+    assert (tmp_path / "input.m4a").read_bytes() == data
+
+
+def test_decoder_that_stops_reading_is_abandoned(tmp_path, monkeypatch):
+    _fake_decoder(monkeypatch, "import time; time.sleep(30)")
+    data = b"x" * (1024 * 1024)
+
+    ingest, upload = asyncio.run(_ingest_with(tmp_path, data, drain_timeout_sec=0.2))
+
+    assert ingest._proc.returncode < 0  # killed
+    assert upload.decoded_path is None
+    assert (tmp_path / "input.m4a").read_bytes() == data
+
+
+def test_multipart_stream_yields_file_chunks_and_fields():
+    boundary = "----b0undary"
+    audio = bytes(range(256)) * 100
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"levels\"\r\n\r\n1,3\r\n"
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"audio\"; filename=\"rec.m4a\"\r\n"
+        f"Content-Type: audio/m4a\r\n\r\n"
+    ).encode() + audio + (
+        f"\r\n--{boundary}\r\nContent-Disposition: form-data; name=\"with_audio\"\r\n\r\ntrue\r\n"
+        f"--{boundary}--\r\n"
+    ).encode()
+
+    async def body_stream():
+        for offset in range(0, len(body), 1000):
+            yield body[offset:offset + 1000]
+
+    async def scenario():
+        form = MultipartStream(f"multipart/form-data; boundary={boundary}", body_stream())
+        part = await form.next_file()
+        chunks = [chunk async for chunk in form.file_chunks()]
+        fields = await form.finish()
+        return part, chunks, fields
+
+    part, chunks, fields = asyncio.run(scenario())
+
+    assert part == ("audio", "rec.m4a")
+    assert len(chunks) > 1  # delivered incrementally
+    assert b"".join(chunks) == audio
+    assert fields == {"levels": "1,3", "with_audio": "true"}
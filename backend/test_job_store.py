@@ -0,0 +1,121 @@
+"""
+Tests for job_store.py - SQLite job repository
+"""
+import time
+
+import pytest
+
+from job_store import JobStore
+
+
+def _job(job_id, status="awaiting_ad"):
+    return {"job_id": job_id, "user_id": "u1", "status": status, "levels": []}
+
+
+def test_put_get_roundtrip(tmp_path):
+    """Jobs persist across store instances (restart)"""
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    store.put(_job("job-1"))
+
+    reopened = JobStore(tmp_path / "jobs.sqlite3")
+    job = reopened.get("job-1")
+
+    assert job is not None
+    assert job["user_id"] == "u1"
+    assert reopened.get("missing") is None
+
+
+def test_update_is_visible_and_returns_job(tmp_path):
+    """update() applies the mutation and refreshes the cache"""
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    store.put(_job("job-1"))
+
+    def mark_running(job):
+        job["status"] = "running"
+
+    updated = store.update("job-1", mark_running)
+
+    assert updated["status"] == "running"
+    assert store.get("job-1")["status"] == "running"
+    assert [j["job_id"] for j in store.list_by_status("running")] == ["job-1"]
+    assert store.update("missing", mark_running) is None
+
+
+def test_cache_expires_for_other_writers(tmp_path):
+    """Writes from another worker become visible once the cache TTL elapses"""
+    reader = JobStore(tmp_path / "jobs.sqlite3", cache_ttl_sec=0.05)
+    writer = JobStore(tmp_path / "jobs.sqlite3")
+    writer.put(_job("job-1"))
+    assert reader.get("job-1")["status"] == "awaiting_ad"
+
+    writer.update("job-1", lambda job: job.update(status="complete"))
+    time.sleep(0.1)
+
+    assert reader.get("job-1")["status"] == "complete"
+
+
+def test_purge_finished_only_removes_old_finished_jobs(tmp_path):
+    """Cleanup deletes finished jobs older than the cutoff, keeps active ones"""
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    store.put(_job("done", status="complete"))
+    store.put(_job("failed", status="error"))
+    store.put(_job("active", status="running"))
+
+    assert store.purge_finished(max_age_sec=3600) == 0
+
+    removed = store.purge_finished(max_age_sec=-1)
+
+    assert removed == 2
+    assert store.get("done") is None
+    assert store.get("failed") is None
+    assert store.get("active") is not None
+
+
+def test_leases_block_other_runners_until_released(tmp_path):
+    """A live lease keeps other runners away; release makes the job claimable"""
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    store.put(_job("job-1", status="running"))
+
+    assert store.acquire_lease("job-1", "runner-a", ttl_sec=30)
+    assert store.acquire_lease("job-1", "runner-a", ttl_sec=30)  # re-entrant
+    assert not store.acquire_lease("job-1", "runner-b", ttl_sec=30)
+    assert store.claim_orphaned("runner-b", ttl_sec=30) == []
+
+    store.release_leases("runner-a")
+    claimed = store.claim_orphaned("runner-b", ttl_sec=30)
+
+    assert [job["job_id"] for job in claimed] == ["job-1"]
+    assert not store.acquire_lease("job-1", "runner-a", ttl_sec=30)
+
+
+def test_expired_lease_is_claimed(tmp_path):
+    """Jobs of a dead runner (expired lease) are resumed by another runner"""
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    store.put(_job("job-1", status="running"))
+    store.put(_job("job-2", status="complete"))
+    store.acquire_lease("job-1", "dead-runner", ttl_sec=-1)
+
+    claimed = store.claim_orphaned("runner-b", ttl_sec=30)
+
+    assert [job["job_id"] for job in claimed] == ["job-1"]
+
+
+def test_attempts_counted_on_start_and_each_claim(tmp_path):
+    """Every run of a job (start, then each resume of an orphan) is counted"""
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    store.put(_job("job-1", status="running"))
+    assert store.attempts("job-1") == 0
+
+    assert store.acquire_lease("job-1", "runner-a", ttl_sec=-1, attempt=True)
+    assert store.acquire_lease("job-1", "runner-a", ttl_sec=-1)  # renewal: same run
+    assert store.attempts("job-1") == 1
+
+    store.claim_orphaned("runner-b", ttl_sec=-1)
+    store.claim_orphaned("runner-c", ttl_sec=30)
+
+    assert store.attempts("job-1") == 3
+    assert store.attempts("missing") == 0
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
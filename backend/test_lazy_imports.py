@@ -0,0 +1,36 @@
+"""
+Tests for lazy_imports.py - deferred pipeline imports and readiness
+"""
+import asyncio
+import subprocess
+import sys
+from pathlib import Path
+
+from lazy_imports import LazyModule, LazyModules
+
+
+def test_app_import_skips_pipeline_modules():
+    probe = (
+        "import sys, app; "
+        "print(sorted(m for m in ('inference', 'render', 'separation', 'librosa', 'scipy.signal') "
+        "if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", probe], cwd=Path(__file__).parent, capture_output=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr.decode(errors="replace")[-2000:]
+    assert result.stdout.decode().strip().splitlines()[-1] == "[]"
+
+
+def test_lazy_modules_load_once_off_the_loop():
+    json_module = LazyModule("json")
+    group = LazyModules(json_module)
+    assert not group.ready
+
+    async def load_concurrently():
+        await asyncio.gather(group.ensure_loaded(), group.ensure_loaded())
+
+    asyncio.run(load_concurrently())
+    assert group.ready
+    assert json_module.dumps({"a": 1}) == '{"a": 1}'
+    assert group.report()["json"] is not None
@@ -0,0 +1,233 @@
+"""
+Tests for lazy_render.py - on-demand level videos, coalescing, render pool, cache budget
+"""
+import asyncio
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import pretty_midi
+import pytest
+from fastapi import HTTPException
+
+from lazy_render import LazyVideoRenderer, level_source, read_render_spec, write_render_spec
+
+
+def _job_id():
+    return f"{int(time.time())}_{uuid.uuid4().hex}"
+
+
+class FakeRender:
+    """Writes a level's full and preview videos after `delay` seconds."""
+
+    def __init__(self, output_dir, size=1000, delay=0.05, fail=False):
+        self.output_dir = output_dir
+        self.size = size
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, job_id, level):
+        self.calls.append((job_id, level))
+        self.release.wait()
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("encoder crashed")
+        files = [
+            self.output_dir / f"{job_id}_L{level}_full.mp4",
+            self.output_dir / f"{job_id}_L{level}_full_preview.mp4",
+        ]
+        for path in files:
+            path.write_bytes(b"\0" * self.size)
+        return files
+
+
+def _level(output_dir, level=1):
+    job_id = _job_id()
+    (output_dir / f"{job_id}_L{level}.mid").write_bytes(b"MThd")
+    return job_id, output_dir / f"{job_id}_L{level}_full.mp4"
+
+
+def _renderer(render, **overrides):
+    options = dict(workers=2, max_pending=4, cache_budget_mb=1)
+    options.update(overrides)
+    return LazyVideoRenderer(render, **options)
+
+
+def test_level_source():
+    job_id = _job_id()
+    key, midi = level_source(Path(f"/m/{job_id}_L3_full_preview.mp4"))
+
+    assert key == (job_id, 3) and midi.name == f"{job_id}_L3.mid"
+    assert level_source(midi) is None
+    assert level_source(midi.with_name(f"{job_id}_L5_full.mp4")) is None
+
+
+def test_concurrent_requests_share_one_render(tmp_path):
+    render = FakeRender(tmp_path, delay=0.2)
+    renderer = _renderer(render)
+    job_id, full = _level(tmp_path)
+    preview = full.with_name(f"{job_id}_L1_full_preview.mp4")
+
+    async def main():
+        await asyncio.gather(*(renderer.materialize(path) for path in (full, full, preview)))
+
+    asyncio.run(main())
+
+    assert render.calls == [(job_id, 1)]
+    assert full.is_file() and preview.is_file()
+    assert renderer.pending == 0
+
+
+def test_existing_video_or_missing_midi_is_not_rendered(tmp_path):
+    render = FakeRender(tmp_path)
+    renderer = _renderer(render)
+    job_id, full = _level(tmp_path)
+    full.write_bytes(b"video")
+
+    asyncio.run(renderer.materialize(full))
+    asyncio.run(renderer.materialize(tmp_path / f"{job_id}_L2_full.mp4"))  # no L2 MIDI
+    asyncio.run(renderer.materialize(tmp_path / f"{job_id}_L1.mid"))
+
+    assert render.calls == []
+
+
+def test_pending_renders_are_bounded(tmp_path):
+    render = FakeRender(tmp_path)
+    render.release.clear()
+    renderer = _renderer(render, workers=1, max_pending=1)
+    _, first = _level(tmp_path)
+    _, second = _level(tmp_path)
+
+    async def main():
+        running = asyncio.create_task(renderer.materialize(first))
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as busy:
+            await renderer.materialize(second)
+        render.release.set()
+        await running
+        return busy.value
+
+    busy = asyncio.run(main())
+
+    assert busy.status_code == 503 and busy.headers["Retry-After"]
+    assert first.is_file() and not second.exists()
+
+
+def test_cache_budget_evicts_least_recently_served(tmp_path):
+    render = FakeRender(tmp_path, size=200 * 1024)  # 400 KB per level
+    renderer = _renderer(render, cache_budget_mb=1)
+    levels = [_level(tmp_path)[1] for _ in range(3)]
+
+    async def main():
+        await renderer.materialize(levels[0])
+        await renderer.materialize(levels[1])
+        await renderer.materialize(levels[0])  # served again: now most recent
+        await renderer.materialize(levels[2])
+
+    asyncio.run(main())
+
+    assert levels[0].is_file() and levels[2].is_file()
+    assert not levels[1].exists()
+    assert renderer.cached_bytes <= 1024 * 1024
+
+    asyncio.run(renderer.materialize(levels[1]))  # evicted: rendered again from its MIDI
+    assert levels[1].is_file() and len(render.calls) == 4
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_failed_render_is_remembered_then_retried(tmp_path):
+    render = FakeRender(tmp_path, fail=True)
+    clock = FakeClock()
+    renderer = _renderer(render, failure_ttl_sec=60, clock=clock)
+    _, full = _level(tmp_path)
+
+    with pytest.raises(HTTPException) as failed:
+        asyncio.run(renderer.materialize(full))
+    assert failed.value.status_code == 500
+    assert renderer.pending == 0
+
+    render.fail = False
+    with pytest.raises(HTTPException) as cached:  # within the TTL: not rendered again
+        asyncio.run(renderer.materialize(full))
+    assert cached.value.status_code == 500 and len(render.calls) == 1
+
+    clock.now += 61
+    asyncio.run(renderer.materialize(full))
+    assert full.is_file() and len(render.calls) == 2
+
+
+def test_render_cancelled_by_shutdown_is_not_cached(tmp_path):
+    """Renders still queued when the pool shuts down fail the request, not the callback"""
+    render = FakeRender(tmp_path)
+    render.release.clear()
+    renderer = _renderer(render, workers=1, failure_ttl_sec=60)
+    _, first = _level(tmp_path)
+    _, queued = _level(tmp_path)
+
+    async def main():
+        running = asyncio.create_task(renderer.materialize(first))
+        waiting = asyncio.create_task(renderer.materialize(queued))
+        await asyncio.sleep(0.05)
+        renderer.shutdown()  # cancels the queued render
+        render.release.set()
+        return await asyncio.gather(running, waiting, return_exceptions=True)
+
+    done, cancelled = asyncio.run(main())
+
+    assert done is None and first.is_file()
+    assert isinstance(cancelled, HTTPException) and cancelled.status_code == 503
+    assert renderer.pending == 0 and renderer._failed == {}
+
+
+def test_render_spec_round_trip(tmp_path):
+    midi = tmp_path / "job_L1.mid"
+
+    assert read_render_spec(midi) == {}
+    assert write_render_spec(midi, with_audio=True).name == "job_L1.render.json"
+    assert read_render_spec(midi) == {"with_audio": True}
+    write_render_spec(midi, with_audio=True, encoder_profiles={"video": "fast"})
+    assert read_render_spec(midi)["encoder_profiles"] == {"video": "fast"}
+
+
+def test_media_request_renders_level_from_midi():
+    """GET on a job's unrendered video URL renders it through the /media mount"""
+    import shutil
+
+    from fastapi.testclient import TestClient
+
+    from app import app
+    from media_layout import job_output_dir, media_url
+
+    if shutil.which("ffmpeg") is None:
+        pytest.skip("ffmpeg not installed")
+    job_id = _job_id()
+    output_dir = job_output_dir(job_id)
+    midi = pretty_midi.PrettyMIDI()
+    piano = pretty_midi.Instrument(program=0)
+    piano.notes.append(pretty_midi.Note(100, 60, 0.0, 1.0))
+    midi.instruments.append(piano)
+    midi.write(str(output_dir / f"{job_id}_L1.mid"))
+    client = TestClient(app)
+
+    try:
+        url = media_url(output_dir / f"{job_id}_L1_full.mp4")
+        response = client.get(url[url.index("/media/"):])
+        assert response.status_code == 200
+        assert response.content[4:8] == b"ftyp"
+        assert client.get(f"/media/out/{job_id}_L1_full_preview.mp4").status_code == 200
+        assert client.get(f"/media/out/{job_id}_L2_full.mp4").status_code == 404
+        spec = read_render_spec(output_dir / f"{job_id}_L1.mid")
+        assert set(spec["encoder_profiles"]) == {"video", "preview"}
+    finally:
+        client.delete(f"/cleanup/{job_id}")
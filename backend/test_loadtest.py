@@ -0,0 +1,69 @@
+"""
+Tests for loadtest.py - load generation against the in-process app
+"""
+import json
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from loadtest import LoadConfig, JobSample, build_report, parse_level_mix, percentiles
+
+
+def test_parse_level_mix():
+    assert parse_level_mix(["1:0.6", "1,2,3,4:0.4"]) == {"1": 0.6, "1,2,3,4": 0.4}
+    assert parse_level_mix(["2"]) == {"2": 1.0}
+    with pytest.raises(ValueError):
+        parse_level_mix(["5:1"])
+
+
+def test_percentiles_nearest_rank():
+    stats = percentiles([float(v) for v in range(1, 101)])
+    assert (stats["p50"], stats["p95"], stats["p99"], stats["max"]) == (50.0, 95.0, 99.0, 100.0)
+    assert percentiles([])["p50"] is None
+
+
+def test_report_counts_rejections_and_latency():
+    samples = [
+        JobSample(0, "1", status="complete", latency_sec=2.0),
+        JobSample(1, "1", status="rejected", rejected_at="create", http_status=413),
+        JobSample(2, "1", status="error", latency_sec=1.0),
+    ]
+    report = build_report(LoadConfig(level_mix={"1": 1.0}), samples, [0.001], 60.0, 10.0)
+
+    assert report["jobs"]["by_status"] == {"complete": 1, "rejected": 1, "error": 1}
+    assert report["jobs"]["rejected"] == {"create:413": 1}
+    assert report["throughput_jobs_per_min"] == 1.0
+    assert report["latency_sec"]["p50"] == report["latency_sec"]["max"] == 2.0
+    assert report["error_latency_sec"]["max"] == 1.0
+    assert report["loop_lag_ms"]["p50"] == 1.0
+
+
+def test_single_job_end_to_end(tmp_path):
+    out = tmp_path / "load.json"
+    result = subprocess.run(
+        [
+            sys.executable, "loadtest.py",
+            "--jobs", "1", "--level-mix", "1:1", "--clip-sec", "3",
+            "--poll-interval", "0.2", "--acr-delay", "0", "--out", str(out),
+        ],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        timeout=300,
+    )
+    assert result.returncode == 0, result.stderr.decode(errors="replace")[-2000:]
+    report = json.loads(out.read_text())
+    assert report["jobs"]["by_status"] == {"complete": 1}
+    assert report["jobs"]["identify_calls"] == 1
+    assert report["latency_sec"]["p50"] > 0
+    assert report["loop_lag_ms"]["max"] is not None
+    # The run used its own media directory: no job row left in the app's real store
+    from config import settings
+
+    job_id = report["samples"][0]["job_id"]
+    if settings.JOBS_DB_PATH.exists():
+        with sqlite3.connect(settings.JOBS_DB_PATH) as conn:
+            rows = conn.execute("SELECT 1 FROM jobs WHERE job_id = ?", (job_id,)).fetchall()
+        assert rows == []
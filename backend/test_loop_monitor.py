@@ -0,0 +1,75 @@
+"""
+Tests for loop_monitor.py - event-loop lag sampling and blocking-handler tagging
+"""
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from loop_monitor import LoopBlockMiddleware, LoopMonitor
+from metrics import BLOCKING_REQUESTS, LOOP_BLOCKS, LOOP_LAG_SECONDS
+
+
+def blocking_step_for_test(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+def test_stall_is_charged_to_the_blocking_task():
+    monitor = LoopMonitor(interval_sec=0.02, threshold_sec=0.1)
+
+    async def scenario():
+        sampler = asyncio.create_task(monitor.run())
+        await asyncio.sleep(0.1)
+
+        async def blocker():
+            blocking_step_for_test(0.4)
+
+        task = asyncio.create_task(blocker(), name="blocker")
+        await task
+        await asyncio.sleep(0.1)
+        sampler.cancel()
+        return monitor.blocked_seconds(task)
+
+    blocks_before = LOOP_BLOCKS.value()
+    lag_count_before = LOOP_LAG_SECONDS.count()
+    blocked = asyncio.run(scenario())
+
+    assert 0.1 < blocked < 0.6
+    assert LOOP_BLOCKS.value() == blocks_before + 1
+    assert LOOP_LAG_SECONDS.count() > lag_count_before
+    block = monitor.recent_blocks[-1]
+    assert block.task == "blocker"
+    assert "blocking_step_for_test" in block.stack
+
+
+def test_middleware_tags_blocking_requests():
+    monitor = LoopMonitor(interval_sec=0.02, threshold_sec=0.1)
+    app = FastAPI()
+    app.add_middleware(LoopBlockMiddleware, monitor=monitor)
+
+    @app.get("/slow")
+    async def slow_handler_for_test():
+        blocking_step_for_test(0.3)
+        return {"ok": True}
+
+    @app.get("/fast")
+    async def fast_handler_for_test():
+        await asyncio.sleep(0.05)
+        return {"ok": True}
+
+    async def scenario():
+        sampler = asyncio.create_task(monitor.run())
+        await asyncio.sleep(0.05)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            slow = await client.get("/slow")
+            fast = await client.get("/fast")
+        sampler.cancel()
+        return slow, fast
+
+    slow, fast = asyncio.run(scenario())
+
+    assert int(slow.headers["x-event-loop-blocked-ms"]) >= 100
+    assert "x-event-loop-blocked-ms" not in fast.headers
+    assert BLOCKING_REQUESTS.value(method="GET", route="slow_handler_for_test") == 1
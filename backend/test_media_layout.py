@@ -0,0 +1,72 @@
+"""
+Tests for media_layout.py - sharded per-job media directories
+"""
+import pytest
+
+import media_layout
+from config import settings
+
+JOB_ID = "1700000000_0123456789abcdef0123456789abcdef"
+
+
+@pytest.fixture
+def media_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "MEDIA_DIR", tmp_path)
+    monkeypatch.setattr(settings, "INPUT_DIR", tmp_path / "in")
+    monkeypatch.setattr(settings, "OUTPUT_DIR", tmp_path / "out")
+    monkeypatch.setattr(settings, "BASE_URL", "http://host/")
+    return tmp_path
+
+
+def test_job_dirs_are_sharded(media_root):
+    """Job directories live under two hex shard levels"""
+    first, second = media_layout.shard_parts(JOB_ID)
+    out_dir = media_layout.job_output_dir(JOB_ID)
+
+    assert out_dir == media_root / "out" / first / second / JOB_ID
+    assert out_dir.is_dir()
+    assert len(first) == 2 and len(second) == 2
+    assert media_layout.media_url(out_dir / "x.mp4") == (
+        f"http://host/media/out/{first}/{second}/{JOB_ID}/x.mp4"
+    )
+
+
+def test_resolve_output_file_legacy_and_sharded(media_root):
+    """Flat URLs resolve to the sharded file, then to the legacy flat file"""
+    sharded = media_layout.job_output_dir(JOB_ID) / f"{JOB_ID}_L1_full.mp4"
+    sharded.write_bytes(b"v")
+    (media_root / "out" / f"{JOB_ID}_L2_full.mp4").write_bytes(b"v")
+
+    assert media_layout.resolve_output_file(f"{JOB_ID}_L1_full.mp4") == sharded
+    assert media_layout.resolve_output_file(f"{JOB_ID}_L2_full.mp4") == (
+        media_root / "out" / f"{JOB_ID}_L2_full.mp4"
+    )
+    assert media_layout.resolve_output_file(f"{JOB_ID}_L3_full.mp4") is None
+    assert media_layout.resolve_output_file("../etc/passwd") is None
+
+
+def test_migrate_flat_layout(media_root):
+    """Migration moves flat files and separated stems into job directories"""
+    (media_root / "out").mkdir()
+    (media_root / "in" / "separated").mkdir(parents=True)
+    (media_root / "out" / f"{JOB_ID}_L1.mid").write_bytes(b"m")
+    (media_root / "in" / f"{JOB_ID}_input.m4a").write_bytes(b"a")
+    (media_root / "in" / "separated" / f"{JOB_ID}_input_melody.wav").write_bytes(b"s")
+    (media_root / "out" / "unrelated.txt").write_bytes(b"u")
+
+    planned = media_layout.migrate_flat_layout(dry_run=True)
+    assert len(planned) == 3
+    assert (media_root / "out" / f"{JOB_ID}_L1.mid").exists()
+
+    media_layout.migrate_flat_layout()
+
+    out_dir = media_layout.job_output_dir(JOB_ID, create=False)
+    in_dir = media_layout.job_input_dir(JOB_ID, create=False)
+    assert (out_dir / f"{JOB_ID}_L1.mid").exists()
+    assert (in_dir / f"{JOB_ID}_input.m4a").exists()
+    assert (in_dir / "separated" / f"{JOB_ID}_input_melody.wav").exists()
+    assert (media_root / "out" / "unrelated.txt").exists()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
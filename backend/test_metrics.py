@@ -0,0 +1,49 @@
+"""
+Tests for the Prometheus metrics registry
+"""
+import pytest
+
+from metrics import Counter, Gauge, Histogram, Registry, STAGE_SECONDS, stage_timer
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.register(Histogram("t_seconds", "test", ["stage"], buckets=(0.1, 1.0)))
+    histogram.observe(0.05, stage="a")
+    histogram.observe(0.5, stage="a")
+    histogram.observe(5.0, stage="a")
+
+    text = registry.render()
+    assert "# TYPE t_seconds histogram" in text
+    assert 't_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 't_seconds_bucket{stage="a",le="1.0"} 2' in text
+    assert 't_seconds_bucket{stage="a",le="+Inf"} 3' in text
+    assert 't_seconds_sum{stage="a"} 5.55' in text
+    assert 't_seconds_count{stage="a"} 3' in text
+
+
+def test_counter_and_gauge_labels():
+    registry = Registry()
+    counter = registry.register(Counter("c_total", "test", ["cache", "result"]))
+    counter.inc(cache="acr", result="hit")
+    counter.inc(2, cache="acr", result="miss")
+    gauge = registry.register(Gauge("g", "test"))
+    gauge.set_function(lambda: 0.25)
+
+    text = registry.render()
+    assert 'c_total{cache="acr",result="hit"} 1.0' in text
+    assert 'c_total{cache="acr",result="miss"} 2.0' in text
+    assert "g 0.25" in text
+
+    with pytest.raises(ValueError):
+        counter.inc(cache="acr")
+    with pytest.raises(ValueError):
+        registry.register(Gauge("g", "duplicate"))
+
+
+def test_stage_timer_records_failures():
+    before = STAGE_SECONDS.count(stage="unit_test", level="2")
+    with pytest.raises(RuntimeError):
+        with stage_timer("unit_test", 2):
+            raise RuntimeError("boom")
+    assert STAGE_SECONDS.count(stage="unit_test", level="2") == before + 1
@@ -0,0 +1,132 @@
+"""
+Tests for persistence.py - write-behind queue and local sinks
+"""
+import asyncio
+
+from persistence import MemorySink, PersistenceQueue, SQLiteSink
+
+
+class FlakySink(MemorySink):
+    """Fails the first `failures` commits"""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def commit(self, writes):
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError("unavailable")
+        super().commit(writes)
+
+
+def test_batches_and_merges_same_document():
+    """Writes are committed in batches; repeated writes to one document are merged"""
+    sink = MemorySink()
+    queue = PersistenceQueue(sink, batch_size=10)
+    for i in range(25):
+        queue.enqueue("jobs", "u1", f"job{i}", {"n": i})
+    queue.enqueue("jobs", "u1", "job24", {"status": "done"})
+
+    asyncio.run(queue.flush())
+
+    assert sink.commits == 3
+    assert len(sink.documents) == 25
+    assert sink.documents["users/u1/jobs/job24"] == {"n": 24, "userId": "u1", "status": "done"}
+    assert len(queue) == 0
+
+
+def test_merge_is_deep_and_leaves_payloads_untouched():
+    """Nested maps merge like Firestore set(merge=True); enqueued payloads are not mutated"""
+    sink = MemorySink()
+    queue = PersistenceQueue(sink, batch_size=10)
+    first = {"levels": {"L1": {"status": "queued", "url": ""}}, "title": "a"}
+    second = {"levels": {"L1": {"status": "success"}, "L2": {"status": "queued"}}}
+    queue.enqueue("jobs", "u1", "job1", first)
+    queue.enqueue("jobs", "u1", "job1", second)
+
+    asyncio.run(queue.flush())
+
+    assert sink.documents["users/u1/jobs/job1"] == {
+        "levels": {"L1": {"status": "success", "url": ""}, "L2": {"status": "queued"}},
+        "title": "a",
+        "userId": "u1",
+    }
+    assert first == {"levels": {"L1": {"status": "queued", "url": ""}}, "title": "a"}
+    assert second == {"levels": {"L1": {"status": "success"}, "L2": {"status": "queued"}}}
+
+
+def test_retries_with_backoff_then_drops():
+    """Failed commits are retried; a batch is dropped after max_retries"""
+    sink = FlakySink(failures=2)
+    queue = PersistenceQueue(sink, max_retries=3, backoff_base_sec=0.001)
+    queue.enqueue("practice_sessions", "u1", "s1", {"score": 10})
+    asyncio.run(queue.flush())
+    assert sink.documents["users/u1/practice_sessions/s1"]["score"] == 10
+    assert queue.committed == 1
+
+    sink = FlakySink(failures=10)
+    queue = PersistenceQueue(sink, max_retries=1, backoff_base_sec=0.001)
+    queue.enqueue("jobs", "u1", "j1", {})
+    asyncio.run(queue.flush())
+    assert sink.documents == {}
+    assert queue.dropped == 1
+
+
+def test_background_task_and_stop_flush(tmp_path):
+    """Handlers only enqueue; the background task commits and stop() flushes the rest"""
+    sink = SQLiteSink(tmp_path / "docs.sqlite3")
+
+    async def scenario():
+        queue = PersistenceQueue(sink, batch_size=2, flush_interval_sec=60)
+        queue.start()
+        queue.enqueue("jobs", "u1", "a", {"x": 1})
+        queue.enqueue("jobs", "u1", "b", {"x": 2})  # full batch wakes the task
+        await asyncio.sleep(0.2)
+        assert sink.get("users/u1/jobs/a") == {"x": 1, "userId": "u1"}
+        queue.enqueue("jobs", "u1", "c", {"x": 3})
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert sink.get("users/u1/jobs/c")["x"] == 3
+
+
+def test_stop_finishes_the_batch_being_retried():
+    """A batch the background task took and is retrying is committed, not lost, on stop()"""
+    sink = FlakySink(failures=1)
+
+    async def scenario():
+        queue = PersistenceQueue(sink, batch_size=1, flush_interval_sec=60, backoff_base_sec=0.2)
+        queue.start()
+        queue.enqueue("jobs", "u1", "a", {"x": 1})  # full batch wakes the task
+        await asyncio.sleep(0.05)  # first commit failed: the task is in its backoff
+        assert len(queue) == 0
+        await queue.stop()
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert sink.documents["users/u1/jobs/a"]["x"] == 1
+    assert (queue.committed, queue.dropped) == (1, 0)
+
+
+def test_cancelled_commit_is_requeued():
+    sink = FlakySink(failures=1)
+
+    async def scenario():
+        queue = PersistenceQueue(sink, backoff_base_sec=60)
+        queue.enqueue("jobs", "u1", "a", {"x": 1})
+        flush = asyncio.create_task(queue.flush())
+        await asyncio.sleep(0.05)
+        flush.cancel()
+        await asyncio.gather(flush, return_exceptions=True)
+        assert len(queue) == 1
+        await queue.flush()
+
+    asyncio.run(scenario())
+    assert sink.documents["users/u1/jobs/a"]["x"] == 1
+
+
+def test_full_queue_rejects():
+    queue = PersistenceQueue(MemorySink(), max_pending=1)
+    assert queue.enqueue("jobs", "u1", "a", {})
+    assert not queue.enqueue("jobs", "u1", "b", {})
@@ -0,0 +1,204 @@
+"""
+Tests for render.py - in-place frame buffers, yuv420p frames, render/encode queue,
+encoder profiles, HLS output
+"""
+import shutil
+
+import numpy as np
+import pretty_midi
+import pytest
+
+from config import settings
+from metrics import RENDER_QUEUE_WAIT_SECONDS, VIDEO_ENCODES
+from render import (
+    COLOR_BACKGROUND,
+    COLOR_WHITE_KEY,
+    PALETTE,
+    FrameBuffers,
+    create_video_from_frames,
+    encoder_args,
+    generate_video_frames,
+    hls_files,
+    render_keyboard_frame,
+    render_level_video,
+    rgb_to_yuv,
+    select_encoder_profile,
+    video_timeline,
+)
+
+SCENE = dict(active_notes={60, 61}, current_time=1.0, upcoming_notes=[(64, 1.5, 2.0)])
+
+
+def test_frame_drawn_in_place_matches_fresh_frame():
+    width, height = 320, 240
+    fresh = np.array(render_keyboard_frame(width=width, height=height, **SCENE))
+
+    buffers = FrameBuffers(width, height, pixel_format="rgb0")
+    image, array = buffers.next()
+    array[:] = 7  # stale content from an earlier frame
+    assert render_keyboard_frame(width=width, height=height, into=image, **SCENE) is image
+
+    assert np.array_equal(array[:, :, :3], fresh)
+
+
+def test_yuv420p_frame_matches_rgb_frame():
+    assert rgb_to_yuv(COLOR_WHITE_KEY) == (235, 128, 128)
+    assert rgb_to_yuv((0, 0, 0)) == (16, 128, 128)
+
+    width, height = 320, 240
+    fresh = np.array(render_keyboard_frame(width=width, height=height, **SCENE))
+    expected_y = np.array(
+        [[rgb_to_yuv(tuple(pixel))[0] for pixel in row] for row in fresh], dtype=np.int16
+    )
+
+    buffers = FrameBuffers(width, height, pixel_format="yuv420p")
+    image, frame = buffers.next()
+    render_keyboard_frame(width=width, height=height, into=image, **SCENE)
+    buffers.finish(frame)
+
+    assert frame.shape == (height * 3 // 2, width)
+    # Identical but for anti-aliased label edges (palette frames draw 1-bit text)
+    solid = np.isin(fresh.reshape(-1, 3).view("V3"), np.array(PALETTE, dtype=np.uint8).view("V3"))
+    solid = solid.reshape(height, width)
+    assert solid.mean() > 0.95
+    assert np.mean(frame[:height][solid] != expected_y[solid]) < 0.001
+    _, u, v = rgb_to_yuv(COLOR_BACKGROUND)
+    chroma = frame[height:].reshape(2, height // 2, width // 2)
+    assert (chroma[0, 0, 0], chroma[1, 0, 0]) == (u, v)
+
+
+def test_frames_reuse_the_buffer_ring():
+    midi = pretty_midi.PrettyMIDI()
+    piano = pretty_midi.Instrument(program=0)
+    piano.notes.append(pretty_midi.Note(100, 60, 0.0, 0.5))
+    midi.instruments.append(piano)
+
+    frames, _, _ = generate_video_frames(midi, 1, "", pixel_format="yuv420p")
+    ring = settings.RENDER_QUEUE_FRAMES + 2  # queued + being written + being drawn
+    drawn = [next(frames) for _ in range(ring + 1)]
+
+    assert drawn[0].flags["C_CONTIGUOUS"] and drawn[0].dtype == np.uint8
+    assert drawn[0].shape == (settings.VIDEO_HEIGHT * 3 // 2, settings.VIDEO_WIDTH)
+    assert not any(np.shares_memory(drawn[0], frame) for frame in drawn[1:ring])
+    assert np.shares_memory(drawn[0], drawn[ring])
+
+
+def _solid_frames(count, width=64, height=48):
+    for index in range(count):
+        yield np.full((height, width, 3), index * 10, dtype=np.uint8)
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+@pytest.mark.parametrize("queue_frames", [0, 2])
+def test_encoder_queue_writes_every_frame(tmp_path, queue_frames):
+    waited = RENDER_QUEUE_WAIT_SECONDS.value(side="encoder")
+
+    video = create_video_from_frames(
+        _solid_frames(20), tmp_path / "out.mp4", fps=10, width=64, height=48,
+        max_duration=1.5, queue_frames=queue_frames,
+    )
+
+    assert video.stat().st_size > 0
+    assert RENDER_QUEUE_WAIT_SECONDS.value(side="encoder") > waited
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_encoder_failure_stops_the_renderer(tmp_path):
+    drawn = []
+
+    def frames():
+        for frame in _solid_frames(500, 320, 240):
+            drawn.append(frame)
+            yield frame
+
+    with pytest.raises(RuntimeError, match="FFmpeg failed"):
+        create_video_from_frames(
+            frames(),
+            tmp_path / "missing" / "out.mp4",
+            fps=10,
+            width=320,
+            height=240,
+            queue_frames=2,
+        )
+    assert len(drawn) < 500
+
+
+def test_encoder_profile_args():
+    assert encoder_args("balanced") == ["-c:v", "libx264", "-preset", "veryfast"]
+    assert encoder_args("quality") == [
+        "-c:v", "libx264", "-preset", "medium", "-crf", "20", "-tune", "animation", "-g", "48",
+    ]
+    assert encoder_args("degraded")[-4:] == ["-threads", "1", "-x264-params", "rc-lookahead=0"]
+    with pytest.raises(ValueError, match="Unknown encoder profile"):
+        encoder_args("lossless")
+
+
+def test_encoder_profile_follows_queue_depth(monkeypatch):
+    monkeypatch.setattr(settings, "ENCODER_PROFILE", "quality")
+    monkeypatch.setattr(settings, "ENCODER_LOAD_PROFILES", ["fast", "degraded"])
+    monkeypatch.setattr(settings, "ENCODER_LOAD_STEP_JOBS", 2)
+
+    assert [select_encoder_profile(queued) for queued in (0, 1, 2, 3, 4, 40, 0)] == [
+        "quality", "quality", "fast", "fast", "degraded", "degraded", "quality",
+    ]
+    monkeypatch.setattr(settings, "ENCODER_ADAPTIVE", False)
+    assert select_encoder_profile(40) == "quality"
+
+
+def test_profile_frame_rate_sets_frame_count():
+    midi = pretty_midi.PrettyMIDI()
+    piano = pretty_midi.Instrument(program=0)
+    piano.notes.append(pretty_midi.Note(100, 60, 0.0, 1.0))
+    midi.instruments.append(piano)
+
+    _, frames, _ = video_timeline(midi, fps=15)
+
+    assert frames == int((1.0 + settings.VIDEO_PREROLL_SEC) * 15)
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_encode_with_profile(tmp_path):
+    encoded = VIDEO_ENCODES.value(output="full", profile="degraded")
+
+    video = create_video_from_frames(
+        _solid_frames(10), tmp_path / "out.mp4", fps=15, width=64, height=48, encoder="degraded"
+    )
+
+    assert video.stat().st_size > 0
+    assert VIDEO_ENCODES.value(output="full", profile="degraded") == encoded + 1
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_encode_writes_hls_alongside_mp4(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "HLS_SEGMENT_SEC", 0.5)
+
+    video = create_video_from_frames(
+        _solid_frames(20), tmp_path / "out.mp4", fps=20, width=64, height=48, hls=True
+    )
+
+    playlist, init, *segments = hls_files(video)
+    assert video.stat().st_size > 0
+    assert playlist.name == "out.m3u8" and init.name == "out_init.mp4"
+    assert len(segments) == 2
+    text = playlist.read_text()
+    assert text.count("#EXTINF") == 2 and "#EXT-X-ENDLIST" in text
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_stream_ready_before_render_finishes(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "VIDEO_HLS", True)
+    midi = pretty_midi.PrettyMIDI()
+    piano = pretty_midi.Instrument(program=0)
+    piano.notes.append(pretty_midi.Note(100, 60, 0.0, 3.0))
+    midi.instruments.append(piano)
+    preview = tmp_path / "job_L1_full_preview.mp4"
+    ready = []
+
+    render_level_video(
+        midi, 1, "Test", tmp_path, "job",
+        on_stream_ready=lambda playlist: ready.append((playlist, preview.exists())),
+    )
+
+    # Published while the full video was still encoding, before the preview step
+    assert ready == [(tmp_path / "job_L1_full.m3u8", False)]
+    assert "#EXT-X-ENDLIST" in ready[0][0].read_text()
@@ -0,0 +1,54 @@
+"""
+Tests for render_ffmpeg.py - filter-graph backend against the PIL renderer
+"""
+import shutil
+
+import numpy as np
+import pretty_midi
+import pytest
+
+from config import settings
+from render import generate_video_frames, render_level_video
+from render_ffmpeg import render_rgb_frames
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+
+
+def _midi():
+    midi = pretty_midi.PrettyMIDI()
+    piano = pretty_midi.Instrument(program=0)
+    for pitch, start, end in [
+        (60, 0.0, 0.4),
+        (61, 0.25, 0.5),
+        (60, 0.5, 0.6),  # same key again (press windows, sanitized overlap)
+        (48, 0.1, 2.8),  # long bar: reaches above the fall area once sustained
+        (72, 1.0, 1.2),
+        (30, 0.3, 0.9),  # outside the keyboard: bar only
+    ]:
+        piano.notes.append(pretty_midi.Note(100, pitch, start, end))
+    midi.instruments.append(piano)
+    return midi
+
+
+@pytest.mark.parametrize("size", [(854, 480), (320, 240)])
+def test_filter_graph_matches_pil_frames(monkeypatch, size):
+    monkeypatch.setattr(settings, "VIDEO_WIDTH", size[0])
+    monkeypatch.setattr(settings, "VIDEO_HEIGHT", size[1])
+    monkeypatch.setattr(settings, "RENDER_QUEUE_FRAMES", 0)
+    midi = _midi()
+
+    pil_frames, num_frames, _ = generate_video_frames(midi, 1, "", pixel_format="rgb0")
+    graph_frames = list(render_rgb_frames(midi))
+
+    assert len(graph_frames) == num_frames
+    for index, (pil, graph) in enumerate(zip(pil_frames, graph_frames)):
+        assert np.array_equal(pil[:, :, :3], graph), f"frame {index} differs"
+
+
+def test_render_level_video_with_ffmpeg_backend(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "RENDER_BACKEND", "ffmpeg")
+
+    full, preview, _ = render_level_video(_midi(), 1, "Test", tmp_path, "job")
+
+    assert full.stat().st_size > 0
+    assert preview.exists()
@@ -0,0 +1,63 @@
+"""
+Tests for render_profile.py - per-frame render timings
+"""
+import csv
+import json
+import shutil
+
+import pretty_midi
+import pytest
+
+from config import settings
+from render import create_video_from_frames, generate_video_frames
+from render_profile import STEPS, FrameProfiler, report_paths
+
+
+def test_frame_profiler_report(tmp_path):
+    profiler = FrameProfiler()
+    for index in range(3):
+        profiler.begin_frame(index, index / 24)
+        profiler.add("draw", 0.002 * (index + 1))
+        with profiler.step("note_lookup"):
+            pass
+    profiler.encoder_flush_sec = 0.01
+
+    json_path, csv_path = profiler.write_report(tmp_path / "job_L1_full.mp4", {"level": 1})
+
+    assert (json_path, csv_path) == report_paths(tmp_path / "job_L1_full.mp4")
+    report = json.loads(json_path.read_text())
+    assert report["level"] == 1
+    assert report["frames"] == 3
+    assert report["encoder_flush_ms"] == 10.0
+    assert report["steps"]["draw"]["total_ms"] == pytest.approx(12.0)
+    assert report["steps"]["draw"]["max_ms"] == pytest.approx(6.0)
+
+    rows = list(csv.DictReader(csv_path.open()))
+    assert len(rows) == 3
+    assert set(rows[0]) == {"frame", "time_sec"} | {f"{step}_ms" for step in STEPS}
+    assert float(rows[2]["draw_ms"]) == pytest.approx(6.0)
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_profiled_render_covers_every_frame(tmp_path):
+    midi = pretty_midi.PrettyMIDI()
+    piano = pretty_midi.Instrument(program=0)
+    piano.notes.append(pretty_midi.Note(100, 60, 0.0, 0.25))
+    midi.instruments.append(piano)
+
+    profiler = FrameProfiler()
+    frames, num_frames, duration = generate_video_frames(midi, 1, "", profiler=profiler)
+    video = create_video_from_frames(
+        frames,
+        tmp_path / "job_L1_full.mp4",
+        fps=settings.VIDEO_FPS,
+        width=settings.VIDEO_WIDTH,
+        height=settings.VIDEO_HEIGHT,
+        expected_frames=num_frames,
+        profiler=profiler,
+    )
+
+    assert video.exists()
+    assert len(profiler.rows) == num_frames
+    assert all(row["draw"] > 0 and row["pipe_write"] > 0 for row in profiler.rows)
+    assert profiler.encoder_flush_sec > 0
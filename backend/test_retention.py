@@ -0,0 +1,128 @@
+"""
+Tests for retention.py - artifact index and retention sweeper
+"""
+import time
+
+import pytest
+
+from retention import ArtifactIndex, RetentionService, KIND_INPUT, KIND_OUTPUT
+
+
+def _write(path, size):
+    path.write_bytes(b"x" * size)
+    return path
+
+
+def _age(index, job_id, seconds):
+    """Pretend a job's artifacts were created `seconds` ago"""
+    index._conn().execute(
+        "UPDATE artifacts SET created_at = ? WHERE job_id = ?",
+        (time.time() - seconds, job_id),
+    )
+
+
+def test_delete_job_uses_index(tmp_path):
+    """Deleting a job removes exactly its indexed files"""
+    index = ArtifactIndex(tmp_path / "media.sqlite3")
+    a = _write(tmp_path / "job1_input.m4a", 10)
+    b = _write(tmp_path / "job1_L1_full.mp4", 20)
+    other = _write(tmp_path / "job10_L1_full.mp4", 30)
+    index.record("job1", KIND_INPUT, [a])
+    index.record("job1", KIND_OUTPUT, [b, None, tmp_path / "missing.mp4"])
+    index.record("job10", KIND_OUTPUT, [other])
+
+    assert index.total_size() == 60
+
+    deleted = index.delete_job("job1")
+
+    assert sorted(deleted) == ["job1_L1_full.mp4", "job1_input.m4a"]
+    assert other.exists()
+    assert index.job_artifacts("job1") == []
+    assert index.total_size() == 30
+
+
+def test_delete_job_removes_job_directories(tmp_path):
+    """With per-job directories, deleting a job is a directory removal"""
+    job_dir = tmp_path / "out" / "ab" / "cd" / "job1"
+    (job_dir / "separated").mkdir(parents=True)
+    video = _write(job_dir / "job1_L1_full.mp4", 10)
+    _write(job_dir / "separated" / "stem.wav", 10)
+    index = ArtifactIndex(tmp_path / "media.sqlite3", job_dirs=lambda job_id: [job_dir])
+    index.record("job1", KIND_OUTPUT, [video])
+
+    deleted = index.delete_job("job1")
+
+    assert sorted(deleted) == ["job1_L1_full.mp4", "stem.wav"]
+    assert not job_dir.exists()
+    assert index.total_size() == 0
+
+
+def test_sweep_expires_by_age(tmp_path):
+    """Inputs expire after hours, whole jobs after days, protected jobs are kept"""
+    index = ArtifactIndex(tmp_path / "media.sqlite3")
+    for job_id in ("old", "older", "running"):
+        index.record(job_id, KIND_INPUT, [_write(tmp_path / f"{job_id}_in.wav", 5)])
+        index.record(job_id, KIND_OUTPUT, [_write(tmp_path / f"{job_id}_out.mp4", 5)])
+    _age(index, "old", 2 * 3600)
+    _age(index, "older", 3 * 86400)
+    _age(index, "running", 3 * 86400)
+
+    service = RetentionService(
+        index,
+        input_retention_hours=1,
+        output_retention_days=2,
+        disk_budget_mb=100,
+        protected_jobs=lambda: {"running"},
+    )
+    stats = service.sweep()
+
+    assert not (tmp_path / "old_in.wav").exists()
+    assert (tmp_path / "old_out.mp4").exists()
+    assert not (tmp_path / "older_out.mp4").exists()
+    assert (tmp_path / "running_in.wav").exists()
+    assert stats["jobs_expired"] == 1
+
+
+def test_sweep_enforces_disk_budget_oldest_first(tmp_path):
+    """Beyond the disk budget, the oldest jobs are evicted first"""
+    index = ArtifactIndex(tmp_path / "media.sqlite3")
+    size = 400 * 1024
+    for age, job_id in enumerate(("new", "mid", "old")):
+        index.record(job_id, KIND_OUTPUT, [_write(tmp_path / f"{job_id}.mp4", size)])
+        _age(index, job_id, 60 * (age + 1))
+
+    service = RetentionService(
+        index, input_retention_hours=24, output_retention_days=7, disk_budget_mb=1
+    )
+    stats = service.sweep()
+
+    assert stats["jobs_evicted_for_budget"] == 1
+    assert not (tmp_path / "old.mp4").exists()
+    assert (tmp_path / "mid.mp4").exists()
+    assert index.total_size() <= 1024 * 1024
+
+
+def test_untracked_bytes_count_against_budget(tmp_path):
+    """Databases and other unindexed files on the volume shrink the budget for jobs"""
+    index = ArtifactIndex(tmp_path / "media.sqlite3")
+    for age, job_id in enumerate(("new", "old")):
+        index.record(job_id, KIND_OUTPUT, [_write(tmp_path / f"{job_id}.mp4", 400 * 1024)])
+        _age(index, job_id, 60 * (age + 1))
+
+    service = RetentionService(
+        index,
+        input_retention_hours=24,
+        output_retention_days=7,
+        disk_budget_mb=1,
+        protected_jobs=lambda: {"old"},
+        untracked_bytes=lambda: 400 * 1024,
+    )
+    stats = service.sweep()
+
+    assert stats["jobs_evicted_for_budget"] == 1
+    assert (tmp_path / "old.mp4").exists()  # protected: the next oldest goes instead
+    assert not (tmp_path / "new.mp4").exists()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
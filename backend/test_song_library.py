@@ -0,0 +1,121 @@
+"""
+Tests for song_library.py - known-song library keyed by acrid
+"""
+import os
+
+import song_library
+from song_library import SOURCE_CURATED, SongLibrary
+
+SONG = {"title": "Song", "artist": "Artist", "acrid": "abc123", "score": 95}
+
+
+def _file(path, content=b"x"):
+    path.write_bytes(content)
+    return path
+
+
+def test_match_requires_confident_score(tmp_path):
+    library = SongLibrary(tmp_path, min_score=80)
+    assert library.match(SONG) == "abc123"
+    assert library.match(dict(SONG, score=50)) is None
+    assert library.match(dict(SONG, acrid="../etc")) is None
+    assert library.match(None) is None
+
+
+def _base(library, tmp_path, name, quality, **kwargs):
+    midi = _file(tmp_path / f"{name}.mid", name.encode())
+    return library.offer_base("abc123", SONG, midi, {"melody_quality": quality}, **kwargs)
+
+
+def _stored_bytes(library):
+    return library.stored_base("abc123")[1].read_bytes()
+
+
+def test_base_midi_kept_only_if_better(tmp_path):
+    library = SongLibrary(tmp_path / "lib", min_score=80)
+    first = _base(library, tmp_path, "a", 0.5)
+    assert first
+    assert _stored_bytes(library) == b"a"
+
+    assert _base(library, tmp_path, "b", 0.4) is None
+    assert _stored_bytes(library) == b"a"
+
+    better = _base(library, tmp_path, "c", 0.9)
+    assert better and better != first
+    entry, path = library.stored_base("abc123")
+    assert entry["revision"] == better and path.read_bytes() == b"c"
+
+    assert _base(library, tmp_path, "d", None, source=SOURCE_CURATED)
+    assert _base(library, tmp_path, "e", 1.0) is None
+    assert _stored_bytes(library) == b"d"
+
+
+def test_level_renders_follow_base_revision(tmp_path):
+    library = SongLibrary(tmp_path / "lib", min_score=80)
+    revision = _base(library, tmp_path, "a", 0.5)
+    files = [_file(tmp_path / name) for name in ("L1.mid", "full.mp4", "preview.mp4")]
+
+    assert not library.offer_level("abc123", "stale", 1, False, *files)
+    assert library.offer_level("abc123", revision, 1, False, *files)
+
+    stored = library.level_files("abc123", revision, 1, False)
+    assert set(stored) == {"midi", "full_video", "preview_video"}
+    assert library.level_files("abc123", revision, 1, True) is None  # with-audio not stored
+
+    # A better base MIDI drops the renders made from the old one...
+    new_revision = _base(library, tmp_path, "b", 0.9)
+    assert library.level_files("abc123", new_revision, 1, False) is None
+    assert library.level_files("abc123", revision, 1, False) is None
+    # ...and a render of the old revision finishing late is not attached to it
+    assert not library.offer_level("abc123", revision, 2, False, *files)
+    assert library.lookup("abc123")["revision"] == new_revision
+
+
+def test_replaced_revision_kept_for_grace_period(tmp_path, monkeypatch):
+    """Jobs still linking from a replaced base MIDI find its files until the grace period ends"""
+    library = SongLibrary(tmp_path / "lib", min_score=80)
+    _base(library, tmp_path, "a", 0.5)
+    _, old_path = library.stored_base("abc123")
+
+    _base(library, tmp_path, "b", 0.9)
+    assert old_path.read_bytes() == b"a"
+
+    monkeypatch.setattr(song_library, "RETIRED_REVISION_GRACE_SEC", -1)
+    _base(library, tmp_path, "c", 1.0)
+    assert not old_path.exists()
+    assert _stored_bytes(library) == b"c"
+
+
+def test_budget_evicts_least_recently_used_songs(tmp_path):
+    library = SongLibrary(tmp_path / "lib", min_score=80, max_mb=4.5 / 1024)  # three songs
+    midi = _file(tmp_path / "song.mid", b"x" * 1000)
+    for acrid, source in (("curated", SOURCE_CURATED), ("old", "job"), ("used", "job")):
+        library.offer_base(acrid, SONG, midi, {"melody_quality": 0.5}, source=source)
+    for acrid, used_at in (("curated", 1), ("old", 2), ("used", 3)):
+        os.utime(tmp_path / "lib" / acrid / "entry.json", (used_at, used_at))
+    assert library.stored_base("used")  # a hit: now the most recently used
+
+    library.offer_base("new", SONG, midi, {"melody_quality": 0.5})
+
+    assert library.lookup("old") is None
+    assert all(library.stored_base(acrid) for acrid in ("curated", "used", "new"))
+    assert library.size_bytes() <= library.max_bytes
+
+
+def test_update_lock_without_fcntl(tmp_path, monkeypatch):
+    """Windows has no fcntl: the library locks with msvcrt instead"""
+    calls = []
+
+    class FakeMsvcrt:
+        LK_LOCK, LK_UNLCK = 1, 0
+
+        @staticmethod
+        def locking(fd, mode, nbytes):
+            calls.append(mode)
+
+    monkeypatch.setattr(song_library, "fcntl", None)
+    monkeypatch.setattr(song_library, "msvcrt", FakeMsvcrt, raising=False)
+    library = SongLibrary(tmp_path / "lib", min_score=80)
+
+    assert _base(library, tmp_path, "a", 0.5)
+    assert calls == [FakeMsvcrt.LK_LOCK, FakeMsvcrt.LK_UNLCK]
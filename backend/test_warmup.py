@@ -0,0 +1,23 @@
+"""
+Tests for warmup.py - synthetic clip through the pipeline before the first job
+"""
+from warmup import BAKED_MARKER, WARMUP_STEPS, baked_cache_dir, run_warmup
+
+
+def test_warmup_runs_every_stage(tmp_path):
+    report = run_warmup(work_dir=tmp_path, frames=2)
+
+    assert report.error is None
+    assert set(report.steps_sec) == set(WARMUP_STEPS)
+    assert report.total_sec >= sum(report.steps_sec.values()) - 1e-3
+    assert list(tmp_path.iterdir()) == []  # scratch files removed
+
+
+def test_baked_cache_needs_the_build_marker(tmp_path, monkeypatch):
+    monkeypatch.delenv("NUMBA_CACHE_DIR", raising=False)
+    assert baked_cache_dir() is None
+
+    monkeypatch.setenv("NUMBA_CACHE_DIR", str(tmp_path))
+    assert baked_cache_dir() is None  # a cache filled at runtime is not the image's
+    (tmp_path / BAKED_MARKER).write_text("{}")
+    assert baked_cache_dir() == tmp_path
@@ -0,0 +1,128 @@
+"""
+Pipeline warmup.
+The first job after a cold start pays for librosa's lazy imports (numba,
+sklearn) and numba compiling or loading the HPSS/pyin kernels, ~2-3s on top
+of the module imports. run_warmup() pushes a short synthetic clip through
+decode, separation, pitch tracking, arrangement and a few rendered frames so
+that cost is paid before the first real job.
+
+The Docker build runs it, so numba's on-disk cache (NUMBA_CACHE_DIR) ships
+with the image, marked as warm by BAKED_MARKER:
+
+    python warmup.py
+
+app.py runs it after loading the pipeline modules (WARMUP_ON_STARTUP) and only
+reports /ready once it is done, unless the image ships that warm cache: on a
+single shared CPU, a startup warmup would compete with the request that woke
+the machine.
+"""
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional
+
+from loguru import logger
+
+WARMUP_CLIP_SEC = 3.0
+WARMUP_FRAMES = 12
+WARMUP_STEPS = ("decode", "separation", "transcription", "arrangement", "render")
+# Written into NUMBA_CACHE_DIR by a successful `python warmup.py`
+BAKED_MARKER = "shazapiano-warmup.json"
+
+
+@dataclass
+class WarmupReport:
+    steps_sec: Dict[str, float] = field(default_factory=dict)
+    total_sec: float = 0.0
+    error: Optional[str] = None
+
+
+def baked_cache_dir() -> Optional[Path]:
+    """NUMBA_CACHE_DIR if `python warmup.py` warmed it (the image build), else None."""
+    cache_dir = os.environ.get("NUMBA_CACHE_DIR")
+    if cache_dir and (Path(cache_dir) / BAKED_MARKER).is_file():
+        return Path(cache_dir)
+    return None
+
+
+def run_warmup(work_dir: Optional[Path] = None, frames: int = WARMUP_FRAMES) -> WarmupReport:
+    """Run the pipeline once on a synthetic clip; errors are reported, not raised."""
+    import soundfile as sf
+
+    from arranger import arrange_level
+    from config import get_level_config, settings
+    from inference import convert_to_wav, process_audio_to_midi
+    from render import generate_video_frames
+    from separation import separate_melody
+    from synth import SAMPLE_RATE, synth_clip
+
+    report = WarmupReport()
+    started = time.perf_counter()
+
+    def timed(step: str, fn):
+        step_started = time.perf_counter()
+        result = fn()
+        report.steps_sec[step] = round(time.perf_counter() - step_started, 4)
+        return result
+
+    with tempfile.TemporaryDirectory(prefix="shazapiano-warmup-", dir=work_dir) as tmp:
+        clip = Path(tmp) / "warmup.wav"
+        sf.write(str(clip), synth_clip("piano", WARMUP_CLIP_SEC), SAMPLE_RATE, subtype="PCM_16")
+        try:
+            wav = timed("decode", lambda: convert_to_wav(clip, Path(tmp) / "warmup_decoded.wav"))
+            timed("separation", lambda: separate_melody(wav))
+            midi, metadata = timed("transcription", lambda: process_audio_to_midi(wav))
+            arranged = timed(
+                "arrangement",
+                lambda: [
+                    arrange_level(midi, level, metadata.get("key", "C"), metadata.get("tempo", 120))
+                    for level in (1, 2, 3, 4)
+                ],
+            )
+
+            def render_frames() -> None:
+                if settings.RENDER_BACKEND == "ffmpeg":
+                    # The filter graph's key sprites (cached per layout)
+                    from render import KeyboardLayout
+                    from render_ffmpeg import keyboard_images
+
+                    width, height = settings.VIDEO_WIDTH, settings.VIDEO_HEIGHT
+                    keyboard_images(KeyboardLayout.for_frame(width, height), width, height)
+                    return
+                level = 4
+                iterator, _, _ = generate_video_frames(
+                    arranged[level - 1], level, get_level_config(level)["name"]
+                )
+                for _, _ in zip(range(frames), iterator):
+                    pass
+
+            timed("render", render_frames)
+        except Exception as e:
+            report.error = f"{type(e).__name__}: {e}"
+    report.total_sec = round(time.perf_counter() - started, 4)
+    return report
+
+
+def main() -> int:
+    report = run_warmup()
+    for step in WARMUP_STEPS:
+        seconds = report.steps_sec.get(step)
+        print(f"{step:<16} {'-' if seconds is None else f'{seconds:8.3f}s'}")
+    print(f"{'total':<16} {report.total_sec:8.3f}s")
+    if report.error:
+        logger.error(f"Warmup failed: {report.error}")
+        return 1
+    cache_dir = os.environ.get("NUMBA_CACHE_DIR")
+    if cache_dir:
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        (Path(cache_dir) / BAKED_MARKER).write_text(json.dumps(report.steps_sec))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())